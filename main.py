@@ -1,21 +1,30 @@
 from modules.csv_loader import load_product_csv
 from modules.camera_selector import get_used_cameras
 from modules.image_watcher import ImageWatcher
-from modules.roi_manager import prepare_roi_data
-from modules.model_manager import get_model
-from modules.detector import detect_object
-from modules.comparator import compare_detection, compare_angle
-from modules.result_manager import aggregate_results
+from modules.model_manager import preload_models, configure_cache, configure_backend, set_active_models, set_inference_pool
+from modules.model_manager import get_cache_stats
+from modules.inference_pool import InferencePool
+from modules.batch_detector import run_batch_detection
+from modules.batch_detector import build_inference_plan, print_inference_plan
+from modules.roi_scheduler import ROIScheduler
+from modules.inspection import judge_detections, detect_fail_fast, map_cameras
+from modules.batch_assembler import BatchAssembler
 from modules.result_visualizer import visualize_detection_result
-from modules.camera_config_loader import load_camera_config, get_camera_folder, print_camera_config_summary
+from modules.camera_config_loader import load_camera_config, get_camera_folder, get_camera_extensions
+from modules.camera_config_loader import print_camera_config_summary
 from modules.result_gui import ResultGUI
-from modules.com_output import COMOutput
+from modules.com_output import COMOutput, OrderedVerdictSender
 from modules.com_input import COMProductReader
 from modules.config_loader import load_config
+from modules.pipeline import Pipeline
+from modules import perf_stats
+from modules.metrics_server import MetricsServer, RateMeter, histogram_samples
 import os
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import cv2
 
 # ============================================================================
 # Load Configuration
@@ -45,11 +54,75 @@ COM_RETRY = cfg['com_output']['retry_count']
 CAMERA_CONFIG_CSV = cfg['camera']['config_csv']
 CAMERA_CREATE_FOLDERS = cfg['camera']['create_folders']
 CAMERA_POLL_INTERVAL = cfg['camera']['poll_interval']
+CAMERA_OVERLOAD_POLICY = cfg['camera'].get('overload_policy', 'process_all')
+CAMERA_MAX_PENDING = cfg['camera'].get('max_pending', 10)
+CAMERA_WATCHER_BACKEND = cfg['camera'].get('watcher_backend', 'auto')
+CAMERA_EVENT_TIMEOUT = cfg['camera'].get('event_timeout', 0.2)
+CAMERA_HANDOFF = cfg['camera'].get('handoff', 'copy')
+CAMERA_CHECKPOINT_DIR = cfg['camera'].get('checkpoint_dir', '')
+CAMERA_CHECKPOINT_INTERVAL = cfg['camera'].get('checkpoint_interval', 1.0)
+CAMERA_SETTLE_TIME = cfg['camera'].get('settle_ms', 50) / 1000.0
+CAMERA_READY_TIMEOUT = cfg['camera'].get('ready_timeout', 3.0)
+CAMERA_CHECK_TRAILER = cfg['camera'].get('check_trailer', True)
+
+# Inference Config
+INFERENCE_CFG = cfg.get('inference', {})
+INFER_BACKEND = INFERENCE_CFG.get('backend', 'ultralytics')
+INFER_STRIDE_ALIGN = INFERENCE_CFG.get('stride_align', True)
+INFER_AUTO_IMGSZ = INFERENCE_CFG.get('auto_imgsz', False)
+INFER_PRELOAD = INFERENCE_CFG.get('preload', True)
+INFER_WARMUP = INFERENCE_CFG.get('warmup', True)
+
+# Inference Pool Config
+INFER_POOL_CFG = cfg.get('inference_pool', {})
+INFER_POOL_ENABLED = INFER_POOL_CFG.get('enabled', False)
+
+# Parallel Config (xu ly song song cac camera trong 1 batch)
+CAMERA_WORKERS = cfg.get('parallel', {}).get('camera_workers', 3)
+
+# Fail-fast Config (gui NG ngay khi co ROI NG, ROI hay NG chay truoc)
+FAIL_FAST_CFG = cfg.get('fail_fast', {})
+FAIL_FAST_ENABLED = FAIL_FAST_CFG.get('enabled', False)
+FAIL_FAST_REMAINING = FAIL_FAST_CFG.get('remaining', 'skip')
+FAIL_FAST_STATE_FILE = FAIL_FAST_CFG.get('state_file', 'output/roi_stats.json')
+FAIL_FAST_SAVE_INTERVAL = FAIL_FAST_CFG.get('save_interval', 20)
+
+# Pipeline Config
+PIPELINE_CFG = cfg.get('pipeline', {})
+PIPELINE_QUEUE_SIZE = PIPELINE_CFG.get('queue_size', 2)
+PIPELINE_STATS_INTERVAL = PIPELINE_CFG.get('stats_interval', 50)
+FAST_VERDICT = PIPELINE_CFG.get('fast_verdict', True)
+
+# Perf Stats Config (thoi gian tung stage)
+PERF_CFG = cfg.get('perf_stats', {})
+PERF_ENABLED = PERF_CFG.get('enabled', True)
+PERF_SNAPSHOT_FILE = PERF_CFG.get('snapshot_file', 'output/logs/perf_stats.jsonl')
+
+# Metrics Config (endpoint Prometheus)
+METRICS_CFG = cfg.get('metrics', {})
+METRICS_ENABLED = METRICS_CFG.get('enabled', False)
+
+# Batch Assembly Config (ghep anh cac camera theo trigger / thoi diem chup)
+ASSEMBLY_CFG = cfg.get('batch_assembly', {})
+
+# Model Cache Config
+MODEL_CACHE_CFG = cfg.get('model_cache', {})
 
 # GUI Config
 GUI_ENABLED = cfg['gui']['enabled']
 GUI_WINDOW_NAME_TEMPLATE = cfg['gui']['window_name']  # Template, se format sau
 GUI_MAX_HISTORY = cfg['gui']['max_history']
+GUI_HEADLESS_WAIT = cfg['gui'].get('headless_wait', 1.0)
+
+# Su kien danh thuc vong lap chinh (headless): batch xong / doi product code
+main_wakeup = threading.Event()
+# Su kien danh thuc stage ingest (dang nghi giua 2 lan poll): doi product code
+ingest_wakeup = threading.Event()
+
+
+def _on_product_received(product_code: str) -> None:
+    """COMProductReader nhan code moi → vong lap chinh kiem tra ngay"""
+    main_wakeup.set()
 
 # ============================================================================
 # Product Code Reader
@@ -62,7 +135,8 @@ if PRODUCT_MODE == 'auto':
         baudrate=cfg['product'].get('com_input_baudrate', 9600),
         timeout=cfg['product'].get('com_input_timeout', 1.0),
         mode='latest',
-        poll_interval=cfg['product'].get('com_input_poll_interval', 0.5)
+        poll_interval=cfg['product'].get('com_input_poll_interval', 0.5),
+        on_receive=_on_product_received
     )
     print(f"[PRODUCT] Mode: AUTO (from COM {cfg['product'].get('com_input_port')})")
 else:
@@ -94,49 +168,372 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
 
+_log_lock = threading.Lock()  # Nhieu stage pipeline cung ghi log
+
+
 def log_message(message: str) -> None:
     """In va luu log"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_msg = f"[{timestamp}] {message}"
-    print(log_msg)
     
-    # Luu vao file log
-    log_file = os.path.join(LOG_DIR, "processing.log")
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(log_msg + "\n")
+    with _log_lock:
+        print(log_msg)
+        
+        # Luu vao file log
+        log_file = os.path.join(LOG_DIR, "processing.log")
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(log_msg + "\n")
 
 
-def poll_cameras_once(watchers: dict, used_cameras: list, images: dict, temp_paths: dict) -> tuple:
+def poll_cameras_once(watchers: dict, used_cameras: list, assembler: BatchAssembler) -> None:
     """
     Kiem tra 1 luot tat ca camera (NON-BLOCKING).
-    - Khong cho, chi kiem tra co anh moi khong
-    - Neu co → doc anh, them vao dict
-    - Neu khong → bo qua, tra ve ngay
+    - Khong cho, chi kiem tra co anh moi khong (anh moi vao FIFO cua watcher)
+    - Camera chua co anh dang ghep → lay 1 anh cu nhat trong FIFO, doc anh
+      (doc byte 1 lan + imdecode), dua vao assembler (ghep theo trigger / thoi diem chup)
+    - Anh con lai o lai FIFO cho batch sau (khong bi bo qua khi anh den don dap)
     
     Args:
         watchers: {"CAM1": ImageWatcher, ...}
         used_cameras: Danh sach camera can cho
-        images: Dict anh da thu thap duoc (se duoc cap nhat)
-        temp_paths: Dict luu duong dan temp file (de cleanup sau)
-        
-    Returns:
-        tuple: (images, temp_paths) da duoc cap nhat
+        assembler: BatchAssembler cua product hien tai
     """
+    assembling = assembler.pending()
     for cam in used_cameras:
-        if cam in images:
-            continue  # Da co anh tu camera nay
+        watcher = watchers[cam]
+        watcher.poll()
+        if assembling.get(cam, 0):
+            continue  # Da co anh dang ghep → anh moi cho trong FIFO
         
-        new_images = watchers[cam].get_new_images()
+        frame = watcher.pop_next()
+        if frame is None:
+            continue
+        with perf_stats.timer("imread"):
+            image = watcher.load_image(frame)
+        if image is None:
+            # Camera chua ghi xong / file loi → doc lai sau (giu thu tu), qua ready_timeout → bo
+            if watcher.retry_image(frame):
+                log_message(f"[WAIT] Camera {cam} - {frame['filename']} incomplete, retry #{frame['retries']}")
+            else:
+                log_message(f"[ERROR] Camera {cam} - cannot read {frame['filename']}")
+            continue
+        frame['image'] = image
+        assembler.add(cam, frame)
+        backlog = f", {watcher.backlog()} waiting" if watcher.backlog() else ""
+        log_message(f"[GOT] Camera {cam} - image received {image.shape} ({frame['filename']}{backlog})")
+
+
+def discard_frames(watchers: dict, frames: list) -> None:
+    """Xoa temp file cua cac anh bi assembler bo (den tre / trung / doi product)"""
+    for cam, frame in frames:
+        if cam in watchers:
+            watchers[cam].cleanup_temp_file(frame['temp_path'])
+
+
+def ingest_batch(state: dict, watchers: dict):
+    """
+    Stage ingest/decode: poll + doc anh cac camera, ghep thanh tung san pham → tra ve 1 batch.
+    Doi product (state["product_ctx"] bi thay) → bo anh dang ghep, ghep lai tu dau.
+    Het timeout ma thieu camera → batch thieu (ROI cua camera thieu bao NG).
+    
+    Args:
+        state: {"product_ctx", "batch_ctx", "assembler", "ready", "batch_num"}
+        watchers: {"CAM1": ImageWatcher, ...}
         
-        if new_images:
-            image_path = new_images[0]['temp_path']
-            image = cv2.imread(image_path)
-            if image is not None:
-                images[cam] = image
-                temp_paths[cam] = image_path  # Luu temp path de cleanup sau
-                log_message(f"[GOT] Camera {cam} - image received {image.shape}")
+    Returns:
+        dict batch hoac None (chua co san pham nao du anh / het han)
+    """
+    product_ctx = state["product_ctx"]
+    assembler = state["assembler"]
+    if state["batch_ctx"] is not product_ctx:
+        # Bo anh dang ghep (cho batch moi)
+        state["batch_ctx"] = product_ctx
+        state["ready"].clear()
+        discard_frames(watchers, assembler.reset(product_ctx["used_cameras"]))
     
-    return images, temp_paths
+    used_cameras = product_ctx["used_cameras"]
+    poll_cameras_once(watchers, used_cameras, assembler)
+    state["ready"].extend(assembler.pop_ready())
+    discard_frames(watchers, assembler.pop_dropped())
+    if not state["ready"]:
+        return None
+    
+    part = state["ready"].popleft()
+    perf_stats.record("assembly", part["assembly_ms"])
+    state["batch_num"] += 1
+    batch_num = state["batch_num"]
+    if part["missing"]:
+        log_message(f"[READY] Batch #{batch_num} INCOMPLETE ({part['reason']}) - "
+                    f"missing {part['missing']} after {part['assembly_ms']:.0f}ms")
+    else:
+        log_message(f"[READY] All cameras ready. Processing batch #{batch_num}...")
+    
+    cameras = [cam for cam in used_cameras if cam in part["frames"]]
+    return {
+        "batch_num": batch_num,
+        "product_ctx": product_ctx,
+        "cameras": cameras,                 # Camera co anh (thu tu used_cameras)
+        "missing_cameras": part["missing"],
+        "images": {cam: part["frames"][cam]["image"] for cam in cameras},
+        "temp_paths": {cam: part["frames"][cam]["temp_path"] for cam in cameras},
+        "start_time": time.time(),
+    }
+
+
+def infer_batch(batch: dict, executor=None) -> dict:
+    """
+    Stage inference: crop + detect tat ca ROI (gom theo model, 1 lan inference/model,
+    rule trung detect_roi dung chung ket qua)
+    """
+    product_ctx = batch["product_ctx"]
+    batch["detections"] = run_batch_detection(batch["images"], product_ctx["roi_rules"],
+                                              cameras=batch["cameras"],
+                                              plan=product_ctx["inference_plan"],
+                                              stride_align=INFER_STRIDE_ALIGN,
+                                              auto_imgsz=INFER_AUTO_IMGSZ,
+                                              executor=executor)
+    return batch
+
+
+def infer_batch_fail_fast(batch: dict, scheduler: ROIScheduler, verdict_sender: OrderedVerdictSender) -> dict:
+    """
+    Stage inference (fail-fast): goi tung model theo thu tu cua scheduler
+    (ti le NG cao / chi phi thap truoc), compare ngay sau moi lan goi.
+    ROI dau tien NG → gui NG qua COM ngay (sau ket qua cac batch truoc). Cac lan goi con lai:
+        - "skip": bo qua (ROI bao SKIPPED)
+        - "background": van chay sau khi da gui NG (du log / anh ket qua)
+    """
+    product_ctx = batch["product_ctx"]
+    batch["detections"] = detect_fail_fast(batch["images"], product_ctx["roi_rules"],
+                                           cameras=batch["cameras"],
+                                           plan=product_ctx["inference_plan"],
+                                           scheduler=scheduler,
+                                           product_code=product_ctx["product_code"],
+                                           remaining=FAIL_FAST_REMAINING,
+                                           stride_align=INFER_STRIDE_ALIGN,
+                                           auto_imgsz=INFER_AUTO_IMGSZ,
+                                           missing=bool(batch["missing_cameras"]),
+                                           on_ng=lambda reason: send_early_ng(batch, verdict_sender, reason))
+    
+    if FAIL_FAST_STATE_FILE and batch["batch_num"] % FAIL_FAST_SAVE_INTERVAL == 0:
+        scheduler.save(FAIL_FAST_STATE_FILE)
+    return batch
+
+
+def submit_verdict(batch: dict, verdict_sender: OrderedVerdictSender, status: str,
+                   release: bool = False) -> bool:
+    """
+    Nop ket qua batch cho sender (gui theo thu tu batch, ghi verdict_time khi gui that).
+    Batch da nop ket qua (fail-fast NG / fast verdict) → bo qua, tra ve False.
+    """
+    def on_sent():
+        batch["verdict_time"] = time.time() - batch["start_time"]
+    return verdict_sender.submit(batch["batch_num"], status, on_sent, release=release)
+
+
+def send_early_ng(batch: dict, verdict_sender: OrderedVerdictSender, reason: str) -> None:
+    """Fail-fast: gui NG ngay (khong cho cac ROI con lai, chi cho ket qua cac batch truoc)"""
+    elapsed_ms = (time.time() - batch["start_time"]) * 1000
+    submit_verdict(batch, verdict_sender, "NG")
+    state = "sent" if "verdict_time" in batch else "queued behind earlier batches"
+    log_message(f"[FAIL-FAST] Batch {batch['batch_num']}: NG {state} after {elapsed_ms:.0f}ms ({reason})")
+
+
+def judge_batch(batch: dict, executor=None, verdict_sender: OrderedVerdictSender = None) -> dict:
+    """
+    Stage judgement: compare vi tri + goc cho tung ROI, tinh ket qua batch.
+    Viec ve/luu anh duoc gom vao batch["visualizations"] cho stage persistence.
+    Co executor → cac camera xu ly song song, ket qua van theo thu tu used_cameras.
+    Co verdict_sender (fast verdict) → gui OK/NG ngay, log tung ROI de stage persistence ghi.
+    """
+    missing_rules = [rule for rule in batch["product_ctx"]["roi_rules"]
+                     if rule["camera"] in batch["missing_cameras"]]
+    judged = judge_detections(batch["batch_num"], batch["images"], batch["detections"],
+                              batch["cameras"], executor, missing_rules)
+    log_lines = judged["log_lines"]
+    
+    # Ket qua batch
+    batch["final_status"] = judged["final_status"]
+    batch["batch_time"] = time.time() - batch["start_time"]
+    batch["roi_results"] = judged["roi_results"]
+    batch["gui_roi_items"] = judged["gui_roi_items"]
+    batch["visualizations"] = judged["visualizations"]
+    
+    if verdict_sender is not None:
+        # === FAST VERDICT: PLC nhan ket qua truoc khi ve/luu anh ===
+        # (Fail-fast co the da nop NG → sender bo qua)
+        submit_verdict(batch, verdict_sender, batch["final_status"])
+        batch["log_lines"] = log_lines
+    else:
+        for line in log_lines:
+            log_message(line)
+    return batch
+
+
+def save_visualizations(images: dict, visualizations: list) -> None:
+    """Ve + luu anh ket qua cho list ROI (cua 1 camera)"""
+    for viz in visualizations:
+        cam = viz["camera"]
+        rule = viz["roi_data"]["rule"]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = f"{OUTPUT_DIR}/{timestamp}_{rule['roi_id']}_{cam}.jpg"
+        visualize_detection_result(images[cam], viz["roi_data"], viz["detect_result"],
+                                   viz["passed"], output_path, angle_info=viz["angle_info"])
+
+
+def persist_batch(batch: dict, verdict_sender: OrderedVerdictSender, watchers: dict, executor=None) -> dict:
+    """
+    Stage persistence: ve + luu anh ket qua, gui COM, in ket qua, xoa temp file.
+    Co executor → moi camera ve/luu anh song song.
+    Fast verdict (COM da gui o judgement) → chi con la background writer: ghi log ROI,
+    ve/luu anh, in ket qua.
+    Batch tra ve duoc dua len GUI o thread chinh.
+    """
+    batch_num = batch["batch_num"]
+    final_status = batch["final_status"]
+    batch_time = batch["batch_time"]
+    
+    for line in batch.get("log_lines", []):
+        log_message(line)
+    
+    map_cameras(
+        executor,
+        lambda cam: save_visualizations(
+            batch["images"], [viz for viz in batch["visualizations"] if viz["camera"] == cam]),
+        batch["cameras"]
+    )
+    
+    # === THEM: Gui tin hieu COM ===
+    # Stage cuoi (theo thu tu batch): moi batch truoc da nop ket qua hoac bi mat (loi stage)
+    # → release: ket qua batch nay (va ket qua fail-fast dang giu) duoc gui ngay
+    submit_verdict(batch, verdict_sender, final_status, release=True)
+    verdict_time = batch.get("verdict_time", time.time() - batch["start_time"])
+    batch["verdict_time"] = verdict_time
+    batch["total_time"] = time.time() - batch["start_time"]
+    perf_stats.record("batch_verdict", verdict_time * 1000)
+    perf_stats.record("batch_total", batch["total_time"] * 1000)
+    
+    # Print ket qua (GIU NGUYEN)
+    print("\n" + "="*70)
+    print(f"BATCH #{batch_num} - RESULT: {final_status} | Time: {batch_time:.2f}s | "
+          f"Verdict: {verdict_time:.3f}s | Total: {batch['total_time']:.2f}s")
+    print("="*70)
+    for result in batch["roi_results"]:
+        status_icon = "[--]" if result.get("skipped") else ("[OK]" if result["pass"] else "[NG]")
+        camera = result.get("camera", "?")
+        roi_id = result.get("roi_id", "?")
+        reason = result.get("reason", "")
+        print(f"  {status_icon} {roi_id} ({camera}): {reason}")
+    print("="*70)
+    print(f"Visualizations saved to: {os.path.abspath(OUTPUT_DIR)}\n")
+    
+    log_message(f"[BATCH {batch_num}] COMPLETED - RESULT: {final_status} "
+                f"(verdict {verdict_time * 1000:.0f}ms, total {batch['total_time'] * 1000:.0f}ms)")
+    log_message("")
+    
+    # === Cleanup temp files ===
+    for cam, temp_path in batch["temp_paths"].items():
+        try:
+            watchers[cam].cleanup_temp_file(temp_path)
+        except Exception as e:
+            log_message(f"[CLEANUP] Error cleaning {cam} temp file: {e}")
+    
+    # Giai phong anh goc (chi giu phan GUI can)
+    batch["images"] = None
+    batch["visualizations"] = None
+    batch["log_lines"] = None
+    log_message(f"[WAITING] Waiting for images from: {batch['product_ctx']['used_cameras']}")
+    return batch
+
+
+def release_failed_batch(batch: dict, verdict_sender: OrderedVerdictSender, watchers: dict,
+                         error: Exception) -> None:
+    """
+    Stage inference / judgement / persistence loi → batch bi bo (pipeline.Stage):
+    bao NG (theo thu tu batch) + xoa temp file → anh duoc tracker ghi la da xu ly
+    (khong giu floor checkpoint, khong ro temp file)
+    """
+    log_message(f"[BATCH {batch['batch_num']}] FAILED ({error}) - RESULT: NG")
+    submit_verdict(batch, verdict_sender, "NG")
+    discard_frames(watchers, [(cam, {"temp_path": temp_path})
+                              for cam, temp_path in batch["temp_paths"].items()])
+
+
+def build_metrics_collector(gui, com_output, pipeline, watchers: dict, ingest_state: dict):
+    """
+    Collector cho MetricsServer: chi doc counter san co (khong lock lau)
+    → scrape khong block vong lap kiem tra.
+    """
+    batch_rate = RateMeter(window=60.0)
+    
+    def collect() -> list:
+        used_cameras = ingest_state["product_ctx"]["used_cameras"]
+        assembler = ingest_state["assembler"]
+        pending = assembler.pending()
+        com_stats = com_output.get_stats()
+        cache_stats = get_cache_stats(blocking=False)
+        
+        metrics = [
+            ("visionai_batches_total", "counter", "Batches processed",
+             [({}, gui.total_batches)]),
+            ("visionai_batches_per_second", "gauge", "Batch throughput over the last 60s",
+             [({}, batch_rate.rate(gui.total_batches))]),
+            ("visionai_batch_results_total", "counter", "Batch verdicts",
+             [({"status": "OK"}, gui.total_ok), ({"status": "NG"}, gui.total_ng)]),
+            ("visionai_stage_latency_seconds", "histogram", "Latency per stage",
+             histogram_samples(perf_stats.get_histograms())),
+            ("visionai_pipeline_queue_depth", "gauge", "Batches waiting between pipeline stages",
+             [({"queue": name}, q.depth()) for name, q in pipeline.queues.items()]),
+            ("visionai_camera_queue_depth", "gauge", "Images waiting per camera (assembling + watcher FIFO)",
+             [({"camera": cam}, pending.get(cam, 0) + (watchers[cam].backlog() if cam in watchers else 0))
+              for cam in used_cameras]),
+            ("visionai_assembly_parts_total", "counter", "Parts assembled from camera images",
+             [({"result": "complete"}, assembler.total_complete),
+              ({"result": "partial"}, assembler.total_partial)]),
+            ("visionai_assembly_orphans_total", "counter", "Images dropped by the batch assembler",
+             [({}, assembler.total_orphans)]),
+            ("visionai_assembly_open_parts", "gauge", "Parts waiting for camera images",
+             [({}, assembler.get_stats()["open_parts"])]),
+            ("visionai_watcher_backlog", "gauge", "Images waiting in the watcher FIFO",
+             [({"camera": cam}, w.backlog()) for cam, w in watchers.items()]),
+            ("visionai_watcher_max_backlog", "gauge", "Largest watcher FIFO backlog seen",
+             [({"camera": cam}, w.max_backlog) for cam, w in watchers.items()]),
+            ("visionai_watcher_dropped_total", "counter", "Images dropped by the overload policy",
+             [({"camera": cam}, w.total_dropped) for cam, w in watchers.items()]),
+            ("visionai_watcher_images_total", "counter", "Images picked up by the watcher",
+             [({"camera": cam}, w.total_new) for cam, w in watchers.items()]),
+            ("visionai_watcher_not_ready_total", "counter", "Images found before the camera finished writing",
+             [({"camera": cam}, w.total_not_ready) for cam, w in watchers.items()]),
+            ("visionai_watcher_incomplete_reads_total", "counter", "Image reads retried as incomplete",
+             [({"camera": cam}, w.total_incomplete_reads) for cam, w in watchers.items()]),
+            ("visionai_watcher_incomplete_lost_total", "counter", "Images given up after ready_timeout",
+             [({"camera": cam}, w.total_incomplete_lost) for cam, w in watchers.items()]),
+            ("visionai_com_sent_total", "counter", "COM results sent", [({}, com_stats["total_sent"])]),
+            ("visionai_com_send_failures_total", "counter", "COM send failures",
+             [({}, com_stats["total_failed"])]),
+            ("visionai_com_connected", "gauge", "COM output port connected",
+             [({}, com_stats["is_connected"])]),
+        ]
+        if cache_stats:
+            metrics += [
+                ("visionai_model_cache_entries", "gauge", "Models in cache", [({}, cache_stats["entries"])]),
+                ("visionai_model_cache_memory_mb", "gauge", "Model weights in cache (MB)",
+                 [({}, cache_stats["memory_mb"])]),
+                ("visionai_model_cache_events_total", "counter", "Model cache events",
+                 [({"event": event}, cache_stats[event]) for event in ("hits", "misses", "evictions", "dedup_hits")]),
+            ]
+        if product_reader:
+            reader_stats = product_reader.get_stats()
+            metrics += [
+                ("visionai_product_codes_received_total", "counter", "Product codes received on COM input",
+                 [({}, reader_stats["total_received"])]),
+                ("visionai_product_reader_errors_total", "counter", "COM input errors",
+                 [({}, reader_stats["total_errors"])]),
+            ]
+        return metrics
+    
+    return collect
+
 
 def main():
     """
@@ -152,6 +549,15 @@ def main():
     current_product_code = None
     roi_rules = None
     used_cameras = None
+    inference_pool = None
+    infer_executor = None
+    judge_executor = None
+    persist_executor = None
+    pipeline = None
+    scheduler = None
+    metrics_server = None
+    watchers = {}
+    batch_num = 0
     
     try:
         # Start COM Product Reader (neu mode=auto)
@@ -172,6 +578,49 @@ def main():
         csv_path = cfg['product']['csv_path'].format(code=current_product_code)
         roi_rules = load_product_csv(csv_path)
         used_cameras = get_used_cameras(roi_rules)
+        inference_plan = build_inference_plan(roi_rules)
+        print_inference_plan(inference_plan)
+        
+        # Backend inference + gioi han cache model + pin model cua product hien tai
+        configure_backend(backend=INFER_BACKEND, engine_options=INFERENCE_CFG)
+        configure_cache(
+            max_entries=MODEL_CACHE_CFG.get('max_entries', 0),
+            max_memory_mb=MODEL_CACHE_CFG.get('max_memory_mb', 0)
+        )
+        set_active_models([r["model_name"] for r in roi_rules])
+        
+        # Process pool: model load trong worker, crop gui qua shared memory
+        if INFER_POOL_ENABLED:
+            inference_pool = InferencePool(
+                num_workers=INFER_POOL_CFG.get('workers', 2),
+                threads_per_worker=INFER_POOL_CFG.get('threads_per_worker', 2),
+                model_assignment=INFER_POOL_CFG.get('model_assignment') or {},
+                backend=INFER_BACKEND,
+                engine_options=INFERENCE_CFG,
+                request_timeout=INFER_POOL_CFG.get('request_timeout', 30)
+            )
+            inference_pool.start()
+            set_inference_pool(inference_pool)
+            infer_executor = ThreadPoolExecutor(max_workers=inference_pool.num_workers,
+                                                thread_name_prefix="infer-call")
+        elif CAMERA_WORKERS > 1:
+            # Cac model khac nhau (thuong = camera khac nhau) infer song song,
+            # model_lock() dam bao 1 model khong bi goi dong thoi
+            infer_executor = ThreadPoolExecutor(max_workers=CAMERA_WORKERS,
+                                                thread_name_prefix="infer-call")
+        
+        # Compare / ve + luu anh song song theo camera (moi stage 1 executor rieng)
+        if CAMERA_WORKERS > 1:
+            judge_executor = ThreadPoolExecutor(max_workers=CAMERA_WORKERS,
+                                                thread_name_prefix="judge-cam")
+            persist_executor = ThreadPoolExecutor(max_workers=CAMERA_WORKERS,
+                                                  thread_name_prefix="persist-cam")
+        
+        # Load + warm-up model trong thread nen (song song voi init camera/GUI)
+        if INFER_PRELOAD:
+            log_message("[PRELOAD] Loading models in background...")
+            preload_models(roi_rules, warmup=INFER_WARMUP, stride_align=INFER_STRIDE_ALIGN,
+                           auto_imgsz=INFER_AUTO_IMGSZ)
         
         # Load camera config
         log_message("[LOADING] Camera configuration...")
@@ -198,17 +647,28 @@ def main():
             os.makedirs(input_folder, exist_ok=True)
             os.makedirs(temp_folder, exist_ok=True)
             
-            # Khởi tạo watcher
-            watchers[cam] = ImageWatcher(input_folder, temp_folder, poll_interval=CAMERA_POLL_INTERVAL)
+            # Khởi tạo watcher (checkpoint → restart xử lý tiếp từ chỗ dừng)
+            checkpoint_path = os.path.join(CAMERA_CHECKPOINT_DIR, f"{cam}.json") if CAMERA_CHECKPOINT_DIR else None
+            watchers[cam] = ImageWatcher(input_folder, temp_folder, poll_interval=CAMERA_POLL_INTERVAL,
+                                         overload_policy=CAMERA_OVERLOAD_POLICY,
+                                         max_pending=CAMERA_MAX_PENDING,
+                                         backend=CAMERA_WATCHER_BACKEND,
+                                         on_event=ingest_wakeup.set,
+                                         extensions=get_camera_extensions(cam, camera_config),
+                                         handoff=CAMERA_HANDOFF,
+                                         checkpoint_path=checkpoint_path,
+                                         checkpoint_interval=CAMERA_CHECKPOINT_INTERVAL,
+                                         settle_time=CAMERA_SETTLE_TIME,
+                                         ready_timeout=CAMERA_READY_TIMEOUT,
+                                         check_trailer=CAMERA_CHECK_TRAILER)
             log_message(f"[INIT] ImageWatcher for {cam}: {input_folder}")
         
         batch_num = 0
-        images = {}  # Thu thap anh dan dan (non-blocking)
-        temp_paths = {}  # Track temp files de cleanup sau khi xu ly
         
         # Khoi tao GUI (dynamic window name)
         gui_window_name = GUI_WINDOW_NAME_TEMPLATE.format(product_code=current_product_code)
-        gui = ResultGUI(window_name=gui_window_name, max_history=GUI_MAX_HISTORY)
+        gui = ResultGUI(window_name=gui_window_name, max_history=GUI_MAX_HISTORY,
+                        headless=not GUI_ENABLED)
         gui.start()
         
         # Khoi tao COM Output
@@ -218,12 +678,93 @@ def main():
             enabled=ENABLE_COM_OUTPUT,
             retry_count=COM_RETRY
         )
+        # Moi ket qua (fail-fast / fast verdict / persistence) qua 1 sender: gui dung thu tu batch
+        verdict_sender = OrderedVerdictSender(com_output)
+        
+        # === PIPELINE: moi stage 1 thread, noi nhau bang queue gioi han ===
+        # ingest → inference → judgement → persistence → (GUI o thread chinh)
+        # Batch N+1 doc anh / batch N-1 luu anh chay song song voi batch N inference
+        ingest_state = {
+            "product_ctx": {
+                "product_code": current_product_code,
+                "roi_rules": roi_rules,
+                "used_cameras": used_cameras,
+                "inference_plan": inference_plan,
+            },
+            "batch_ctx": None,
+            # Ghep anh dan dan (non-blocking), temp file duoc xoa sau khi xu ly / khi bi bo
+            "assembler": BatchAssembler(
+                used_cameras,
+                match=ASSEMBLY_CFG.get('match', 'arrival'),
+                pattern=ASSEMBLY_CFG.get('pattern') or None,
+                window=ASSEMBLY_CFG.get('window_ms', 200) / 1000.0,
+                timeout=ASSEMBLY_CFG.get('timeout', 2.0),
+                max_open=ASSEMBLY_CFG.get('max_open', 8),
+                reset_gap=ASSEMBLY_CFG.get('reset_gap', 100)
+            ),
+            "ready": deque(),   # San pham da ghep xong, cho stage inference
+            "batch_num": 0,
+        }
+        pipeline = Pipeline(queue_size=PIPELINE_QUEUE_SIZE, on_timing=perf_stats.record)
+        q_infer = pipeline.add_queue("infer")
+        q_judge = pipeline.add_queue("judge")
+        q_persist = pipeline.add_queue("persist")
+        q_display = pipeline.add_queue("display", notify=main_wakeup)
+        # Tat ca camera dung inotify → ingest ngu den khi co anh moi
+        # (van thuc day moi event_timeout giay de kiem tra timeout ghep anh)
+        event_driven = all(w.backend == "inotify" for w in watchers.values())
+        pipeline.add_stage("ingest", lambda: ingest_batch(ingest_state, watchers),
+                           output_queue=q_infer,
+                           idle_sleep=CAMERA_EVENT_TIMEOUT if event_driven else CAMERA_POLL_INTERVAL,
+                           wake_event=ingest_wakeup)
+        # Batch loi o stage nao → NG + giai phong anh (khong chi in log roi bo)
+        on_batch_error = lambda batch, e: release_failed_batch(batch, verdict_sender, watchers, e)
+        if FAIL_FAST_ENABLED:
+            scheduler = ROIScheduler(alpha=FAIL_FAST_CFG.get('ema_alpha', 0.1))
+            if FAIL_FAST_STATE_FILE:
+                scheduler.load(FAIL_FAST_STATE_FILE)
+            log_message(f"[FAIL-FAST] Enabled (remaining ROIs: {FAIL_FAST_REMAINING})")
+            pipeline.add_stage("inference", lambda batch: infer_batch_fail_fast(batch, scheduler, verdict_sender),
+                               input_queue=q_infer, output_queue=q_judge, on_error=on_batch_error)
+        else:
+            pipeline.add_stage("inference", lambda batch: infer_batch(batch, infer_executor),
+                               input_queue=q_infer, output_queue=q_judge, on_error=on_batch_error)
+        verdict_output = verdict_sender if FAST_VERDICT else None
+        pipeline.add_stage("judgement", lambda batch: judge_batch(batch, judge_executor, verdict_output),
+                           input_queue=q_judge, output_queue=q_persist, on_error=on_batch_error)
+        pipeline.add_stage("persistence",
+                           lambda batch: persist_batch(batch, verdict_sender, watchers, persist_executor),
+                           input_queue=q_persist, output_queue=q_display, on_error=on_batch_error)
+        
+        # Do thoi gian tung stage (p50/p95/p99) + ghi snapshot dinh ky
+        perf_stats.configure(enabled=PERF_ENABLED, window=PERF_CFG.get('window', 2000))
+        if PERF_ENABLED and PERF_SNAPSHOT_FILE:
+            perf_stats.start_snapshot_writer(PERF_SNAPSHOT_FILE, PERF_CFG.get('snapshot_interval', 60))
+        
+        # Metrics Prometheus (localhost, thread nen)
+        if METRICS_ENABLED:
+            metrics_server = MetricsServer(host=METRICS_CFG.get('host', '127.0.0.1'),
+                                           port=METRICS_CFG.get('port', 9108))
+            metrics_server.add_collector(
+                build_metrics_collector(gui, com_output, pipeline, watchers, ingest_state))
+            try:
+                metrics_server.start()
+            except OSError as e:
+                # Cong dang bi chiem / khong bind duoc → chay tiep khong co metrics
+                log_message(f"[METRICS] WARNING: Cannot start metrics server on "
+                            f"{metrics_server.host}:{metrics_server.port} ({e}), metrics disabled")
+                metrics_server = None
         
         log_message(f"[WAITING] Waiting for images from: {used_cameras}")
+        pipeline.start()
         
         # === VONG LAP CHINH (Non-blocking) ===
-        # Moi vong: kiem tra product change → poll anh → refresh GUI → xu ly neu du anh
+        # Moi vong: kiem tra product change → update GUI tu pipeline → refresh GUI
+        # Headless: ngu cho den khi co batch xong / product code moi (khong cv2.waitKey)
         while True:
+            if not GUI_ENABLED:
+                main_wakeup.wait(GUI_HEADLESS_WAIT)
+                main_wakeup.clear()
             
             # --- Buoc 0: Kiem tra product code co thay doi khong ---
             new_product_code = get_current_product_code()
@@ -239,13 +780,26 @@ def main():
                     csv_path = cfg['product']['csv_path'].format(code=current_product_code)
                     roi_rules = load_product_csv(csv_path)
                     used_cameras = get_used_cameras(roi_rules)
+                    inference_plan = build_inference_plan(roi_rules)
+                    print_inference_plan(inference_plan)
                     
                     log_message(f"[RELOAD] Product CSV loaded: {csv_path}")
                     log_message(f"[RELOAD] Cameras: {used_cameras}")
                     
-                    # Reset images (cho batch moi)
-                    images = {}
-                    temp_paths = {}
+                    # Model dung chung voi product cu duoc giu lai trong cache
+                    set_active_models([r["model_name"] for r in roi_rules])
+                    if INFER_PRELOAD:
+                        preload_models(roi_rules, warmup=INFER_WARMUP, stride_align=INFER_STRIDE_ALIGN,
+                                       auto_imgsz=INFER_AUTO_IMGSZ)
+                    
+                    # Context moi → stage ingest bo anh dang gom (cho batch moi)
+                    ingest_state["product_ctx"] = {
+                        "product_code": current_product_code,
+                        "roi_rules": roi_rules,
+                        "used_cameras": used_cameras,
+                        "inference_plan": inference_plan,
+                    }
+                    ingest_wakeup.set()
                     
                 except FileNotFoundError as e:
                     log_message(f"[ERROR] Product CSV not found: {e}")
@@ -253,153 +807,35 @@ def main():
                     # Rollback
                     current_product_code = new_product_code  # Keep using old one
             
-            # --- Buoc 1: Poll anh (KHONG block) ---
-            images, temp_paths = poll_cameras_once(watchers, used_cameras, images, temp_paths)
+            # --- Buoc 1: Batch da xong → Update GUI (GUI chi chay o thread chinh) ---
+            batch = q_display.get_nowait()
+            while batch is not None:
+                batch_num = batch["batch_num"]
+                gui.update(batch["gui_roi_items"], batch["final_status"], {
+                    "batch_num": batch_num,
+                    "product_code": batch["product_ctx"]["product_code"],  # Dynamic product code
+                    "batch_time": batch["batch_time"],
+                    "verdict_time": batch["verdict_time"],
+                })
+                if PIPELINE_STATS_INTERVAL and batch_num % PIPELINE_STATS_INTERVAL == 0:
+                    log_message(f"[PIPELINE] {pipeline.format_stats()}")
+                    log_message("[WATCHER] backlog: " + " ".join(
+                        f"{cam}={w.backlog()}(max {w.max_backlog}, dropped {w.total_dropped}, "
+                        f"not ready {w.total_not_ready}, incomplete {w.total_incomplete_reads}, "
+                        f"lost {w.total_incomplete_lost})"
+                        for cam, w in watchers.items()))
+                    log_message(f"[PERF] Latency (ms) after {batch_num} batches:\n{perf_stats.format_summary()}")
+                batch = q_display.get_nowait()
             
-            # --- Buoc 2: Refresh GUI + doc phim (BAT BUOC moi vong) ---
-            action = gui.show(wait_time=30)
+            # --- Buoc 2: Refresh GUI + doc phim (BAT BUOC moi vong, headless → bo qua) ---
+            action = gui.show(wait_time=30) if GUI_ENABLED else None
             if action == 'quit':
                 log_message("[GUI] User pressed Quit")
                 break
             
-            # --- Buoc 3: Chua du anh → quay lai buoc 1 ---
-            if len(images) < len(used_cameras):
-                continue
-            
-            # --- Buoc 4: DU ANH → Xu ly batch ---
-            # (Logic xu ly GIU NGUYEN 100%)
-            batch_num += 1
-            log_message(f"[READY] All cameras ready. Processing batch #{batch_num}...")
-            
-            roi_results = []
-            gui_roi_items = []  # Thu thap data cho GUI
-            batch_start_time = time.time()
-
-            # Xu ly tung camera
-            for cam in used_cameras:
-                image = images[cam]
-                log_message(f"[BATCH {batch_num}] Processing {cam} - {image.shape}")
-                
-                cam_rules = [r for r in roi_rules if r["camera"] == cam]
-
-                for rule in cam_rules:
-                    try:
-                        roi_data = prepare_roi_data(image, rule)
-                        model = get_model(rule["model_name"])
-
-                        # Lay offset tu detect_roi
-                        detect_roi = rule["detect_roi"]
-                        roi_offset = (detect_roi[0], detect_roi[1])
-
-                        detect_result = detect_object(
-                            model,
-                            roi_data["detect_image"],
-                            rule["class_id"],
-                            rule["confidence"],
-                            roi_offset=roi_offset
-                        )
-
-                        passed, reason = compare_detection(
-                            detect_result,
-                            rule["compare_roi"]
-                        )
-
-                        # === Keypoint angle check (neu co config) ===
-                        angle_info = {}
-                        if rule.get("keypoint_idx_1") is not None:
-                            if detect_result.get("found"):
-                                # Tinh goc (luon tinh de hien thi debug)
-                                angle_passed, angle_reason, angle_info = compare_angle(
-                                    detect_result,
-                                    rule["keypoint_idx_1"],
-                                    rule["keypoint_idx_2"],
-                                    rule["expected_angle"],
-                                    rule["angle_tolerance"]
-                                )
-                                # Goc sai → NG (chi khi vi tri da OK)
-                                if passed and not angle_passed:
-                                    passed = False
-                                    reason = angle_reason
-
-                        # Ve hinh anh ket qua (VAN luu file nhu cu)
-                        roi_data["rule"] = rule
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        output_path = f"{OUTPUT_DIR}/{timestamp}_{rule['roi_id']}_{cam}.jpg"
-                        visualize_detection_result(image, roi_data, detect_result, passed, output_path, angle_info=angle_info)
-
-                        status_str = "OK" if passed else "NG"
-                        log_message(f"  {rule['roi_id']}: {status_str} ({reason})")
-
-                        roi_results.append({
-                            "roi_id": rule["roi_id"],
-                            "camera": cam,
-                            "pass": passed,
-                            "reason": reason
-                        })
-                        
-                        # === THEM: Gom data cho GUI ===
-                        gui_roi_items.append({
-                            "roi_id": rule["roi_id"],
-                            "camera": cam,
-                            "crop_image": roi_data["detect_image"],
-                            "passed": passed,
-                            "reason": reason,
-                            "detect_result": detect_result,
-                            "detect_roi": rule["detect_roi"],
-                            "compare_roi": rule["compare_roi"],
-                            "angle_info": angle_info,
-                        })
-                        
-                    except Exception as e:
-                        log_message(f"  [ERROR] {rule['roi_id']}: {str(e)}")
-                        roi_results.append({
-                            "roi_id": rule["roi_id"],
-                            "camera": cam,
-                            "pass": False,
-                            "reason": f"ERROR: {str(e)}"
-                        })
-
-            # Tinh ket qua batch
-            final_status = aggregate_results(roi_results)
-            batch_time = time.time() - batch_start_time
-            
-            # === THEM: Gui tin hieu COM ===
-            com_output.send_result(final_status)
-            
-            # === THEM: Update GUI ===
-            gui.update(gui_roi_items, final_status, {
-                "batch_num": batch_num,
-                "product_code": current_product_code,  # Dynamic product code
-                "batch_time": batch_time,
-            })
-            
-            # Print ket qua (GIU NGUYEN)
-            print("\n" + "="*70)
-            print(f"BATCH #{batch_num} - RESULT: {final_status} | Time: {batch_time:.2f}s")
-            print("="*70)
-            for result in roi_results:
-                status_icon = "[OK]" if result["pass"] else "[NG]"
-                camera = result.get("camera", "?")
-                roi_id = result.get("roi_id", "?")
-                reason = result.get("reason", "")
-                print(f"  {status_icon} {roi_id} ({camera}): {reason}")
-            print("="*70)
-            print(f"Visualizations saved to: {os.path.abspath(OUTPUT_DIR)}\n")
-            
-            log_message(f"[BATCH {batch_num}] COMPLETED - RESULT: {final_status}")
-            log_message("")
-            
-            # === Cleanup temp files ===
-            for cam, temp_path in temp_paths.items():
-                try:
-                    watchers[cam].cleanup_temp_file(temp_path)
-                except Exception as e:
-                    log_message(f"[CLEANUP] Error cleaning {cam} temp file: {e}")
-            
-            # Reset cho batch tiep theo
-            images = {}
-            temp_paths = {}
-            log_message(f"[WAITING] Waiting for images from: {used_cameras}")
+            # --- Buoc 3: Stage bi dung bat thuong → dung chuong trinh ---
+            if not pipeline.is_alive():
+                raise RuntimeError("Pipeline stage stopped unexpectedly")
     
     except FileNotFoundError as e:
         log_message(f"[FATAL] {e}")
@@ -413,7 +849,18 @@ def main():
         log_message(f"[FATAL] {str(e)}")
         print(f"\n[ERROR] {str(e)}\n")
     finally:
-        # Dong GUI, COM output va COM input an toan
+        # Dung pipeline truoc, roi dong GUI, COM output va COM input an toan
+        try:
+            if pipeline:
+                pipeline.stop()
+            if PERF_ENABLED and PERF_SNAPSHOT_FILE:
+                perf_stats.stop_snapshot_writer(PERF_SNAPSHOT_FILE)
+            if metrics_server:
+                metrics_server.stop()
+            if scheduler and FAIL_FAST_STATE_FILE:
+                scheduler.save(FAIL_FAST_STATE_FILE)
+        except Exception:
+            pass
         try:
             gui.close()
         except Exception:
@@ -427,6 +874,16 @@ def main():
                 product_reader.stop()
         except Exception:
             pass
+        try:
+            for executor in (infer_executor, judge_executor, persist_executor):
+                if executor:
+                    executor.shutdown(wait=False)
+            for watcher in watchers.values():
+                watcher.close()
+            if inference_pool:
+                inference_pool.stop()
+        except Exception:
+            pass
 
 
 if __name__ == "__main__":
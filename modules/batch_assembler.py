@@ -0,0 +1,304 @@
+"""
+Module: batch_assembler
+Chuc nang: Ghep anh cua cac camera thanh tung san pham (part) theo trigger
+    - match "arrival": anh den truoc ghep voi nhau (nhu cu, khong can ten file)
+    - match "trigger": cung trigger ID (lay tu ten file bang regex)
+    - match "timestamp": thoi diem chup (regex tu ten file hoac mtime) lech nhau <= window
+    - Qua timeout ma van thieu camera → tra ve part thieu (ben goi bao NG)
+    - Camera thieu da co anh cua trigger sau → part cu chac chan mat anh,
+      tra ve ngay (khong cho timeout) → line toc do cao khong bi ket sau 1 anh mat
+    - Anh den tre (part da tra ve) / anh trung → bo (orphan), ben goi xoa temp file
+    - Key lui qua xa (> reset_gap, VD counter camera reset / quay vong) → khong phai
+      anh tre: tra ve cac part dang ghep, bat dau lai tu key moi
+    - Ghi lai thoi gian ghep (anh dau tien → part du / het han)
+
+Khong phu thuoc module khac
+"""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+MATCH_MODES = ("arrival", "trigger", "timestamp")
+
+
+class BatchAssembler:
+    """
+    Cach dung:
+        assembler = BatchAssembler(["CAM1", "CAM2"], match="trigger",
+                                   pattern=r"_(?P<trigger>\\d+)\\.", timeout=2.0)
+        assembler.add("CAM1", {"filename": "CAM1_0012.jpg", "mtime": ..., ...})
+        for part in assembler.pop_ready():
+            part["frames"]            # {"CAM1": frame, ...} (chi camera da co anh)
+            part["missing"]           # ["CAM2"] neu het han
+        for cam, frame in assembler.pop_dropped():
+            ...                       # xoa temp file cua anh bi bo
+    """
+
+    def __init__(self, cameras: List[str], match: str = "arrival",
+                 pattern: Optional[str] = None, window: float = 0.2,
+                 timeout: float = 0.0, max_open: int = 8, reset_gap: float = 0.0):
+        """
+        Args:
+            cameras: Camera can cho moi part
+            match: "arrival" / "trigger" / "timestamp"
+            pattern: Regex lay key tu ten file: nhom (?P<trigger>...) hoac (?P<ts>...) (ms).
+                     timestamp khong co pattern (hoac khong khop) → dung mtime cua file
+            window: Do lech thoi gian toi da giua cac camera cua 1 part (giay, mode timestamp)
+            timeout: Thoi gian cho toi da tu anh dau tien cua part (giay, 0 = cho mai)
+            max_open: So part dang ghep toi da (vuot → part cu nhat bi tra ve thieu)
+            reset_gap: Anh co key nho hon key da tra ve qua reset_gap (so trigger / giay)
+                       → counter bi reset, khong bo anh (0 = tat, moi anh cu deu la anh tre)
+        """
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode '{match}' (expected one of {MATCH_MODES})")
+        self.cameras = list(cameras)
+        self.match = match
+        self.pattern = re.compile(pattern) if pattern else None
+        self.window = window if match == "timestamp" else 0.0
+        self.timeout = timeout
+        self.max_open = max_open
+        self.reset_gap = reset_gap
+
+        self._parts: List[Dict[str, Any]] = []       # Part dang ghep (thu tu tao)
+        self._ready: List[Dict[str, Any]] = []
+        self._dropped: List[Tuple[str, Dict]] = []
+        self._latest_key: Dict[str, float] = {}      # Key moi nhat da nhan / camera
+        self._emitted_key: Optional[float] = None    # Key lon nhat da tra ve
+
+        # Thong ke
+        self.total_complete = 0
+        self.total_partial = 0       # Het timeout / bi vuot qua / qua max_open
+        self.total_orphans = 0       # Anh den tre, trung, khong doc duoc key
+        self.total_resets = 0        # Counter trigger / dong ho camera bi reset
+        self.last_assembly_ms = 0.0
+
+    # ==================================================================
+    # PUBLIC METHODS
+    # ==================================================================
+
+    def frame_key(self, filename: str, mtime: Optional[float] = None) -> Optional[float]:
+        """
+        Key de ghep anh (None = mode arrival / khong doc duoc trigger ID).
+        trigger → so nguyen trong ten file; timestamp → giay.
+        """
+        if self.match == "arrival":
+            return None
+        found = self.pattern.search(filename) if self.pattern else None
+        if self.match == "trigger":
+            return float(found.group("trigger")) if found else None
+        if found and "ts" in found.groupdict():
+            return float(found.group("ts")) / 1000.0
+        return mtime
+
+    def add(self, cam: str, frame: Dict) -> None:
+        """
+        Them 1 anh vao part phu hop (hoac tao part moi).
+
+        Args:
+            cam: Ten camera
+            frame: {"filename", "mtime" (tuy chon), ...} - giu nguyen, tra ve trong part
+        """
+        now = time.time()
+        if cam not in self.cameras:
+            self._drop(cam, frame, "unknown camera")
+            return
+
+        key = self.frame_key(frame["filename"], frame.get("mtime"))
+        if self.match != "arrival":
+            if key is None:
+                self._drop(cam, frame, "no trigger ID in file name")
+                return
+            if self._emitted_key is not None and key <= self._emitted_key - self.window \
+                    and self._find_part(cam, key) is None:
+                if self.reset_gap > 0 and key < self._emitted_key - self.reset_gap:
+                    self._restart(cam, key, now)
+                else:
+                    self._drop(cam, frame, "late frame (part already emitted)")
+                    return
+            self._latest_key[cam] = max(key, self._latest_key.get(cam, key))
+
+        part = self._find_part(cam, key)
+        if part is None:
+            part = {"key": key, "frames": {}, "first_arrival": now}
+            self._parts.append(part)
+        elif cam in part["frames"]:
+            # Cung trigger ID 2 lan → giu anh moi nhat
+            self._drop(cam, part["frames"][cam], "duplicate trigger")
+        part["frames"][cam] = frame
+
+        if len(part["frames"]) == len(self.cameras):
+            if key is not None:
+                # Moi camera da sang trigger nay → part cu hon chac chan thieu anh,
+                # tra ve truoc de giu dung thu tu ket qua (PLC nhan OK/NG theo thu tu)
+                for older in sorted((p for p in self._parts if p["key"] < key), key=lambda p: p["key"]):
+                    self._emit(older, "superseded", now)
+            self._emit(part, "complete", now)
+        elif len(self._parts) > self.max_open:
+            self._emit(self._parts[0], "overflow", now)
+
+    def pop_ready(self, now: Optional[float] = None) -> List[Dict]:
+        """
+        Lay cac part da du anh / het han (thu tu tra ve = thu tu san sang).
+
+        Returns:
+            list: [{"key", "frames": {cam: frame}, "missing": [cam],
+                    "reason": "complete"/"timeout"/"superseded"/"overflow"/"reset",
+                    "assembly_ms"}, ...]
+        """
+        now = time.time() if now is None else now
+        for part in list(self._parts):
+            missing = [cam for cam in self.cameras if cam not in part["frames"]]
+            if self.timeout > 0 and now - part["first_arrival"] >= self.timeout:
+                self._emit(part, "timeout", now)
+            elif part["key"] is not None and all(
+                    self._latest_key.get(cam, float("-inf")) > part["key"] + self.window for cam in missing):
+                self._emit(part, "superseded", now)
+
+        ready, self._ready = self._ready, []
+        return ready
+
+    def pop_dropped(self) -> List[Tuple[str, Dict]]:
+        """Lay cac anh bi bo tu lan goi truoc: [(cam, frame), ...]"""
+        dropped, self._dropped = self._dropped, []
+        return dropped
+
+    def reset(self, cameras: Optional[List[str]] = None) -> List[Tuple[str, Dict]]:
+        """
+        Bo tat ca part dang ghep (VD: doi product), doi danh sach camera.
+
+        Returns:
+            list: Anh bi bo [(cam, frame), ...]
+        """
+        for part in self._parts + self._ready:
+            for cam, frame in part["frames"].items():
+                self._dropped.append((cam, frame))
+        self._parts, self._ready = [], []
+        self._latest_key = {}
+        self._emitted_key = None
+        if cameras is not None:
+            self.cameras = list(cameras)
+        return self.pop_dropped()
+
+    def pending(self) -> Dict[str, int]:
+        """So anh dang cho ghep / camera"""
+        return {cam: sum(1 for part in self._parts if cam in part["frames"]) for cam in self.cameras}
+
+    def get_stats(self) -> dict:
+        """Lay thong ke"""
+        return {
+            "match": self.match,
+            "open_parts": len(self._parts),
+            "total_complete": self.total_complete,
+            "total_partial": self.total_partial,
+            "total_orphans": self.total_orphans,
+            "total_resets": self.total_resets,
+            "last_assembly_ms": round(self.last_assembly_ms, 1),
+        }
+
+    # ==================================================================
+    # PRIVATE
+    # ==================================================================
+
+    def _find_part(self, cam: str, key: Optional[float]) -> Optional[Dict]:
+        """Part dang ghep phu hop voi anh moi (arrival: part cu nhat con thieu camera nay)"""
+        for part in self._parts:
+            if key is None:
+                if cam not in part["frames"]:
+                    return part
+            elif abs(part["key"] - key) <= self.window:
+                if self.match == "trigger" or cam not in part["frames"]:
+                    return part
+        return None
+
+    def _emit(self, part: Dict, reason: str, now: float) -> None:
+        self._parts.remove(part)
+        part["missing"] = [cam for cam in self.cameras if cam not in part["frames"]]
+        part["reason"] = reason
+        part["assembly_ms"] = (now - part["first_arrival"]) * 1000
+        self.last_assembly_ms = part["assembly_ms"]
+        if part["key"] is not None:
+            self._emitted_key = part["key"] if self._emitted_key is None else max(self._emitted_key, part["key"])
+        if part["missing"]:
+            self.total_partial += 1
+            print(f"[ASSEMBLER] WARNING: Part {self._describe(part)} {reason} - "
+                  f"missing {part['missing']} after {part['assembly_ms']:.0f}ms")
+        else:
+            self.total_complete += 1
+        self._ready.append(part)
+
+    def _restart(self, cam: str, key: float, now: float) -> None:
+        """Key lui qua reset_gap: tra ve part dang ghep (key cu), ghep lai tu key moi"""
+        self.total_resets += 1
+        print(f"[ASSEMBLER] WARNING: {cam} key went back from {self._emitted_key:.0f} to {key:.0f} "
+              f"- counter reset, flushing {len(self._parts)} open part(s)")
+        for part in list(self._parts):
+            self._emit(part, "reset", now)
+        self._latest_key = {}
+        self._emitted_key = None
+
+    def _drop(self, cam: str, frame: Dict, reason: str) -> None:
+        self.total_orphans += 1
+        self._dropped.append((cam, frame))
+        print(f"[ASSEMBLER] Dropped {cam}/{frame['filename']}: {reason}")
+
+    def _describe(self, part: Dict) -> str:
+        if part["key"] is None:
+            return "(arrival)"
+        return f"#{part['key']:.0f}" if self.match == "trigger" else f"@{part['key']:.3f}"
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test: CAM2 mat trigger 2 → part 2 tra ve thieu ngay khi CAM2 co trigger 3 (assert → loi neu sai)"""
+    print("[TEST] Batch Assembler\n")
+
+    assembler = BatchAssembler(["CAM1", "CAM2"], match="trigger",
+                               pattern=r"_(?P<trigger>\d+)\.", timeout=1.0)
+    for cam, name in [("CAM1", "CAM1_0001.jpg"), ("CAM2", "CAM2_0001.jpg"),
+                      ("CAM1", "CAM1_0002.jpg"),
+                      ("CAM1", "CAM1_0003.jpg"), ("CAM2", "CAM2_0003.jpg")]:
+        assembler.add(cam, {"filename": name})
+    parts = assembler.pop_ready()
+    for part in parts:
+        print(f"[OK] #{part['key']:.0f} {part['reason']}: {sorted(part['frames'])} missing={part['missing']}")
+    assert [(p["key"], p["reason"], p["missing"]) for p in parts] == [
+        (1.0, "complete", []), (2.0, "superseded", ["CAM2"]), (3.0, "complete", [])], parts
+
+    assembler.add("CAM2", {"filename": "CAM2_0002.jpg"})   # Den tre → bo
+    dropped = [(cam, f["filename"]) for cam, f in assembler.pop_dropped()]
+    assert dropped == [("CAM2", "CAM2_0002.jpg")], dropped
+    assert assembler.pop_ready() == []
+    stats = assembler.get_stats()
+    assert (stats["total_complete"], stats["total_partial"], stats["total_orphans"]) == (2, 1, 1), stats
+    print(f"[OK] Dropped: {dropped}")
+    print(f"[OK] Stats: {stats}")
+
+    # Het timeout ma van thieu camera → tra ve thieu
+    timed_out = BatchAssembler(["CAM1", "CAM2"], match="trigger",
+                               pattern=r"_(?P<trigger>\d+)\.", timeout=1.0)
+    timed_out.add("CAM1", {"filename": "CAM1_0007.jpg"})
+    assert timed_out.pop_ready() == []
+    parts = timed_out.pop_ready(now=time.time() + 1.0)
+    assert [(p["key"], p["reason"], p["missing"]) for p in parts] == [(7.0, "timeout", ["CAM2"])], parts
+    print("[OK] Timeout: #7 missing ['CAM2']")
+
+    # Counter camera reset (VD restart PLC): trigger 1 sau trigger 501 → ghep lai, khong bo
+    resetting = BatchAssembler(["CAM1", "CAM2"], match="trigger",
+                               pattern=r"_(?P<trigger>\d+)\.", reset_gap=100)
+    for cam, name in [("CAM1", "CAM1_0500.jpg"), ("CAM2", "CAM2_0500.jpg"), ("CAM1", "CAM1_0501.jpg"),
+                      ("CAM1", "CAM1_0001.jpg"), ("CAM2", "CAM2_0001.jpg")]:
+        resetting.add(cam, {"filename": name})
+    parts = [(p["key"], p["reason"]) for p in resetting.pop_ready()]
+    assert parts == [(500.0, "complete"), (501.0, "reset"), (1.0, "complete")], parts
+    assert resetting.total_resets == 1 and resetting.pop_dropped() == []
+    print(f"[OK] After reset: {parts}")
+
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
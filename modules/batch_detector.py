@@ -0,0 +1,372 @@
+"""
+Module: batch_detector
+Chuc nang: Chay detect cho ca batch (tat ca camera) theo kieu gom nhom
+    - Crop tat ca ROI cua tat ca camera truoc
+    - Cac rule trung (camera, model_name, detect_roi) chi crop + infer 1 lan,
+      ket qua tho duoc loc lai theo class_id/confidence cua tung rule
+    - Gom cac crop co cung model_name → 1 lan goi model (list input)
+      (tach them theo iou/max_det/imgsz neu rule cau hinh khac nhau)
+    - Crop co the pad thanh boi so stride cua model, chay o imgsz rieng / rule
+    - class_id / confidence cua cac rule duoc truyen vao model → NMS chi
+      xu ly cac class can kiem tra
+    - Tach ket qua tra ve cho tung rule (giu nguyen offset handling)
+    - Co executor (InferencePool) → cac model goi song song
+    - prepare_batch_calls() + run_batch_call(): tu chon thu tu goi model (fail-fast)
+
+Phu thuoc: roi_manager, model_manager, detector
+"""
+
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional
+
+from modules.roi_manager import prepare_roi_data
+from modules.model_manager import get_model, model_lock
+from modules.detector import infer_raw, select_detection, get_model_stride, benchmark_imgsz
+
+
+def build_inference_plan(roi_rules: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Gom cac rule dung chung 1 lan inference. Goi 1 lan sau load_product_csv().
+
+    Rule co cung (camera, model_name, detect_roi, iou, max_det, imgsz) chi khac
+    class_id / confidence / compare_roi → chung 1 anh crop → chung 1 forward pass.
+
+    Args:
+        roi_rules: Danh sach rule tu load_product_csv()
+
+    Returns:
+        Dict: {model_name: [entry, ...]} voi entry:
+            {
+                "camera": str,
+                "detect_roi": (x1, y1, x2, y2),
+                "iou": float hoac None,
+                "max_det": int hoac None,
+                "imgsz": int hoac None,
+                "rules": [rule, ...]   # cac rule chia se inference nay
+            }
+    """
+    plan = {}
+    entries = {}  # (camera, model_name, detect_roi, iou, max_det, imgsz) -> entry
+
+    for rule in roi_rules:
+        key = (rule["camera"], rule["model_name"], tuple(rule["detect_roi"]),
+               rule.get("iou"), rule.get("max_det"), rule.get("imgsz"))
+        entry = entries.get(key)
+        if entry is None:
+            entry = {
+                "camera": rule["camera"],
+                "detect_roi": tuple(rule["detect_roi"]),
+                "iou": rule.get("iou"),
+                "max_det": rule.get("max_det"),
+                "imgsz": rule.get("imgsz"),
+                "rules": []
+            }
+            entries[key] = entry
+            plan.setdefault(rule["model_name"], []).append(entry)
+        entry["rules"].append(rule)
+
+    return plan
+
+
+def print_inference_plan(plan: Dict[str, List[Dict]]) -> None:
+    """In tom tat: bao nhieu rule → bao nhieu lan inference"""
+    total_rules = sum(len(e["rules"]) for entries in plan.values() for e in entries)
+    total_infer = sum(len(entries) for entries in plan.values())
+    print(f"[BATCH_DETECT] Inference plan: {total_rules} rules → {total_infer} crops")
+    for model_name, entries in plan.items():
+        print(f"  {model_name}: {len(entries)} crops")
+
+
+def run_batch_detection(images: Dict[str, Any], roi_rules: List[Dict],
+                        cameras: Optional[List[str]] = None,
+                        plan: Optional[Dict[str, List[Dict]]] = None,
+                        stride_align: bool = False,
+                        auto_imgsz: bool = False,
+                        executor: Optional[Executor] = None) -> Dict[str, List[Dict]]:
+    """
+    Crop + detect tat ca ROI cua 1 batch, moi model chi goi 1 lan,
+    moi (camera, model, detect_roi) chi infer 1 lan.
+
+    Args:
+        images: {"CAM1": anh, "CAM2": anh, ...}
+        roi_rules: Danh sach rule tu load_product_csv()
+        cameras: Thu tu camera tra ve (mac dinh: thu tu trong images)
+        plan: Ket qua build_inference_plan(roi_rules) (None → tu tinh)
+        stride_align: Pad crop (phai/duoi) thanh boi so stride cua model
+        auto_imgsz: Rule khong co imgsz → chay dung kich thuoc crop (khong upscale)
+        executor: ThreadPoolExecutor de goi cac model song song (None → tuan tu)
+
+    Returns:
+        Dict: {"CAM1": [item, ...], ...} - item giu dung thu tu rule trong CSV:
+            {
+                "rule": dict,
+                "roi_data": dict tu prepare_roi_data() (None neu loi crop),
+                "detect_result": dict tu detect_object() (None neu loi),
+                "error": Exception hoac None
+            }
+    """
+    items_by_cam, calls = prepare_batch_calls(images, roi_rules, cameras, plan,
+                                              stride_align, auto_imgsz)
+
+    # Executor (VD: khi dung InferencePool) → cac model chay song song
+    if executor is not None:
+        list(executor.map(run_batch_call, calls))
+    else:
+        for call in calls:
+            run_batch_call(call)
+
+    return items_by_cam
+
+
+def prepare_batch_calls(images: Dict[str, Any], roi_rules: List[Dict],
+                        cameras: Optional[List[str]] = None,
+                        plan: Optional[Dict[str, List[Dict]]] = None,
+                        stride_align: bool = False,
+                        auto_imgsz: bool = False) -> tuple:
+    """
+    Buoc 1-3 cua run_batch_detection(): load model, crop, gom thanh cac lan goi model
+    (chua inference). Dung khi can tu quyet dinh thu tu chay (VD: fail-fast).
+
+    Returns:
+        tuple: (items_by_cam, calls) voi call:
+            {"model", "model_name", "jobs", "iou", "max_det", "imgsz"}
+            → run_batch_call(call) ghi detect_result vao cac item cua call
+    """
+    if cameras is None:
+        cameras = list(images.keys())
+    if plan is None:
+        plan = build_inference_plan(roi_rules)
+
+    # Item cho tung rule, giu thu tu CSV
+    items_by_cam = {cam: [] for cam in cameras}
+    item_of_rule = {}
+    for rule in roi_rules:
+        if rule["camera"] in items_by_cam:
+            item = {"rule": rule, "roi_data": None, "detect_result": None, "error": None}
+            items_by_cam[rule["camera"]].append(item)
+            item_of_rule[id(rule)] = item
+
+    calls = []  # 1 lan goi model / call
+    for model_name, entries in plan.items():
+        entries = [entry for entry in entries if entry["camera"] in items_by_cam]
+        if not entries:
+            continue
+
+        # --- Buoc 1: Load model (lay stride de pad crop) ---
+        try:
+            model = get_model(model_name)
+        except Exception as e:
+            for entry in entries:
+                _set_error([item_of_rule[id(rule)] for rule in entry["rules"]], e)
+            continue
+        stride = get_model_stride(model) if stride_align else 0
+
+        # --- Buoc 2: Crop 1 lan / entry ---
+        jobs = []
+        for entry in entries:
+            entry_items = [item_of_rule[id(rule)] for rule in entry["rules"]]
+
+            try:
+                roi_data = prepare_roi_data(images[entry["camera"]], entry["rules"][0], stride=stride)
+                if roi_data["detect_image"].size == 0:
+                    raise ValueError(f"Empty detect_roi {entry['detect_roi']}")
+            except Exception as e:
+                _set_error(entry_items, e)
+                continue
+
+            for item in entry_items:
+                item["roi_data"] = dict(roi_data, rule=item["rule"])
+
+            imgsz = entry["imgsz"]
+            if imgsz is None and auto_imgsz:
+                # Khong upscale: chay dung kich thuoc crop (da boi so stride)
+                imgsz = max(roi_data["infer_image"].shape[:2])
+
+            jobs.append({
+                "entry": entry,
+                "items": entry_items,
+                "image": roi_data["infer_image"],
+                "imgsz": imgsz,
+            })
+
+        # --- Buoc 3: Moi model 1 lan inference (/ bo tham so iou, max_det, imgsz) ---
+        call_groups = {}  # (iou, max_det, imgsz) -> [job, ...]
+        for job in jobs:
+            key = (job["entry"]["iou"], job["entry"]["max_det"], job["imgsz"])
+            call_groups.setdefault(key, []).append(job)
+
+        for (iou, max_det, imgsz), group_jobs in call_groups.items():
+            calls.append({
+                "model": model,
+                "model_name": model_name,
+                "jobs": group_jobs,
+                "iou": iou,
+                "max_det": max_det,
+                "imgsz": imgsz,
+            })
+
+    return items_by_cam, calls
+
+
+def run_batch_call(call: Dict) -> List[Dict]:
+    """
+    Chay 1 lan goi model (giu lock cua model) + fan-out ket qua cho tung rule.
+
+    Returns:
+        List item cua call (da co detect_result hoac error)
+    """
+    with model_lock(call["model_name"]):
+        raws = _infer_jobs(call["model"], call["model_name"], call["jobs"],
+                           call["iou"], call["max_det"], call["imgsz"])
+
+    # --- Buoc 4: Fan-out ket qua tho → tung rule ---
+    for job, raw in zip(call["jobs"], raws):
+        if raw is None:
+            continue
+        for item in job["items"]:
+            rule = item["rule"]
+            try:
+                item["detect_result"] = select_detection(
+                    raw,
+                    rule["class_id"],
+                    rule["confidence"],
+                    roi_offset=_roi_offset(rule)
+                )
+            except Exception as e:
+                item["error"] = e
+
+    return [item for job in call["jobs"] for item in job["items"]]
+
+
+def _infer_jobs(model: Any, model_name: str, jobs: List[Dict],
+                iou: Optional[float], max_det: Optional[int],
+                imgsz: Optional[int]) -> List[Optional[Dict]]:
+    """
+    1 lan goi model cho list crop. Loc class = hop cac class_id cua cac rule,
+    conf = nguong thap nhat (select_detection() loc lai theo tung rule).
+    Loi → chay lai tung crop, crop loi tra ve None (da ghi error vao item).
+    """
+    rules = [item["rule"] for job in jobs for item in job["items"]]
+    infer_kwargs = {
+        "classes": sorted({rule["class_id"] for rule in rules}),
+        "conf": min(rule["confidence"] for rule in rules),
+        "iou": iou,
+        "max_det": max_det,
+        "imgsz": imgsz,
+    }
+
+    try:
+        return infer_raw(model, [job["image"] for job in jobs], **infer_kwargs)
+    except Exception as e:
+        # Batch loi → chay lai tung crop de co lap ROI gay loi
+        print(f"[BATCH_DETECT] WARNING: batch inference '{model_name}' failed ({e}), fallback per ROI")
+
+    raws = []
+    for job in jobs:
+        try:
+            raws.append(infer_raw(model, [job["image"]], **infer_kwargs)[0])
+        except Exception as e:
+            _set_error(job["items"], e)
+            raws.append(None)
+    return raws
+
+
+def _set_error(items: List[Dict], error: Exception) -> None:
+    """Ghi loi cho tat ca item trong nhom"""
+    for item in items:
+        item["error"] = error
+
+
+def _roi_offset(rule: Dict) -> tuple:
+    """Offset = goc tren-trai cua detect_roi"""
+    detect_roi = rule["detect_roi"]
+    return (detect_roi[0], detect_roi[1])
+
+
+def report_imgsz_savings(images: Dict[str, Any], roi_rules: List[Dict],
+                         plan: Optional[Dict[str, List[Dict]]] = None,
+                         stride_align: bool = True,
+                         repeats: int = 5) -> List[Dict]:
+    """
+    Do thoi gian inference cua tung crop o imgsz mac dinh vs imgsz cua rule
+    (rule khong co imgsz → dung kich thuoc crop), in bang thoi gian tiet kiem.
+    Dung de chon imgsz nho nhat ma van giu duoc do chinh xac.
+
+    Returns:
+        List[Dict]: [{"roi_ids", "camera", "crop_size", "imgsz",
+                      "default_ms", "imgsz_ms", "saved_ms"}, ...]
+    """
+    if plan is None:
+        plan = build_inference_plan(roi_rules)
+
+    report = []
+    for model_name, entries in plan.items():
+        model = get_model(model_name)
+        stride = get_model_stride(model) if stride_align else 0
+
+        for entry in entries:
+            if entry["camera"] not in images:
+                continue
+            roi_data = prepare_roi_data(images[entry["camera"]], entry["rules"][0], stride=stride)
+            crop = roi_data["infer_image"]
+            if crop.size == 0:
+                continue
+
+            imgsz = entry["imgsz"] or max(crop.shape[:2])
+            timings = benchmark_imgsz(model, crop, [None, imgsz], repeats=repeats)
+            report.append({
+                "roi_ids": [rule["roi_id"] for rule in entry["rules"]],
+                "camera": entry["camera"],
+                "crop_size": (crop.shape[1], crop.shape[0]),
+                "imgsz": imgsz,
+                "default_ms": timings[None],
+                "imgsz_ms": timings[imgsz],
+                "saved_ms": timings[None] - timings[imgsz],
+            })
+
+    print("=" * 90)
+    print(f"{'ROI':<24} {'CAM':<6} {'CROP':<11} {'IMGSZ':>6} {'DEFAULT(ms)':>12} {'IMGSZ(ms)':>10} {'SAVED(ms)':>10}")
+    print("-" * 90)
+    for row in report:
+        crop_str = f"{row['crop_size'][0]}x{row['crop_size'][1]}"
+        print(f"{','.join(row['roi_ids']):<24} {row['camera']:<6} {crop_str:<11} {row['imgsz']:>6} "
+              f"{row['default_ms']:>12.1f} {row['imgsz_ms']:>10.1f} {row['saved_ms']:>10.1f}")
+    print("=" * 90)
+
+    return report
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """
+    Bao cao imgsz cho 1 product:
+        python -m modules.batch_detector config/products/ABC123x.csv CAM1=cam1.jpg CAM2=cam2.jpg
+    """
+    import sys
+    import cv2
+    from modules.csv_loader import load_product_csv
+
+    if len(sys.argv) < 3:
+        print(main.__doc__)
+        return
+
+    roi_rules = load_product_csv(sys.argv[1])
+    images = {}
+    for arg in sys.argv[2:]:
+        cam, path = arg.split("=", 1)
+        image = cv2.imread(path)
+        if image is None:
+            print(f"[ERROR] Cannot read image: {path}")
+            return
+        images[cam] = image
+
+    plan = build_inference_plan(roi_rules)
+    print_inference_plan(plan)
+    report_imgsz_savings(images, roi_rules, plan)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,29 @@ CÁCH DÙNG:
     # Lấy đường dẫn CAM1
     cam1_input = config["CAM1"]["input_folder"]
     cam1_temp = config["CAM1"]["temp_folder"]
+    cam1_ext = config["CAM1"]["extensions"]     # (".jpg", ".png")
+
+Cột "extensions" (tùy chọn): đuôi file ảnh cách nhau bởi ";" (VD: "jpg;png;bmp")
 """
 
 import csv
 import os
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
+
+DEFAULT_EXTENSIONS = (".jpg", ".png")
+
+
+def parse_extensions(value: str) -> Tuple[str, ...]:
+    """
+    "jpg;.PNG" → (".jpg", ".png"). Rỗng → DEFAULT_EXTENSIONS
+    """
+    extensions = []
+    for ext in (value or "").replace(",", ";").split(";"):
+        ext = ext.strip().lower()
+        if ext:
+            extensions.append(ext if ext.startswith(".") else "." + ext)
+    return tuple(extensions) or DEFAULT_EXTENSIONS
 
 
 def validate_camera_folder(folder_path: str) -> bool:
@@ -51,7 +68,8 @@ def load_camera_config(
             "CAM1": {
                 "input_folder": "images/temp/CAM1",
                 "temp_folder": "images/process_temp/CAM1",
-                "enabled": True
+                "enabled": True,
+                "extensions": (".jpg", ".png")
             },
             "CAM2": {...},
             ...
@@ -83,6 +101,7 @@ def load_camera_config(
                 input_folder = row.get("input_folder", "").strip()
                 temp_folder = row.get("temp_folder", "").strip()
                 enabled = row.get("enabled", "true").strip().lower() == "true"
+                extensions = parse_extensions(row.get("extensions"))
                 
                 # Bỏ qua dòng với camera_name trống
                 if not camera_name:
@@ -97,7 +116,8 @@ def load_camera_config(
                 config[camera_name] = {
                     "input_folder": input_folder,
                     "temp_folder": temp_folder,
-                    "enabled": enabled
+                    "enabled": enabled,
+                    "extensions": extensions
                 }
                 
                 if verbose:
@@ -166,6 +186,17 @@ def get_camera_folder(
     return folder
 
 
+def get_camera_extensions(camera_name: str, config: Dict[str, Dict[str, str]]) -> Tuple[str, ...]:
+    """
+    Lấy đuôi file ảnh của camera (không có cấu hình → DEFAULT_EXTENSIONS)
+    
+    Ví dụ:
+        >>> get_camera_extensions("CAM1", config)
+        ('.jpg', '.png')
+    """
+    return config.get(camera_name, {}).get("extensions", DEFAULT_EXTENSIONS)
+
+
 def get_enabled_cameras(config: Dict[str, Dict[str, str]]) -> list:
     """
     Lấy danh sách camera được bật (enabled=true)
@@ -1,5 +1,7 @@
 def get_used_cameras(roi_rules):
-    cameras = set()
+    # Giu thu tu xuat hien trong CSV → thu tu xu ly / ket qua co dinh giua cac lan chay
+    cameras = []
     for rule in roi_rules:
-        cameras.add(rule["camera"])
-    return list(cameras)
+        if rule["camera"] not in cameras:
+            cameras.append(rule["camera"])
+    return cameras
@@ -12,7 +12,7 @@ Chi import: serial (pyserial), threading
 
 import time
 import threading
-from typing import Optional
+from typing import Callable, Optional
 from collections import deque
 
 
@@ -46,7 +46,8 @@ class COMProductReader:
                  baudrate: int = 9600,
                  timeout: float = 1.0,
                  mode: str = "latest",
-                 poll_interval: float = 0.5):
+                 poll_interval: float = 0.5,
+                 on_receive: Optional[Callable[[str], None]] = None):
         """
         Args:
             port: Ten cong COM (VD: "COM4")
@@ -54,12 +55,14 @@ class COMProductReader:
             timeout: Timeout doc (giay)
             mode: "latest" hoac "queue"
             poll_interval: Thoi gian poll (giay)
+            on_receive: Callback(product_code) sau moi lan nhan (VD: danh thuc vong lap chinh)
         """
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.mode = mode
         self.poll_interval = poll_interval
+        self.on_receive = on_receive
         
         self.serial_port = None
         self.is_connected = False
@@ -150,6 +153,8 @@ class COMProductReader:
                         self.total_received += 1
                     
                     print(f"[COM_INPUT] Received: '{product_code}' (Total: {self.total_received})")
+                    if self.on_receive is not None:
+                        self.on_receive(product_code)
                 
                 # Cho poll_interval
                 time.sleep(self.poll_interval)
@@ -4,13 +4,18 @@ Chuc nang: Gui tin hieu OK/NG qua cong COM den thiet bi ngoai (PLC, Arduino,...)
     - Retry mechanism: Thu lai neu that bai
     - Error handling: Log warning nhung khong crash he thong
     - Don gian, de debug
+    - Thread-safe: 1 lenh gui tai 1 thoi diem (nhieu stage pipeline cung gui)
+    - OrderedVerdictSender: gui ket qua dung thu tu batch (PLC nhan OK/NG theo thu tu san pham)
 
 Khong phu thuoc module khac trong project.
-Chi import: serial (pyserial)
+Chi import: serial (pyserial), perf_stats
 """
 
 import time
-from typing import Optional
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from modules.perf_stats import timed
 
 
 class COMOutput:
@@ -53,6 +58,7 @@ class COMOutput:
         
         self.serial_port = None
         self.is_connected = False
+        self._lock = threading.Lock()   # Khong cho 2 thread ghi cong COM cung luc
         
         # Thong ke
         self.total_sent = 0
@@ -105,6 +111,7 @@ class COMOutput:
             self.enabled = False
             return False
     
+    @timed("com_send")
     def send_result(self, status: str, extra_info: str = "") -> bool:
         """
         Gui ket qua qua COM.
@@ -120,6 +127,11 @@ class COMOutput:
             - Don gian: "OK\r\n" hoac "NG\r\n"
             - Co extra: "OK,BATCH5\r\n"
         """
+        with self._lock:
+            return self._send(status, extra_info)
+    
+    def _send(self, status: str, extra_info: str) -> bool:
+        """Gui (da giu lock) - xem send_result"""
         if not self.enabled:
             return True  # Khong bao loi neu da tat
         
@@ -211,6 +223,78 @@ class COMOutput:
             pass
 
 
+class OrderedVerdictSender:
+    """
+    Gui ket qua theo dung thu tu batch (1 ket qua / batch).
+    Nhieu stage co the co ket qua (fail-fast NG o stage inference, fast verdict o
+    judgement, con lai o persistence) → ket qua batch N+1 co truoc duoc giu lai,
+    chi gui sau khi batch N da gui.
+    
+    Cach dung:
+        sender = OrderedVerdictSender(com)
+        sender.submit(2, "NG")                    # Giu lai (batch 1 chua co ket qua)
+        sender.submit(1, "OK")                    # Gui "OK" roi "NG"
+        sender.submit(4, "OK", release=True)      # Batch 3 bi mat (loi stage) → gui NG cho 3, roi OK
+    """
+    
+    def __init__(self, com_output, first_seq: int = 1, lost_status: str = "NG"):
+        """
+        Args:
+            com_output: COMOutput (hoac object co send_result)
+            first_seq: So batch dau tien
+            lost_status: Ket qua gui cho batch bi mat (loi giua chung, khong co ket qua)
+        """
+        self.com_output = com_output
+        self.lost_status = lost_status
+        self._next_seq = first_seq
+        self._waiting: Dict[int, Tuple[str, Optional[Callable[[], None]]]] = {}
+        self._lock = threading.Lock()
+        
+        # Thong ke
+        self.total_held = 0   # Ket qua phai cho batch truoc
+        self.total_lost = 0   # Batch khong co ket qua (gui lost_status)
+    
+    def submit(self, seq: int, status: str, on_sent: Optional[Callable[[], None]] = None,
+               release: bool = False) -> bool:
+        """
+        Nop ket qua cua batch seq (gui ngay neu den luot, nguoc lai giu lai).
+        
+        Args:
+            seq: So batch
+            status: "OK" / "NG"
+            on_sent: Goi ngay sau khi gui (VD: ghi thoi diem verdict)
+            release: True → moi batch truoc seq da xong (stage cuoi, theo thu tu),
+                     batch truoc chua co ket qua = bi mat → gui lost_status
+            
+        Returns:
+            bool: False neu batch da nop ket qua truoc do (bo qua)
+        """
+        with self._lock:
+            if seq < self._next_seq or seq in self._waiting:
+                return False
+            self._waiting[seq] = (status, on_sent)
+            if release:
+                for lost in range(self._next_seq, seq):
+                    if lost not in self._waiting:
+                        self.total_lost += 1
+                        print(f"[COM] WARNING: Batch {lost} has no result, sending {self.lost_status}")
+                        self._waiting[lost] = (self.lost_status, None)
+            if seq != self._next_seq:
+                self.total_held += 1
+            while self._next_seq in self._waiting:
+                status, callback = self._waiting.pop(self._next_seq)
+                self.com_output.send_result(status)
+                if callback is not None:
+                    callback()
+                self._next_seq += 1
+            return True
+    
+    def pending(self) -> int:
+        """So ket qua dang giu lai"""
+        with self._lock:
+            return len(self._waiting)
+
+
 # ============================================================================
 # TEST
 # ============================================================================
@@ -238,6 +322,16 @@ def main():
     com2 = COMOutput(port="COM3", enabled=False)
     com2.send_ok()  # Khong gui gi, khong bao loi
     
+    print("\n[5] Ordered verdicts (batch 2 NG truoc batch 1 OK)...")
+    sender = OrderedVerdictSender(com2)
+    sent = []
+    com2.send_result = lambda status, extra_info="": sent.append(status) or True
+    sender.submit(2, "NG")
+    sender.submit(1, "OK")
+    sender.submit(4, "OK", release=True)
+    assert sent == ["OK", "NG", "NG", "OK"], sent
+    print(f"  Sent: {sent} (lost: {sender.total_lost})")
+    
     com.close()
     com2.close()
     
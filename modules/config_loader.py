@@ -34,7 +34,75 @@ def get_default_config() -> Dict[str, Any]:
         'camera': {
             'config_csv': 'config/camera_config.csv',
             'create_folders': True,
-            'poll_interval': 0.5
+            'watcher_backend': 'auto',
+            'poll_interval': 0.02,
+            'event_timeout': 0.2,
+            'overload_policy': 'process_all',
+            'max_pending': 10,
+            'handoff': 'copy',
+            'checkpoint_dir': '',
+            'checkpoint_interval': 1.0,
+            'settle_ms': 50,
+            'ready_timeout': 3.0,
+            'check_trailer': True
+        },
+        'inference': {
+            'backend': 'ultralytics',
+            'onnx_cache_dir': 'models/onnx_cache',
+            'onnx_threads': 0,
+            'stride_align': True,
+            'auto_imgsz': False,
+            'preload': True,
+            'warmup': True,
+            'fake': {
+                'latency_ms': 20,
+                'latency_per_image_ms': 2
+            }
+        },
+        'inference_pool': {
+            'enabled': False,
+            'workers': 2,
+            'threads_per_worker': 2,
+            'request_timeout': 30,
+            'model_assignment': {}
+        },
+        'parallel': {
+            'camera_workers': 3
+        },
+        'fail_fast': {
+            'enabled': False,
+            'remaining': 'skip',
+            'state_file': 'output/roi_stats.json',
+            'save_interval': 20,
+            'ema_alpha': 0.1
+        },
+        'pipeline': {
+            'queue_size': 2,
+            'stats_interval': 50,
+            'fast_verdict': True
+        },
+        'perf_stats': {
+            'enabled': True,
+            'window': 2000,
+            'snapshot_file': 'output/logs/perf_stats.jsonl',
+            'snapshot_interval': 60
+        },
+        'metrics': {
+            'enabled': False,
+            'host': '127.0.0.1',
+            'port': 9108
+        },
+        'batch_assembly': {
+            'match': 'arrival',
+            'pattern': '',
+            'window_ms': 200,
+            'timeout': 2.0,
+            'max_open': 8,
+            'reset_gap': 100
+        },
+        'model_cache': {
+            'max_entries': 6,
+            'max_memory_mb': 0
         },
         'com_output': {
             'enabled': True,
@@ -45,7 +113,8 @@ def get_default_config() -> Dict[str, Any]:
         'gui': {
             'enabled': True,
             'window_name': 'VisionAI - {product_code}',
-            'max_history': 10
+            'max_history': 10,
+            'headless_wait': 1.0
         }
     }
 
@@ -67,6 +67,13 @@ def load_product_csv(csv_path):
                     "keypoint_idx_2": _parse_optional_int(row.get("keypoint_idx_2")),
                     "expected_angle": _parse_optional_float(row.get("expected_angle")),
                     "angle_tolerance": _parse_optional_float(row.get("angle_tolerance")),
+
+                    # Tham so NMS khi inference (optional - de trong = mac dinh ultralytics)
+                    "iou": _parse_optional_float(row.get("iou")),
+                    "max_det": _parse_optional_int(row.get("max_det")),
+
+                    # Kich thuoc anh inference (optional - de trong = mac dinh ultralytics)
+                    "imgsz": _parse_optional_int(row.get("imgsz")),
                 }
 
                 roi_rules.append(rule)
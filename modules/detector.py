@@ -1,26 +1,40 @@
 """
 Module: detector
-Chuc nang: Detect object bang YOLO
-Khong phu thuoc: Chi import ultralytics
+Chuc nang: Detect object bang YOLO (qua InferenceEngine: ultralytics / onnx / fake)
+Khong phu thuoc: Chi import numpy, inference_engine, perf_stats
 """
 
-from ultralytics import YOLO
-from typing import Dict, Tuple, Any, Optional
+import time
+import numpy as np
+from typing import Dict, List, Tuple, Any, Optional
 
+from modules.inference_engine import InferenceEngine
+from modules.perf_stats import timed
 
-def detect_object(model: YOLO, image: Any, class_id: int, conf_thres: float,
-                  roi_offset: Tuple[int, int] = (0, 0)) -> Dict[str, Any]:
+
+@timed("detect_object")
+def detect_object(model: InferenceEngine, image: Any, class_id: int, conf_thres: float,
+                  roi_offset: Tuple[int, int] = (0, 0),
+                  iou: Optional[float] = None,
+                  max_det: Optional[int] = None,
+                  imgsz: Optional[int] = None) -> Dict[str, Any]:
     """
     Detect object trong anh bang YOLO
     
     Args:
-        model: Model YOLO
+        model: Engine inference (tu model_manager.get_model())
         image: Anh (numpy array)
         class_id: ID class can detect (VD: 0)
         conf_thres: Nguong tin cay [0.0-1.0]
         roi_offset: Toa do goc cua anh crop tren anh goc: (x_offset, y_offset)
                    Dung de chuyen toa do tu anh crop sang anh goc
                    VD: Neu crop tu (100, 150), offset=(100, 150)
+        iou: Nguong IoU cua NMS (None = mac dinh ultralytics)
+        max_det: So box toi da sau NMS (None = mac dinh ultralytics)
+        imgsz: Kich thuoc anh inference (None = mac dinh ultralytics)
+    
+    class_id + conf_thres duoc truyen thang vao model → NMS chi xu ly
+    class can kiem tra, khong ton cong cho ca vocabulary cua model.
     
     Returns:
         Dict:
@@ -28,43 +42,108 @@ def detect_object(model: YOLO, image: Any, class_id: int, conf_thres: float,
             - Neu khong: {"found": False, "bbox": None, "confidence": 0.0}
             
             Luu y: bbox la toa do TUYET DOI tren anh goc!
+            Nhieu box khop → lay box co confidence cao nhat.
+    """
+    raw = infer_raw(model, [image], classes=[class_id], conf=conf_thres,
+                    iou=iou, max_det=max_det, imgsz=imgsz)[0]
+    return select_detection(raw, class_id, conf_thres, roi_offset)
+
+
+@timed("inference")
+def infer_raw(model: InferenceEngine, images: List[Any],
+              classes: Optional[List[int]] = None,
+              conf: Optional[float] = None,
+              iou: Optional[float] = None,
+              max_det: Optional[int] = None,
+              imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Chay model 1 lan cho list anh, tra ve ket qua tho (chua loc theo tung rule).
+    Dung khi nhieu rule chia se cung 1 anh crop: infer 1 lan, loc nhieu lan
+    bang select_detection().
+    
+    Args:
+        model: Engine inference (tu model_manager.get_model())
+        images: Danh sach anh
+        classes: Chi giu cac class nay trong NMS (None = tat ca)
+        conf: Nguong tin cay trong NMS (None = mac dinh ultralytics)
+        iou: Nguong IoU cua NMS (None = mac dinh ultralytics)
+        max_det: So box toi da / anh (None = mac dinh ultralytics)
+        imgsz: Kich thuoc anh inference (None = mac dinh ultralytics)
+    
+    Returns:
+        List ket qua tho dang numpy (xem inference_engine), 1 phan tu / anh
+    """
+    if not images:
+        return []
+    
+    return model.infer(list(images), classes=classes, conf=conf,
+                       iou=iou, max_det=max_det, imgsz=imgsz)
+
+
+def select_detection(raw: Dict[str, Any], class_id: int, conf_thres: float,
+                     roi_offset: Tuple[int, int] = (0, 0)) -> Dict[str, Any]:
+    """
+    Loc ket qua tho (tu infer_raw) theo class_id + conf_thres cua 1 rule:
+    loc bang mask, lay box co confidence CAO NHAT (on dinh khi nhieu box khop),
+    chuyen toa do tu anh crop sang anh goc.
+    
+    Returns:
+        Dict cung format voi detect_object()
     """
-    results = model(image, verbose=False)
+    mask = (raw["cls"] == class_id) & (raw["conf"] >= conf_thres)
+    if not mask.any():
+        return _empty_result()
+    
+    candidates = np.flatnonzero(mask)
+    # argmax tra ve phan tu dau tien neu bang nhau → ket qua xac dinh
+    idx = candidates[np.argmax(raw["conf"][candidates])]
     
     x_offset, y_offset = roi_offset
+    
+    # Toa do tren anh crop (cat phan le nhu int()) + offset → toa do anh goc
+    bbox = raw["xyxy"][idx].astype(int) + np.array([x_offset, y_offset, x_offset, y_offset])
+    
+    keypoints = None
+    if raw["keypoints"] is not None:
+        kp = raw["keypoints"][idx].astype(np.float64)
+        kp[:, 0] += x_offset
+        kp[:, 1] += y_offset
+        keypoints = [tuple(p) for p in kp.tolist()]
+    
+    return {
+        "found": True,
+        "bbox": tuple(int(v) for v in bbox),
+        "confidence": float(raw["conf"][idx]),
+        "keypoints": keypoints
+    }
+
 
-    for r in results:
-        for idx, box in enumerate(r.boxes):
-            if int(box.cls[0]) == class_id and box.conf[0] >= conf_thres:
-                # Toa do tren anh crop
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                
-                # Chuyen thanh toa do tuyet doi tren anh goc
-                x1_real = x1 + x_offset
-                y1_real = y1 + y_offset
-                x2_real = x2 + x_offset
-                y2_real = y2 + y_offset
-                
-                keypoints = None
-                if r.keypoints is not None:
-                    try:
-                        kp_data = r.keypoints.data[idx]
-                        keypoints = []
-                        for kp in kp_data:
-                            kx = float(kp[0]) + x_offset
-                            ky = float(kp[1]) + y_offset
-                            kconf = float(kp[2]) if len(kp) > 2 else 0.0
-                            keypoints.append((kx, ky, kconf))
-                    except Exception:
-                        keypoints = None
-
-                return {
-                    "found": True,
-                    "bbox": (x1_real, y1_real, x2_real, y2_real),
-                    "confidence": float(box.conf[0]),
-                    "keypoints": keypoints
-                }
+def get_model_stride(model: InferenceEngine, default: int = 32) -> int:
+    """Lay stride lon nhat cua model (YOLO thuong la 32)"""
+    return int(getattr(model, "stride", default) or default)
 
+
+def benchmark_imgsz(model: InferenceEngine, image: Any, imgsz_list: List[Optional[int]],
+                    repeats: int = 5) -> Dict[Optional[int], float]:
+    """
+    Do thoi gian inference trung binh (ms) cua 1 anh o tung imgsz.
+    Lan chay dau (warm-up) khong tinh.
+    
+    Returns:
+        Dict: {imgsz: ms} (imgsz=None la mac dinh ultralytics)
+    """
+    timings = {}
+    for imgsz in imgsz_list:
+        infer_raw(model, [image], imgsz=imgsz)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            infer_raw(model, [image], imgsz=imgsz)
+        timings[imgsz] = (time.perf_counter() - start) * 1000.0 / repeats
+    return timings
+
+
+def _empty_result() -> Dict[str, Any]:
+    """Ket qua khi khong tim thay object"""
     return {
         "found": False,
         "bbox": None,
@@ -79,8 +158,6 @@ def detect_object(model: YOLO, image: Any, class_id: int, conf_thres: float,
 
 def main():
     """Test function - kiem tra la toa do offset hoat dong dung"""
-    import numpy as np
-    
     print("[TEST] Detector - Coordinate Offset\n")
     
     print("[SCENARIO]")
@@ -0,0 +1,309 @@
+"""
+Module: frame_tracker
+Chuc nang: Nho anh da nhan / da xu ly cua 1 camera (thay set ten file khong gioi han)
+    - cursor = (mtime, ten) anh moi nhat da nhan: anh cu hon cursor - window giay
+      → coi nhu da nhan, khong can nho ten
+    - Chi nho ten anh trong window giay truoc cursor (camera ghi gan cung luc,
+      mtime khong dung thu tu) + anh dang xu ly → bo nho theo so anh / window giay,
+      khong tang theo thoi gian chay
+    - Checkpoint (tuy chon): file JSON nho / camera, chi ghi anh DA XU LY XONG
+      → restart: anh dang cho / dang xu ly luc tat duoc xu ly lai,
+      anh da xong khong lap lai, anh moi trong luc tat duoc xu ly tiep
+    - Ghi checkpoint atomic (file tam + os.replace), toi da 1 lan / interval giay
+    - Thread-safe: ingest goi mark(), stage persist goi done()
+    - Anh dang xu ly qua inflight_timeout giay ma chua done() (batch bi mat) → bo,
+      khong giu floor cua checkpoint mai mai
+
+Khong phu thuoc module khac
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class FrameTracker:
+    """
+    Cach dung:
+        tracker = FrameTracker(window=5.0, checkpoint_path="checkpoints/CAM1.json")
+        if not tracker.load():
+            tracker.start_after(existing_files)   # [(ten, mtime), ...] → bo qua anh cu
+        if not tracker.seen(name, mtime):
+            tracker.mark(name, mtime)             # Da nhan, dang xu ly
+        tracker.done(name)                        # Xu ly xong (hoac bi bo)
+        tracker.save()
+    """
+
+    def __init__(self, window: float = 5.0, checkpoint_path: Optional[str] = None,
+                 checkpoint_interval: float = 1.0, inflight_timeout: float = 300.0):
+        """
+        Args:
+            window: Do lech mtime toi da giua cac anh ghi gan cung luc (giay)
+            checkpoint_path: File JSON luu tien do (None = khong luu)
+            checkpoint_interval: Khoang cach toi thieu giua 2 lan ghi checkpoint (giay)
+            inflight_timeout: Anh da mark() qua N giay ma chua done() → coi nhu mat, bo (0 = khong bo)
+        """
+        self.window = window
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.inflight_timeout = inflight_timeout
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()   # 1 thread ghi file tai 1 thoi diem
+
+        self.cursor: Tuple[float, str] = (0.0, "")    # Anh moi nhat da nhan
+        self._recent: Dict[str, float] = {}            # Anh da nhan trong window truoc cursor
+        self._inflight: Dict[str, float] = {}          # Da nhan, chua xu ly xong
+        self._marked_at: Dict[str, float] = {}         # Thoi diem mark() cua anh dang xu ly
+        self._done_cursor: Tuple[float, str] = (0.0, "")
+        self._done: Dict[str, float] = {}              # Anh da xong, chua qua floor cua checkpoint
+        self._dirty = False
+        self._last_save = 0.0
+
+        # Thong ke
+        self.total_saves = 0
+        self.total_save_errors = 0
+        self.total_expired = 0       # Anh dang xu ly qua inflight_timeout (khong bao gio done)
+
+    # ==================================================================
+    # PUBLIC METHODS
+    # ==================================================================
+
+    def seen(self, name: str, mtime: Optional[float] = None) -> bool:
+        """
+        Anh da nhan chua.
+        mtime None → chi kiem tra ten (truoc khi stat file, re hon).
+        Co mtime → anh cu hon cursor - window cung tinh la da nhan: chi dung cho file
+        co tu luc khoi dong / checkpoint (mtime khong dang tin voi anh moi den: copy giu
+        mtime, dong ho camera lech) - ImageWatcher nhan anh moi theo ten.
+        """
+        with self._lock:
+            if name in self._recent or name in self._inflight:
+                return True
+            return mtime is not None and mtime < self.cursor[0] - self.window
+
+    def mark(self, name: str, mtime: float) -> None:
+        """Da nhan anh (dang cho / dang xu ly)"""
+        with self._lock:
+            self._inflight[name] = mtime
+            self._marked_at[name] = time.time()
+            self._recent[name] = mtime
+            if (mtime, name) > self.cursor:
+                self.cursor = (mtime, name)
+                self._recent = self._prune(self._recent, self.cursor[0] - self.window)
+
+    def unmark(self, name: str) -> None:
+        """Bo danh dau (VD: copy loi → nhan lai lan quet sau)"""
+        with self._lock:
+            self._inflight.pop(name, None)
+            self._marked_at.pop(name, None)
+            self._recent.pop(name, None)
+
+    def done(self, name: str) -> None:
+        """Anh da xu ly xong (hoac bi bo) → duoc ghi vao checkpoint"""
+        with self._lock:
+            mtime = self._inflight.pop(name, None)
+            self._marked_at.pop(name, None)
+            self._expire_inflight()
+            if mtime is None:
+                return
+            self._done[name] = mtime
+            self._done_cursor = max(self._done_cursor, (mtime, name))
+            self._done = self._prune(self._done, self._floor())
+            self._dirty = True
+        if self.checkpoint_path and time.time() - self._last_save >= self.checkpoint_interval:
+            self.save()
+
+    def start_after(self, files: List[Tuple[str, float]]) -> None:
+        """Bat dau moi (khong co checkpoint): coi cac file dang co la da xu ly"""
+        with self._lock:
+            for name, mtime in files:
+                self.cursor = max(self.cursor, (mtime, name))
+            floor = self.cursor[0] - self.window
+            self._recent = {name: mtime for name, mtime in files if mtime >= floor}
+            self._done = dict(self._recent)
+            self._done_cursor = self.cursor
+            self._inflight, self._marked_at = {}, {}
+            self._dirty = True
+        self.save()
+
+    def load(self) -> bool:
+        """
+        Doc checkpoint (neu co).
+
+        Returns:
+            bool: True neu da khoi phuc tien do tu checkpoint
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            floor = float(data["floor"])
+            done = {str(name): float(mtime) for name, mtime in data.get("done", {}).items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"[TRACKER] WARNING: Invalid checkpoint {self.checkpoint_path} ({e}), starting fresh")
+            return False
+
+        with self._lock:
+            # Anh cu hon floor → da xong; anh trong done → da xong; con lai → xu ly (tiep)
+            self.cursor = self._done_cursor = (floor + self.window, "")
+            self._recent = dict(done)
+            self._done = dict(done)
+            self._inflight, self._marked_at = {}, {}
+            self._dirty = False
+        print(f"[TRACKER] Resumed from {self.checkpoint_path} "
+              f"(floor {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(floor))}, {len(done)} recent)")
+        return True
+
+    def save(self) -> None:
+        """Ghi checkpoint (atomic) neu co thay doi"""
+        if not self.checkpoint_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                self._expire_inflight()
+                if not self._dirty:
+                    return
+                data = {"floor": self._floor(), "done": dict(self._done)}
+                self._dirty = False
+            self._last_save = time.time()
+
+            tmp_path = self.checkpoint_path + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.checkpoint_path)
+                self.total_saves += 1
+            except OSError as e:
+                self.total_save_errors += 1
+                self._dirty = True
+                print(f"[TRACKER] ERROR: Cannot save checkpoint {self.checkpoint_path}: {e}")
+
+    def reset(self) -> None:
+        """Quen het (khong xoa checkpoint, lan save sau se ghi de)"""
+        with self._lock:
+            self.cursor = self._done_cursor = (0.0, "")
+            self._recent, self._inflight, self._done = {}, {}, {}
+            self._marked_at = {}
+            self._dirty = True
+
+    def __len__(self) -> int:
+        """So ten file dang nho"""
+        with self._lock:
+            return len(self._recent.keys() | self._inflight.keys() | self._done.keys())
+
+    def get_stats(self) -> dict:
+        """Lay thong ke"""
+        with self._lock:
+            return {
+                "cursor": self.cursor,
+                "recent": len(self._recent),
+                "inflight": len(self._inflight),
+                "done_window": len(self._done),
+                "checkpoint": self.checkpoint_path,
+                "total_saves": self.total_saves,
+                "total_save_errors": self.total_save_errors,
+                "total_expired": self.total_expired,
+            }
+
+    # ==================================================================
+    # PRIVATE
+    # ==================================================================
+
+    def _expire_inflight(self) -> None:
+        """Bo anh dang xu ly qua inflight_timeout (goi khi da giu _lock)"""
+        if not self.inflight_timeout or not self._marked_at:
+            return
+        deadline = time.time() - self.inflight_timeout
+        expired = [name for name, marked_at in self._marked_at.items() if marked_at < deadline]
+        for name in expired:
+            del self._marked_at[name]
+            self._inflight.pop(name, None)
+            self._dirty = True
+        if expired:
+            self.total_expired += len(expired)
+            print(f"[TRACKER] WARNING: {len(expired)} frame(s) in flight for more than "
+                  f"{self.inflight_timeout:g}s, released: {expired[:3]}")
+
+    def _floor(self) -> float:
+        """mtime ma moi anh cu hon da xu ly xong (tinh ca anh dang xu ly cu nhat)"""
+        oldest = self._done_cursor[0]
+        if self._inflight:
+            oldest = min(oldest, min(self._inflight.values()))
+        return oldest - self.window
+
+    @staticmethod
+    def _prune(files: Dict[str, float], floor: float) -> Dict[str, float]:
+        if all(mtime >= floor for mtime in files.values()):
+            return files
+        return {name: mtime for name, mtime in files.items() if mtime >= floor}
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test: 1000 anh → bo nho chi con anh trong window; restart → xu ly lai anh dang do (assert → loi neu sai)"""
+    import tempfile
+
+    print("[TEST] Frame Tracker\n")
+    path = os.path.join(tempfile.mkdtemp(), "CAM1.json")
+
+    tracker = FrameTracker(window=5.0, checkpoint_path=path, checkpoint_interval=0)
+    tracker.start_after([("old_0001.jpg", 1000.0)])
+    for i in range(1000):
+        name = f"img_{i:04d}.jpg"
+        tracker.mark(name, 2000.0 + i)
+        if i < 998:
+            tracker.done(name)        # 998, 999 dang xu ly luc "tat"
+    # Chi nho anh trong window (mtime cach nhau 1s, window 5s), khong tang theo so anh
+    assert len(tracker) <= 20, tracker.get_stats()
+    assert tracker.get_stats()["inflight"] == 2
+    assert tracker.seen("img_0100.jpg", 2100.0) and tracker.seen("img_0999.jpg")
+    print(f"[OK] Tracked names: {len(tracker)} (1000 frames) | {tracker.get_stats()}")
+    tracker.save()
+    assert tracker.total_save_errors == 0
+
+    restarted = FrameTracker(window=5.0, checkpoint_path=path)
+    assert restarted.load()
+    print("[OK] Resumed from checkpoint")
+    expected = [("old_0001.jpg", 1000.0, True), ("img_0500.jpg", 2500.0, True),
+                ("img_0997.jpg", 2997.0, True), ("img_0998.jpg", 2998.0, False),
+                ("img_0999.jpg", 2999.0, False), ("new_0001.jpg", 3100.0, False)]
+    for name, mtime, skip in expected:
+        assert restarted.seen(name, mtime) == skip, (name, restarted.get_stats())
+        print(f"  {name}: {'skip' if skip else 'process'}")
+
+    # Copy loi → unmark → lan quet sau nhan lai
+    restarted.mark("img_0998.jpg", 2998.0)
+    restarted.unmark("img_0998.jpg")
+    assert not restarted.seen("img_0998.jpg", 2998.0)
+    assert restarted.get_stats()["inflight"] == 0
+    print("[OK] unmark → frame picked up again")
+
+    # 1 anh bi mat (khong bao gio done) → het inflight_timeout thi bo, floor di tiep
+    stuck = FrameTracker(window=5.0, checkpoint_path=path, checkpoint_interval=0, inflight_timeout=0.05)
+    stuck.mark("lost.jpg", 4000.0)
+    time.sleep(0.1)
+    for i in range(5000):
+        name = f"after_{i:04d}.jpg"
+        stuck.mark(name, 4001.0 + i)
+        stuck.done(name)
+    assert stuck.total_expired == 1 and stuck.get_stats()["done_window"] <= 10, stuck.get_stats()
+    print(f"[OK] Lost frame released: {stuck.get_stats()}")
+
+    # Checkpoint hong → bat dau lai (khong crash)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{broken")
+    assert not FrameTracker(checkpoint_path=path).load()
+
+    os.remove(path)
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,91 @@
 """
 Module: image_watcher
 Chuc nang: Theo doi folder va phat hien anh moi (based on user's approach)
-Khong phu thuoc: Chi import pathlib, os, shutil
+Khong phu thuoc: Chi import pathlib, os, shutil, cv2, numpy, perf_stats, inotify_watcher, frame_tracker
 """
 
 import os
 import time
+import errno
 import shutil
+from collections import deque
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List, Tuple
 from datetime import datetime
 
+import cv2
+import numpy as np
+
+from modules.perf_stats import timed
+from modules.inotify_watcher import InotifyWatcher, inotify_supported
+from modules.frame_tracker import FrameTracker
+
+# Chinh sach khi anh den nhanh hon toc do xu ly
+OVERLOAD_POLICIES = ("process_all", "keep_latest", "drop_oldest")
+
+# Cach phat hien anh moi: "inotify" (kernel bao, Linux), "poll" (quet folder), "auto"
+WATCH_BACKENDS = ("auto", "inotify", "poll")
+IMAGE_EXTENSIONS = (".jpg", ".png")
+
+# Cách bảo vệ ảnh gốc trước khi xử lý (camera có thể ghi đè / xóa ảnh):
+#   "copy": copy byte sang temp (an toàn với mọi nguồn, kể cả camera ghi đè cùng tên)
+#   "link": hardlink sang temp (cùng ổ đĩa, không copy byte, ảnh gốc vẫn ở watch folder)
+#   "move": đổi tên (atomic) sang temp (cùng ổ đĩa, ảnh gốc rời watch folder)
+# link / move không được (khác ổ đĩa, ổ mạng không hỗ trợ) → tự động copy
+HANDOFF_MODES = ("copy", "link", "move")
+
+# Folder không đổi mtime từ lần quét trước → bỏ qua (chỉ tin khi mtime cũ hơn
+# lần quét trước > DIR_MTIME_SLACK giây: ổ mạng / FAT làm tròn mtime)
+DIR_MTIME_SLACK = 2.0
+# Lần quét đầu (khởi động / checkpoint): file có mtime cũ hơn cursor > CURSOR_SLACK giây
+# → đã có từ trước, bỏ qua (xem FrameTracker). Sau đó ảnh mới = tên chưa có ở lần quét trước
+# (không dựa vào mtime: copy giữ mtime, đồng hồ camera lệch, ảnh gửi lại vẫn được nhận)
+CURSOR_SLACK = 5.0
+# inotify: quét lại cả folder mỗi RESYNC_INTERVAL giây (sự kiện bị mất, dọn tên file đã xóa)
+RESYNC_INTERVAL = 60.0
+
+# Ảnh camera đang ghi dở: tên tạm (ghi xong mới đổi tên, VD: "~img.jpg", "img.tmp.jpg") → bỏ qua
+TEMP_PREFIXES = (".", "~")
+TEMP_SUFFIXES = (".tmp", ".part", ".partial")
+# Ảnh ghi xong: marker cuối file nằm trong TRAILER_BYTES byte cuối (cho phép vài byte đệm)
+JPEG_EOI = b"\xff\xd9"
+PNG_IEND = b"IEND\xaeB`\x82"
+TRAILER_BYTES = 64
+# Ảnh chưa ghi xong / đọc lỗi: thử lại sau RETRY_BASE, RETRY_BASE*2, ... (tối đa RETRY_MAX_DELAY giây)
+RETRY_BASE = 0.02
+RETRY_MAX_DELAY = 0.5
+
 
 class ImageWatcher:
     """
     Giám sát folder cho ảnh mới
-    - Chỉ xử lý ảnh chưa được xử lý
-    - Instant copy sang temp folder để bảo vệ ảnh
+    - Chỉ xử lý ảnh chưa được xử lý (FrameTracker: cursor + tên file gần đây,
+      bộ nhớ không tăng theo thời gian chạy; checkpoint → restart xử lý tiếp đúng chỗ dừng)
+    - Instant copy (hoặc hardlink / đổi tên, xem HANDOFF_MODES) sang temp folder để bảo vệ ảnh
+    - load_image(): đọc byte 1 lần vào bộ nhớ + cv2.imdecode
+    - Chỉ nhận ảnh đã ghi xong (kích thước / mtime ổn định, JPEG có EOI, PNG có IEND,
+      bỏ qua tên tạm .tmp / .part): chưa xong → kiểm tra lại sau (backoff);
+      đọc lỗi → retry_image() đưa lại vào FIFO → poll nhanh không mất part
+    - backend "inotify": kernel báo file mới (không quét folder khi rảnh),
+      "poll": quét folder mỗi lần gọi (ổ mạng, Windows), "auto": inotify nếu dùng được
+    - Quét (poll): 1 lần os.scandir, lọc đuôi file theo cấu hình camera,
+      folder không đổi mtime → không liệt kê lại; ảnh mới = tên chưa có ở lần quét trước
+      (không stat lại ảnh cũ). Cursor mtime chỉ dùng cho lần quét đầu (file có từ trước
+      khi khởi động / trước checkpoint), số file bỏ qua được đếm + log
+    - Hàng đợi FIFO ảnh chờ xử lý (theo mtime, tên file): poll() → pop_next()
+      mỗi batch lấy đúng 1 ảnh / camera, ảnh dồn được xử lý theo overload_policy:
+        - "process_all": xử lý hết (backlog tăng nếu line nhanh hơn)
+        - "keep_latest": chỉ giữ ảnh mới nhất
+        - "drop_oldest": giữ tối đa max_pending ảnh, bỏ ảnh cũ nhất
     """
     
     def __init__(self, watch_folder: str, temp_folder: str = "images/process_temp",
-                 poll_interval: float = 0.5, auto_cleanup: bool = True):
+                 poll_interval: float = 0.5, auto_cleanup: bool = True,
+                 overload_policy: str = "process_all", max_pending: int = 10,
+                 backend: str = "auto", on_event: Optional[Callable[[], None]] = None,
+                 extensions: Tuple[str, ...] = IMAGE_EXTENSIONS, handoff: str = "copy",
+                 checkpoint_path: Optional[str] = None, checkpoint_interval: float = 1.0,
+                 settle_time: float = 0.05, ready_timeout: float = 3.0, check_trailer: bool = True):
         """
         Khoi tao watcher
         
@@ -29,112 +94,541 @@ class ImageWatcher:
             temp_folder (str): Folder lưu copy an toàn
             poll_interval (float): Thời gian kiểm tra (giây)
             auto_cleanup (bool): Tự động xóa file temp sau khi xử lý
+            overload_policy (str): "process_all" / "keep_latest" / "drop_oldest"
+            max_pending (int): Số ảnh chờ tối đa (drop_oldest)
+            backend (str): "auto" / "inotify" / "poll"
+            on_event (callable): inotify: gọi ngay khi có file mới (VD: đánh thức stage ingest)
+            extensions (tuple): Đuôi file ảnh (không phân biệt hoa thường), VD: (".jpg", ".png")
+            handoff (str): "copy" / "link" / "move" (cách đưa ảnh gốc sang temp)
+            checkpoint_path (str): File lưu tiến độ (None = không lưu, restart bỏ qua ảnh cũ)
+            checkpoint_interval (float): Ghi checkpoint tối đa 1 lần / N giây
+            settle_time (float): Kích thước / mtime phải đứng yên N giây mới coi là ghi xong
+            ready_timeout (float): Chờ ảnh ghi xong / thử đọc lại tối đa N giây
+            check_trailer (bool): Kiểm tra marker cuối file JPEG (EOI) / PNG (IEND)
         """
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}' (expected one of {WATCH_BACKENDS})")
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload_policy '{overload_policy}' "
+                             f"(expected one of {OVERLOAD_POLICIES})")
+        if handoff not in HANDOFF_MODES:
+            raise ValueError(f"Unknown handoff '{handoff}' (expected one of {HANDOFF_MODES})")
         self.watch_folder = Path(watch_folder)
         self.temp_folder = Path(temp_folder)
         self.poll_interval = poll_interval
         self.auto_cleanup = auto_cleanup
+        self.overload_policy = overload_policy
+        self.max_pending = max(1, max_pending)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.handoff = handoff
+        self.settle_time = settle_time
+        self.ready_timeout = ready_timeout
+        self.check_trailer = check_trailer
         
         # Nhớ file đã xử lý (tránh xử lý lại)
-        self.processed_files = set()
+        self.tracker = FrameTracker(window=CURSOR_SLACK, checkpoint_path=checkpoint_path,
+                                    checkpoint_interval=checkpoint_interval)
+        
+        # Ảnh đã copy sang temp, chờ xử lý (cũ nhất ở đầu)
+        self.pending = deque()
+        
+        # Ảnh camera chưa ghi xong {tên: trạng thái}, ảnh đọc lỗi chờ thử lại
+        self._waiting = {}
+        self._forced = {}
+        self._retry_images = []
+        
+        # Quét folder: mtime folder lần quét trước, _rescan → lần sau quét lại cả folder
+        # _listed: tên ảnh trong folder lần quét trước (None = chưa quét: dùng cursor)
+        self._dir_mtime_ns = None
+        self._listed = None
+        self._last_scan_start = 0.0
+        self._rescan = False
+        
+        # Thong ke
+        self.total_new = 0
+        self.total_copy_errors = 0
+        self.total_handoff_fallbacks = 0   # link / move không được → đã copy
+        self.total_bytes_read = 0
+        self.total_dropped = 0   # Anh bi bo do overload_policy
+        self.max_backlog = 0     # So anh cho lon nhat tung gap
+        self.last_scan_new = 0   # So anh moi tim thay o lan quet gan nhat
+        self.total_scans = 0     # So lan liet ke folder
+        self.total_skipped_scans = 0   # So lan bo qua (folder khong doi)
+        self.total_not_ready = 0         # Anh phat hien khi camera chua ghi xong
+        self.total_incomplete_reads = 0  # Lan doc anh loi / thieu (da thu lai)
+        self.total_recovered = 0         # Anh doc lai thanh cong sau khi loi
+        self.total_incomplete_lost = 0   # Anh bo sau ready_timeout
+        self.total_skipped_old = 0       # File cu hon cursor o lan quet dau (co tu truoc checkpoint)
         
         # Tạo folder nếu chưa có
         self.watch_folder.mkdir(parents=True, exist_ok=True)
         self.temp_folder.mkdir(parents=True, exist_ok=True)
         
-        # Scan folder hiện tại - đánh dấu để bỏ qua
-        self._mark_existing_files()
+        # Đăng ký inotify trước khi đánh dấu file cũ (không lọt file ghi trong lúc init)
+        self._inotify = None
+        if backend == "inotify" or (backend == "auto" and inotify_supported(str(self.watch_folder))):
+            try:
+                self._inotify = InotifyWatcher(str(self.watch_folder), self.extensions, on_event=on_event)
+                self._inotify.start()
+            except OSError as e:
+                print(f"[WATCHER] WARNING: inotify unavailable ({e}), falling back to polling")
+                self._inotify = None
+        self.backend = "inotify" if self._inotify is not None else "poll"
+        
+        # Có checkpoint → xử lý tiếp ảnh mới từ lúc dừng (lần poll đầu quét folder),
+        # không có → scan folder hiện tại, đánh dấu để bỏ qua
+        if self.tracker.load():
+            self._rescan = True
+        else:
+            self._mark_existing_files()
         
         print(f"[WATCHER INIT]")
         print(f"  watch_folder: {self.watch_folder.absolute()}")
         print(f"  temp_folder: {self.temp_folder.absolute()}")
         print(f"  poll_interval: {poll_interval}s")
+        print(f"  backend: {self.backend} (extensions: {', '.join(self.extensions)})")
+        print(f"  overload_policy: {overload_policy} (max_pending={self.max_pending})")
+        print(f"  handoff: {handoff}")
+        print(f"  readiness: settle {settle_time}s, trailer check {check_trailer}, timeout {ready_timeout}s")
     
     def _mark_existing_files(self) -> None:
-        """Đánh dấu file hiện có để bỏ qua lần đầu chạy"""
-        existing = list(self.watch_folder.glob('*.jpg')) + \
-                  list(self.watch_folder.glob('*.JPG')) + \
-                  list(self.watch_folder.glob('*.png')) + \
-                  list(self.watch_folder.glob('*.PNG'))
-        
-        for f in existing:
-            self.processed_files.add(f.name)
+        """Đánh dấu file hiện có để bỏ qua lần đầu chạy (cursor = file mới nhất)"""
+        existing = self._scan_folder(force=True)
+        self.tracker.start_after([(name, st.st_mtime) for name, st, _ in existing])
         
         if existing:
             print(f"[WATCHER] Ignored {len(existing)} existing files")
     
+    @timed("watcher_poll")
     def get_new_images(self) -> List[Dict[str, str]]:
         """
-        Lấy danh sách ảnh mới (chưa được xử lý)
+        Lấy danh sách ảnh mới (chưa được xử lý, đã ghi xong)
         
         Returns:
-            List[Dict]: Danh sách ảnh mới:
+            List[Dict]: Danh sách ảnh mới (cũ nhất trước, theo mtime rồi tên file):
                 [
                     {
                         'filename': str,
                         'original_path': str (đường dẫn gốc),
-                        'temp_path': str (đường dẫn sau copy)
+                        'temp_path': str (đường dẫn sau copy / link / move),
+                        'mtime': float (thời điểm ghi file gốc)
                     },
                     ...
                 ]
         """
         new_images = []
+        now = time.time()
         
         try:
-            # Tìm tất cả ảnh trong watch folder
-            image_files = list(self.watch_folder.glob('*.jpg')) + \
-                         list(self.watch_folder.glob('*.JPG')) + \
-                         list(self.watch_folder.glob('*.png')) + \
-                         list(self.watch_folder.glob('*.PNG'))
+            # Tìm tất cả ảnh trong watch folder (+ ảnh chưa ghi xong đến lượt kiểm tra lại)
+            image_files = self._list_candidates(now)
             
-            for img_path in image_files:
-                # Bỏ qua nếu đã xử lý
-                if img_path.name in self.processed_files:
+            for name, st, closed in image_files:
+                # Bỏ qua nếu đã nhận (file cũ hơn cursor đã lọc ở lần quét đầu)
+                if self.tracker.seen(name):
+                    self._waiting.pop(name, None)
                     continue
+                # Camera chưa ghi xong → chờ, kiểm tra lại sau (backoff)
+                if not self._is_ready(name, st, closed, now):
+                    continue
+                img_path = self.watch_folder / name
                 
-                # Đánh dấu đã xử lý
-                self.processed_files.add(img_path.name)
-                
-                # Copy sang temp folder
+                # Đánh dấu đã nhận trước khi copy / link / move (xong khi cleanup_temp_file)
+                self.tracker.mark(name, st.st_mtime)
+                if self._listed is not None:
+                    self._listed.add(name)   # inotify: lần quét lại sau không nhận lại
                 try:
-                    temp_path = self.temp_folder / img_path.name
-                    shutil.copy2(img_path, temp_path)
+                    temp_path = self.temp_folder / name
+                    handoff = self._handoff(img_path, temp_path)
                     
                     new_images.append({
-                        'filename': img_path.name,
+                        'filename': name,
                         'original_path': str(img_path),
-                        'temp_path': str(temp_path)
+                        'temp_path': str(temp_path),
+                        'mtime': st.st_mtime,
+                        'handoff': handoff,
+                        'forced': self._forced.pop(name, False)
                     })
                 except Exception as e:
-                    print(f"[WATCHER ERROR] Copy failed: {img_path.name} - {e}")
-                    # Bỏ đánh dấu để retry lần sau
-                    self.processed_files.remove(img_path.name)
+                    print(f"[WATCHER ERROR] Copy failed: {name} - {e}")
+                    self.total_copy_errors += 1
+                    # Bỏ đánh dấu → lần quét sau nhận lại ảnh này
+                    self.tracker.unmark(name)
+                    if self._listed is not None:
+                        self._listed.discard(name)
+                    # Retry lần sau (quét lại dù folder không đổi / không có sự kiện inotify)
+                    self._rescan = True
         
         except Exception as e:
             print(f"[WATCHER ERROR] Scan folder failed: {e}")
         
+        new_images.sort(key=lambda image: (image['mtime'], image['filename']))
+        self.last_scan_new = len(new_images)
+        self.total_new += len(new_images)
         return new_images
     
+    def _is_ready(self, name: str, st: os.stat_result, closed: bool, now: float) -> bool:
+        """
+        Ảnh đã ghi xong chưa:
+            - Kích thước / mtime không đổi trong settle_time giây
+              (inotify IN_CLOSE_WRITE / IN_MOVED_TO: camera đã đóng file → bỏ qua bước này)
+            - JPEG có marker EOI (FFD9), PNG có chunk IEND ở cuối file
+        Chưa xong → vào danh sách chờ, kiểm tra lại sau RETRY_BASE, RETRY_BASE*2, ... giây.
+        Quá ready_timeout giây vẫn chưa xong → vẫn xử lý (ảnh lỗi / định dạng lạ, không treo part).
+        """
+        state = self._waiting.get(name)
+        signature = (st.st_size, st.st_mtime_ns)
+        if state is not None and state["signature"] != signature:
+            state["signature"], state["changed_at"] = signature, now   # Vẫn đang ghi
+        
+        if closed or self.settle_time <= 0 or now - st.st_mtime >= self.settle_time:
+            stable = True
+        else:
+            stable = state is not None and now - state["changed_at"] >= self.settle_time
+        ready = st.st_size > 0 and stable
+        if ready and self.check_trailer:
+            try:
+                ready = has_image_trailer(self.watch_folder / name)
+            except OSError:
+                ready = False
+        
+        if ready:
+            self._waiting.pop(name, None)
+            return True
+        
+        if state is None:
+            state = {"first_seen": now, "signature": signature, "changed_at": now, "attempts": 0}
+            self._waiting[name] = state
+            self.total_not_ready += 1
+        elif now - state["first_seen"] >= self.ready_timeout:
+            print(f"[WATCHER] WARNING: {name} still incomplete after {now - state['first_seen']:.1f}s "
+                  f"(size {st.st_size}), processing anyway")
+            del self._waiting[name]
+            self._forced[name] = True
+            return True
+        state["attempts"] += 1
+        state["next_check"] = now + min(RETRY_BASE * 2 ** (state["attempts"] - 1), RETRY_MAX_DELAY)
+        return False
+    
+    def _handoff(self, img_path: Path, temp_path: Path) -> str:
+        """
+        Đưa ảnh gốc sang temp theo self.handoff (link / move lỗi → copy)
+        
+        Returns:
+            str: Cách đã dùng ("copy" / "link" / "move")
+        """
+        if self.handoff != "copy":
+            try:
+                if self.handoff == "link":
+                    try:
+                        os.remove(temp_path)   # File temp cũ cùng tên (os.link không ghi đè)
+                    except FileNotFoundError:
+                        pass
+                    os.link(img_path, temp_path)
+                else:
+                    os.replace(img_path, temp_path)
+                return self.handoff
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    raise   # Ảnh gốc đã bị xóa - copy cũng không được
+                self.total_handoff_fallbacks += 1
+                if self.total_handoff_fallbacks == 1:
+                    print(f"[WATCHER] WARNING: {self.handoff} failed for {self.watch_folder} ({e}), "
+                          f"copying instead")
+        shutil.copy2(img_path, temp_path)
+        return "copy"
+    
+    def load_image(self, image: Dict[str, str]) -> Optional[np.ndarray]:
+        """
+        Đọc ảnh đã nhận: đọc byte file temp 1 lần vào bộ nhớ + cv2.imdecode.
+        Ảnh thiếu marker cuối file (ghi dở) → None (không giải mã ảnh thiếu nửa dưới)
+        
+        Args:
+            image (dict): Ảnh từ pop_next() / get_new_images()
+            
+        Returns:
+            np.ndarray (BGR) hoặc None nếu không đọc / giải mã được (→ retry_image)
+        """
+        try:
+            with open(image['temp_path'], 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"[WATCHER ERROR] Read failed: {image['filename']} - {e}")
+            return None
+        self.total_bytes_read += len(data)
+        if self.check_trailer and not image.get('forced') \
+                and not has_image_trailer_bytes(data[-TRAILER_BYTES:], image['filename']):
+            return None
+        decoded = decode_image(data)
+        if decoded is not None and image.get('retries'):
+            self.total_recovered += 1
+        return decoded
+    
+    def retry_image(self, image: Dict[str, str]) -> bool:
+        """
+        Ảnh đọc lỗi (chưa ghi xong / file temp hỏng) → thử lại sau (backoff), không mất ảnh.
+        Giữ nguyên vị trí trong FIFO: đến hạn → đưa lại đầu hàng đợi (poll()).
+        
+        Args:
+            image (dict): Ảnh load_image() trả về None
+            
+        Returns:
+            bool: True nếu sẽ thử lại, False nếu quá ready_timeout (ảnh bị bỏ, temp đã xóa)
+        """
+        now = time.time()
+        self.total_incomplete_reads += 1
+        first_failure = image.setdefault('first_failure', now)
+        image['retries'] = image.get('retries', 0) + 1
+        if now - first_failure >= self.ready_timeout:
+            self.total_incomplete_lost += 1
+            print(f"[WATCHER ERROR] Giving up {image['filename']} after {image['retries']} reads "
+                  f"({now - first_failure:.1f}s)")
+            self.cleanup_temp_file(image['temp_path'])
+            return False
+        image['retry_at'] = now + min(RETRY_BASE * 2 ** (image['retries'] - 1), RETRY_MAX_DELAY)
+        self._retry_images.append(image)
+        return True
+    
+    def _requeue_due(self, now: float) -> None:
+        """Ảnh đọc lỗi đến hạn thử lại → đầu FIFO (copy: copy lại từ ảnh gốc)"""
+        due = [image for image in self._retry_images if image['retry_at'] <= now]
+        if not due:
+            return
+        self._retry_images = [image for image in self._retry_images if image['retry_at'] > now]
+        for image in sorted(due, key=lambda image: (image['mtime'], image['filename']), reverse=True):
+            if image['handoff'] == "copy":
+                # File temp là bản copy dở → copy lại (link / move: cùng inode, đã đủ byte)
+                try:
+                    shutil.copy2(image['original_path'], image['temp_path'])
+                except OSError as e:
+                    print(f"[WATCHER ERROR] Re-copy failed: {image['filename']} - {e}")
+                    self.total_incomplete_lost += 1
+                    self.cleanup_temp_file(image['temp_path'])
+                    continue
+            self.pending.appendleft(image)
+    
+    def _list_candidates(self, now: float) -> List[Tuple[str, os.stat_result, bool]]:
+        """
+        File ảnh có thể mới [(tên, stat, closed), ...] (closed: inotify báo camera đã đóng file):
+            - inotify: chỉ các file kernel báo (không liệt kê folder)
+            - poll / inotify bị tràn queue hoặc đã dừng / cần quét lại: quét folder
+            - + ảnh chưa ghi xong đến lượt kiểm tra lại (ảnh chưa đến lượt bị bỏ qua)
+        """
+        candidates = None
+        force, self._rescan = self._rescan, False
+        if self._inotify is not None and now - self._last_scan_start >= RESYNC_INTERVAL:
+            force = True   # Quét lại định kỳ (sự kiện bị mất, dọn _listed)
+        if self._inotify is not None:
+            names, overflow = self._inotify.drain()
+            if not self._inotify.is_alive():
+                print(f"[WATCHER] WARNING: inotify stopped for {self.watch_folder}, falling back to polling")
+                self._inotify = None
+                self.backend = "poll"
+            elif overflow:
+                print(f"[WATCHER] WARNING: inotify queue overflow, rescanning {self.watch_folder}")
+                force = True
+            elif not force:
+                candidates = []
+                for name in dict.fromkeys(names):
+                    if is_temp_name(name):
+                        continue
+                    try:
+                        candidates.append((name, os.stat(self.watch_folder / name), True))
+                    except OSError:
+                        continue  # File đã bị xóa / đổi tên
+        if candidates is None:
+            candidates = self._scan_folder(force)
+        
+        if self._waiting:
+            found = {name for name, _, _ in candidates}
+            candidates = [c for c in candidates if c[0] not in self._waiting or c[2]
+                          or self._waiting[c[0]]["next_check"] <= now]
+            for name, state in list(self._waiting.items()):
+                if name in found or state["next_check"] > now:
+                    continue
+                try:
+                    candidates.append((name, os.stat(self.watch_folder / name), False))
+                except OSError:
+                    del self._waiting[name]   # Bị xóa / đổi tên trước khi ghi xong
+        return candidates
+    
+    def _scan_folder(self, force: bool = False) -> List[Tuple[str, os.stat_result, bool]]:
+        """
+        1 lần os.scandir: file ảnh chưa có ở lần quét trước, chưa nhận (bỏ qua tên tạm .tmp / .part).
+        Lần quét đầu (khởi động / checkpoint): file cũ hơn cursor → bỏ qua (đếm + log).
+        Folder không đổi mtime từ lần quét trước → trả về [] (chỉ 1 lần stat).
+        """
+        dir_stat = os.stat(self.watch_folder)
+        if not force and dir_stat.st_mtime_ns == self._dir_mtime_ns \
+                and self._last_scan_start - dir_stat.st_mtime > DIR_MTIME_SLACK:
+            self.total_skipped_scans += 1
+            return []
+        self._dir_mtime_ns = dir_stat.st_mtime_ns
+        self._last_scan_start = time.time()
+        self.total_scans += 1
+        
+        first = self._listed is None
+        previous = self._listed or set()
+        listed = set()
+        skipped_old = 0
+        candidates = []
+        with os.scandir(self.watch_folder) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.lower().endswith(self.extensions) or is_temp_name(name):
+                    continue
+                listed.add(name)
+                if name in previous or self.tracker.seen(name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if first and self.tracker.seen(name, st.st_mtime):
+                    skipped_old += 1   # Có từ trước khi khởi động / trước checkpoint
+                    continue
+                candidates.append((name, st, False))
+        self._listed = listed
+        if skipped_old:
+            self.total_skipped_old += skipped_old
+            print(f"[WATCHER] Skipped {skipped_old} file(s) older than the checkpoint in {self.watch_folder}")
+        return candidates
+    
+    def poll(self) -> int:
+        """
+        Quét ảnh mới, đưa vào hàng đợi theo overload_policy.
+        Ảnh đọc lỗi đến hạn thử lại → đưa lại đầu hàng đợi.
+        
+        Returns:
+            int: Số ảnh đang chờ
+        """
+        if self._retry_images:
+            self._requeue_due(time.time())
+        for image in self.get_new_images():
+            self.pending.append(image)
+            if self.overload_policy == "keep_latest":
+                while len(self.pending) > 1:
+                    self._drop(self.pending.popleft())
+            elif self.overload_policy == "drop_oldest":
+                while len(self.pending) > self.max_pending:
+                    self._drop(self.pending.popleft())
+        
+        self.max_backlog = max(self.max_backlog, len(self.pending))
+        return len(self.pending)
+    
+    def pop_next(self) -> Optional[Dict[str, str]]:
+        """Lấy ảnh cũ nhất đang chờ (None nếu không có)"""
+        return self.pending.popleft() if self.pending else None
+    
+    def backlog(self) -> int:
+        """Số ảnh đang chờ xử lý (kể cả ảnh đọc lỗi chờ thử lại)"""
+        return len(self.pending) + len(self._retry_images)
+    
+    def _drop(self, image: Dict[str, str]) -> None:
+        """Bỏ 1 ảnh chờ (line nhanh hơn tốc độ xử lý)"""
+        self.total_dropped += 1
+        self.cleanup_temp_file(image['temp_path'])
+        print(f"[WATCHER] Dropped {image['filename']} ({self.overload_policy}, "
+              f"backlog={len(self.pending)}, dropped={self.total_dropped})")
+    
     def cleanup_temp_file(self, temp_path: str) -> None:
         """
-        Xóa file temp sau khi xử lý xong
+        Xóa file temp sau khi xử lý xong (ảnh được ghi vào checkpoint)
         
         Args:
             temp_path (str): Đường dẫn file temp
         """
+        self.tracker.done(os.path.basename(temp_path))
         try:
             if self.auto_cleanup and os.path.exists(temp_path):
                 os.remove(temp_path)
         except Exception as e:
             print(f"[WATCHER] Cleanup error: {e}")
     
+    def get_stats(self) -> dict:
+        """Lay thong ke"""
+        return {
+            "watch_folder": str(self.watch_folder),
+            "backend": self.backend,
+            "cursor": self.tracker.cursor,
+            "total_scans": self.total_scans,
+            "total_skipped_scans": self.total_skipped_scans,
+            "tracked_files": len(self.tracker),
+            "total_new": self.total_new,
+            "total_copy_errors": self.total_copy_errors,
+            "handoff": self.handoff,
+            "total_handoff_fallbacks": self.total_handoff_fallbacks,
+            "total_bytes_read": self.total_bytes_read,
+            "last_scan_new": self.last_scan_new,
+            "backlog": len(self.pending),
+            "max_backlog": self.max_backlog,
+            "total_dropped": self.total_dropped,
+            "waiting_not_ready": len(self._waiting),
+            "total_not_ready": self.total_not_ready,
+            "total_incomplete_reads": self.total_incomplete_reads,
+            "total_recovered": self.total_recovered,
+            "total_incomplete_lost": self.total_incomplete_lost,
+            "total_skipped_old": self.total_skipped_old,
+            "listed_files": len(self._listed or ()),
+        }
+    
+    def close(self) -> None:
+        """Dừng inotify (nếu có), ghi checkpoint"""
+        if self._inotify is not None:
+            self._inotify.stop()
+            self._inotify = None
+        self.tracker.save()
+    
     def reset(self) -> None:
         """Reset tracking - gọi lại từ đầu"""
-        self.processed_files.clear()
+        while self.pending:
+            self.cleanup_temp_file(self.pending.popleft()['temp_path'])
+        for image in self._retry_images:
+            self.cleanup_temp_file(image['temp_path'])
+        self._retry_images = []
+        self._waiting.clear()
+        self._forced.clear()
+        self.tracker.reset()
+        self._dir_mtime_ns = None
+        self._listed = None
         self._mark_existing_files()
         print(f"[WATCHER] Reset - will re-scan all files")
 
 
+def is_temp_name(name: str) -> bool:
+    """Tên file tạm (camera ghi xong mới đổi tên): ~img.jpg, .img.jpg, img.tmp.jpg"""
+    lower = name.lower()
+    return lower.startswith(TEMP_PREFIXES) or any(
+        "." + part in TEMP_SUFFIXES for part in lower.split(".")[1:-1])
+
+
+def has_image_trailer_bytes(tail: bytes, name: str) -> bool:
+    """Byte cuối file có marker kết thúc: JPEG EOI (FFD9), PNG IEND; định dạng khác → True"""
+    lower = name.lower()
+    if lower.endswith((".jpg", ".jpeg")):
+        return JPEG_EOI in tail
+    if lower.endswith(".png"):
+        return PNG_IEND in tail
+    return True
+
+
+def has_image_trailer(path) -> bool:
+    """Đọc TRAILER_BYTES byte cuối file → has_image_trailer_bytes"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - TRAILER_BYTES))
+        return has_image_trailer_bytes(f.read(), os.path.basename(str(path)))
+
+
+def decode_image(data: bytes) -> Optional[np.ndarray]:
+    """Giải mã ảnh từ byte (JPEG / PNG / ...) → BGR, None nếu lỗi"""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
 # ============================================================================
 # TEST
 # ============================================================================
@@ -162,7 +656,7 @@ def main():
     for i in range(3):
         img_path = watch_path / f"test_{i:03d}.jpg"
         with open(img_path, 'wb') as f:
-            f.write(b'FAKE_IMAGE_DATA')
+            f.write(b'FAKE_IMAGE_DATA' + JPEG_EOI)
         time.sleep(0.1)
         print(f"  Created: {img_path.name}")
     print()
@@ -176,6 +670,56 @@ def main():
         print(f"      temp: {img['temp_path']}")
     print()
     
+    # Test 3b: FIFO + keep_latest
+    print("[3b] Burst with keep_latest:")
+    burst = ImageWatcher(watch_folder="test_watch2", temp_folder="test_temp",
+                         overload_policy="keep_latest")
+    for i in range(3):
+        with open(Path("test_watch2") / f"burst_{i:03d}.jpg", 'wb') as f:
+            f.write(b'BURST' + JPEG_EOI)
+    time.sleep(0.1)   # settle_time
+    print(f"  Backlog: {burst.poll()} | next: {burst.pop_next()['filename']} | "
+          f"dropped: {burst.total_dropped}")
+    print()
+    
+    # Test 3c: handoff "link" (hardlink, không copy byte) + load_image
+    print("[3c] Handoff link + load_image:")
+    linked = ImageWatcher(watch_folder="test_watch3", temp_folder="test_temp", handoff="link")
+    ok, buf = cv2.imencode(".jpg", np.zeros((8, 8, 3), dtype=np.uint8))
+    with open(Path("test_watch3") / "link_000.jpg", 'wb') as f:
+        f.write(buf.tobytes())
+    linked.poll()
+    frame = linked.pop_next()
+    image = linked.load_image(frame)
+    print(f"  Links: {os.stat(frame['temp_path']).st_nlink} | image: {image.shape} | "
+          f"fallbacks: {linked.total_handoff_fallbacks}")
+    linked.cleanup_temp_file(frame['temp_path'])
+    linked.close()
+    print()
+    
+    # Test 3d: camera đang ghi dở (chưa có EOI) → chờ, ghi xong → nhận
+    print("[3d] Partial write:")
+    partial = watch_path / "test_partial.jpg"
+    with open(partial, 'wb') as f:
+        f.write(b'HALF_')
+    time.sleep(0.1)
+    print(f"  Before EOI: {len(watcher.get_new_images())} new (waiting: {len(watcher._waiting)})")
+    with open(partial, 'ab') as f:
+        f.write(b'IMAGE' + JPEG_EOI)
+    time.sleep(0.1)
+    print(f"  After EOI: {[img['filename'] for img in watcher.get_new_images()]} "
+          f"(not ready: {watcher.total_not_ready})")
+    print()
+    
+    # Test 3e: ảnh copy giữ mtime cũ (robocopy / Explorer) → vẫn nhận (không so với cursor)
+    print("[3e] Copied image with old mtime:")
+    copied = watch_path / "test_copied.jpg"
+    with open(copied, 'wb') as f:
+        f.write(b'COPIED' + JPEG_EOI)
+    os.utime(copied, (time.time() - 3600, time.time() - 3600))
+    print(f"  Found: {[img['filename'] for img in watcher.get_new_images()]} (expected ['test_copied.jpg'])")
+    print()
+    
     # Test 4: Get new images again (should be empty)
     print("[4] Get new images again (should be empty):")
     new_imgs = watcher.get_new_images()
@@ -185,8 +729,9 @@ def main():
     print("[5] Add new image:")
     new_img = watch_path / "test_new.jpg"
     with open(new_img, 'wb') as f:
-        f.write(b'NEW_IMAGE_DATA')
+        f.write(b'NEW_IMAGE_DATA' + JPEG_EOI)
     print(f"  Created: {new_img.name}")
+    time.sleep(0.1)
     
     new_imgs = watcher.get_new_images()
     print(f"  Found: {len(new_imgs)} new images")
@@ -198,6 +743,8 @@ def main():
     print("[CLEANUP]:")
     import shutil
     shutil.rmtree("test_watch", ignore_errors=True)
+    shutil.rmtree("test_watch2", ignore_errors=True)
+    shutil.rmtree("test_watch3", ignore_errors=True)
     shutil.rmtree("test_temp", ignore_errors=True)
     print("  Removed test folders")
     print()
@@ -0,0 +1,235 @@
+"""
+Module: inference_engine
+Chuc nang: Giao dien chung cho cac engine inference
+    - detector / model_manager chi goi qua InferenceEngine.infer()
+      → khong phu thuoc truc tiep vao ultralytics
+    - UltralyticsEngine: YOLO PyTorch (mac dinh)
+    - ONNXEngine: ONNX Runtime CPU (modules/onnx_backend.py)
+    - FakeEngine: ket qua co dinh + do tre gia lap → do throughput
+      watcher/compare/visualize/GUI/COM va load test khong can weight that
+
+Moi engine tra ve ket qua tho dang numpy, 1 dict / anh:
+    {
+        "xyxy": (N, 4) float32 - toa do tren anh crop,
+        "cls": (N,) int,
+        "conf": (N,) float32,
+        "keypoints": (N, K, 3) float32 (x, y, conf) hoac None
+    }
+"""
+
+import os
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+
+BACKENDS = ("ultralytics", "onnx", "fake")
+
+
+class InferenceEngine:
+    """
+    Lop co so cho engine inference.
+
+    Cach dung:
+        engine = create_engine("ultralytics", "MarkF", "models/MarkF.pt", file_hash)
+        raws = engine.infer([crop1, crop2], classes=[0], conf=0.3, imgsz=416)
+    """
+
+    name = "base"
+    stride = 32
+
+    def infer(self, images: List[Any],
+              classes: Optional[List[int]] = None,
+              conf: Optional[float] = None,
+              iou: Optional[float] = None,
+              max_det: Optional[int] = None,
+              imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Inference list anh (1 lan goi), tra ve ket qua tho 1 dict / anh.
+        Tham so None = mac dinh cua engine.
+        """
+        raise NotImplementedError
+
+    def size_mb(self) -> float:
+        """Uoc luong RAM cua model (MB) - dung cho gioi han cache"""
+        return 0.0
+
+
+class UltralyticsEngine(InferenceEngine):
+    """Engine YOLO PyTorch (ultralytics)"""
+
+    name = "ultralytics"
+
+    def __init__(self, model_path: str):
+        from ultralytics import YOLO
+
+        self.model_path = model_path
+        self.model = YOLO(model_path)
+        try:
+            self.stride = int(max(self.model.model.stride))
+        except Exception:
+            self.stride = 32
+
+    def infer(self, images, classes=None, conf=None, iou=None, max_det=None, imgsz=None):
+        kwargs = {"verbose": False}
+        if classes is not None:
+            kwargs["classes"] = list(classes)
+        if conf is not None:
+            kwargs["conf"] = conf
+        if iou is not None:
+            kwargs["iou"] = iou
+        if max_det is not None:
+            kwargs["max_det"] = max_det
+        if imgsz is not None:
+            kwargs["imgsz"] = imgsz
+
+        return [result_to_arrays(r) for r in self.model(list(images), **kwargs)]
+
+    def size_mb(self) -> float:
+        try:
+            n_bytes = sum(p.numel() * p.element_size() for p in self.model.model.parameters())
+        except Exception:
+            n_bytes = os.path.getsize(self.model_path)
+        return n_bytes / (1024 * 1024)
+
+
+class FakeEngine(InferenceEngine):
+    """
+    Engine gia lap - ket qua xac dinh, khong can file weight.
+
+    Box / keypoint cau hinh theo ti le (0-1) cua anh crop nen dung duoc cho
+    moi kich thuoc ROI. Vi du (config.yaml → inference.fake):
+        latency_ms: 15                # do tre moi lan goi
+        latency_per_image_ms: 2       # do tre them moi anh
+        boxes:                        # [x1, y1, x2, y2, class_id, conf]
+          - [0.25, 0.25, 0.75, 0.75, 0, 0.9]
+        keypoints:                    # keypoints cua tung box: [[x, y, conf], ...]
+          - [[0.5, 0.3, 0.9], [0.5, 0.7, 0.9]]
+    """
+
+    name = "fake"
+
+    DEFAULT_BOXES = [[0.25, 0.25, 0.75, 0.75, 0, 0.9]]
+
+    def __init__(self, boxes: Optional[List[list]] = None,
+                 keypoints: Optional[List[list]] = None,
+                 latency_ms: float = 0.0, latency_per_image_ms: float = 0.0,
+                 stride: int = 32):
+        """
+        Args:
+            boxes: Danh sach [x1, y1, x2, y2, class_id, conf] (ti le 0-1 cua crop)
+            keypoints: Keypoints tuong ung tung box [[x, y, conf], ...] (ti le 0-1)
+            latency_ms: Thoi gian gia lap moi lan goi infer() (ms)
+            latency_per_image_ms: Thoi gian gia lap them cho moi anh (ms)
+            stride: Stride gia lap
+        """
+        boxes = self.DEFAULT_BOXES if boxes is None else boxes
+        self.boxes = np.array(boxes, dtype=np.float32).reshape(-1, 6)
+        self.keypoints = None
+        if keypoints:
+            self.keypoints = np.array(keypoints, dtype=np.float32)
+        self.latency_ms = latency_ms
+        self.latency_per_image_ms = latency_per_image_ms
+        self.stride = stride
+        self.total_calls = 0
+        self.total_images = 0
+
+    def infer(self, images, classes=None, conf=None, iou=None, max_det=None, imgsz=None):
+        images = list(images)
+        self.total_calls += 1
+        self.total_images += len(images)
+
+        delay = self.latency_ms + self.latency_per_image_ms * len(images)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        mask = self.boxes[:, 5] >= (0.0 if conf is None else conf)
+        if classes is not None:
+            mask &= np.isin(self.boxes[:, 4].astype(int), list(classes))
+        idx = np.flatnonzero(mask)
+        if max_det is not None:
+            idx = idx[:max_det]
+
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            scale = np.array([w, h, w, h], dtype=np.float32)
+
+            keypoints = None
+            if self.keypoints is not None:
+                keypoints = self.keypoints[idx].copy()
+                keypoints[:, :, 0] *= w
+                keypoints[:, :, 1] *= h
+
+            results.append({
+                "xyxy": self.boxes[idx, :4] * scale,
+                "cls": self.boxes[idx, 4].astype(int),
+                "conf": self.boxes[idx, 5].copy(),
+                "keypoints": keypoints,
+            })
+        return results
+
+
+def result_to_arrays(r: Any) -> Dict[str, Any]:
+    """
+    Chuyen 1 ket qua ultralytics sang numpy 1 lan duy nhat (thay vi doc tung box).
+
+    Returns:
+        Dict ket qua tho (xem docstring module)
+    """
+    boxes = r.boxes
+    xyxy = boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4)
+    cls = boxes.cls.cpu().numpy().astype(int).reshape(-1)
+    conf = boxes.conf.cpu().numpy().astype(np.float32).reshape(-1)
+
+    keypoints = None
+    if getattr(r, "keypoints", None) is not None:
+        try:
+            kp = r.keypoints.data.cpu().numpy().astype(np.float32)
+            if kp.ndim == 3 and kp.shape[0] == len(cls):
+                if kp.shape[2] < 3:
+                    # Model khong co kp conf → them cot conf = 0.0
+                    kp = np.concatenate([kp, np.zeros(kp.shape[:2] + (1,), np.float32)], axis=2)
+                keypoints = kp[:, :, :3]
+        except Exception:
+            keypoints = None
+
+    return {"xyxy": xyxy, "cls": cls, "conf": conf, "keypoints": keypoints}
+
+
+def create_engine(backend: str, model_name: str, model_path: str, file_hash: str,
+                  options: Optional[Dict[str, Any]] = None) -> InferenceEngine:
+    """
+    Tao engine theo backend.
+
+    Args:
+        backend: "ultralytics", "onnx" hoac "fake"
+        model_name: Ten model (VD: "MarkF")
+        model_path: Duong dan file .pt (fake: khong can ton tai)
+        file_hash: Hash file .pt (key cache ONNX)
+        options: Tham so backend (section "inference" trong config.yaml):
+            - onnx: {"onnx_cache_dir": str, "onnx_threads": int}
+            - fake: {"fake": tham so FakeEngine, co the ghi de theo model:
+                     {"latency_ms": 10, "models": {"MarkF": {"boxes": [...]}}}}
+
+    Returns:
+        InferenceEngine
+    """
+    options = options or {}
+
+    if backend == "ultralytics":
+        return UltralyticsEngine(model_path)
+
+    if backend == "onnx":
+        from modules.onnx_backend import ONNXEngine
+        return ONNXEngine(model_name, model_path, file_hash,
+                          cache_dir=options.get("onnx_cache_dir", "models/onnx_cache"),
+                          num_threads=options.get("onnx_threads", 0))
+
+    if backend == "fake":
+        fake_cfg = options.get("fake") or {}
+        fake_opts = {k: v for k, v in fake_cfg.items() if k != "models"}
+        fake_opts.update((fake_cfg.get("models") or {}).get(model_name, {}))
+        return FakeEngine(**fake_opts)
+
+    raise ValueError(f"Invalid inference backend: {backend} (expected one of {BACKENDS})")
@@ -0,0 +1,405 @@
+"""
+Module: inference_pool
+Chuc nang: Chay inference trong nhieu process (tan dung CPU nhieu core)
+    - Moi worker process load model 1 lan qua model_manager (cache rieng)
+    - Anh crop gui sang worker qua multiprocessing.shared_memory (khong pickle pixel)
+    - Ket qua tra ve dang mang numpy gon: 1 mang (N, 6 + K*3) / anh
+    - Cau hinh: so worker, so thread / worker, model nao chay o worker nao
+    - PooledEngine: InferenceEngine gia → batch_detector dung pool nhu 1 model thuong
+    - Worker chet (OOM, crash native) → request dang cho bao loi ngay, worker duoc khoi dong lai
+
+Phu thuoc: model_manager, inference_engine (trong worker)
+"""
+
+import os
+import time
+import queue
+import itertools
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+from modules.inference_engine import InferenceEngine
+
+
+class PooledEngine(InferenceEngine):
+    """Engine dai dien cho 1 model chay trong InferencePool"""
+
+    name = "pool"
+
+    def __init__(self, pool: "InferencePool", model_name: str):
+        self.pool = pool
+        self.model_name = model_name
+
+    def infer(self, images, classes=None, conf=None, iou=None, max_det=None, imgsz=None):
+        return self.pool.infer(self.model_name, images, classes=classes, conf=conf,
+                               iou=iou, max_det=max_det, imgsz=imgsz)
+
+
+class InferencePool:
+    """
+    Pool process inference.
+
+    Cach dung:
+        pool = InferencePool(num_workers=3, threads_per_worker=2,
+                             model_assignment={"MarkF": 0, "MarkG": 1})
+        pool.start()
+        raws = pool.infer("MarkF", [crop1, crop2], classes=[0], conf=0.3)
+        pool.stop()
+
+    Model khong co trong model_assignment duoc chia vong tron cho cac worker
+    (1 model luon chay o cung 1 worker → chi load 1 lan).
+    """
+
+    def __init__(self, num_workers: int = 2, threads_per_worker: int = 1,
+                 model_assignment: Optional[Dict[str, int]] = None,
+                 backend: str = "ultralytics",
+                 engine_options: Optional[Dict[str, Any]] = None,
+                 request_timeout: float = 30.0):
+        """
+        Args:
+            num_workers: So process worker
+            threads_per_worker: So thread tinh toan trong moi worker (torch/ONNX/OpenMP)
+            model_assignment: {model_name: worker_index} (tuy chon)
+            backend: Backend inference trong worker (xem model_manager.configure_backend)
+            engine_options: Tham so backend (section "inference" trong config)
+            request_timeout: Thoi gian cho toi da 1 request (giay)
+        """
+        self.num_workers = max(1, num_workers)
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.model_assignment = dict(model_assignment or {})
+        self.backend = backend
+        self.engine_options = dict(engine_options or {})
+        self.request_timeout = request_timeout
+
+        self._ctx = mp.get_context("spawn")   # Giong Windows, an toan voi torch
+        self._task_queues = []
+        self._result_queue = None
+        self._workers = []
+        self._dispatcher = None
+        self._pending = {}                    # req_id -> {"event", "result", "worker"}
+        self._pending_lock = threading.Lock()
+        self._req_ids = itertools.count(1)
+        self._next_worker = 0
+        self.is_running = False
+
+        # Thong ke
+        self.total_requests = 0
+        self.total_images = 0
+        self.total_errors = 0
+        self.total_restarts = 0   # Worker chet → khoi dong lai
+
+    # ==================================================================
+    # PUBLIC METHODS
+    # ==================================================================
+
+    def start(self) -> None:
+        """Khoi dong cac worker process"""
+        if self.is_running:
+            return
+
+        self._result_queue = self._ctx.Queue()
+        self._task_queues = [None] * self.num_workers
+        self._workers = [None] * self.num_workers
+        for idx in range(self.num_workers):
+            self._start_worker(idx)
+
+        self.is_running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop,
+                                            name="infer-pool-results", daemon=True)
+        self._dispatcher.start()
+        print(f"[POOL] Started {self.num_workers} worker(s) x {self.threads_per_worker} thread(s), "
+              f"backend={self.backend}")
+
+    def stop(self) -> None:
+        """Dung tat ca worker"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._result_queue.put(None)   # Danh thuc dispatcher de thoat
+        if self._dispatcher:
+            self._dispatcher.join(timeout=2)
+        self._task_queues = []
+        self._workers = []
+        print(f"[POOL] Stopped. Stats: {self.get_stats()}")
+
+    def get_engine(self, model_name: str) -> PooledEngine:
+        """Engine gia de dung pool thay cho model load trong process chinh"""
+        return PooledEngine(self, model_name)
+
+    def worker_for(self, model_name: str) -> int:
+        """Worker xu ly model (co dinh sau lan dau)"""
+        with self._pending_lock:
+            if model_name not in self.model_assignment:
+                self.model_assignment[model_name] = self._next_worker % self.num_workers
+                self._next_worker += 1
+            return self.model_assignment[model_name] % self.num_workers
+
+    def infer(self, model_name: str, images: List[np.ndarray], **infer_kwargs) -> List[Dict[str, Any]]:
+        """
+        Inference list anh o worker cua model (block cho den khi co ket qua).
+        Thread-safe: nhieu thread co the goi dong thoi.
+
+        Returns:
+            List ket qua tho (format InferenceEngine), 1 dict / anh
+        """
+        if not self.is_running:
+            raise RuntimeError("InferencePool is not running")
+        images = list(images)
+        if not images:
+            return []
+
+        # --- Copy crop vao 1 block shared memory ---
+        layout = []
+        total = 0
+        for image in images:
+            image = np.ascontiguousarray(image)
+            layout.append((total, image.shape, image.dtype.str))
+            total += image.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+
+        try:
+            for image, (offset, shape, dtype) in zip(images, layout):
+                dst = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                dst[...] = image
+
+            req_id = next(self._req_ids)
+            worker_idx = self.worker_for(model_name)
+            waiter = {"event": threading.Event(), "result": None, "worker": worker_idx}
+            with self._pending_lock:
+                # Worker da chet → khoi dong lai truoc khi gui (khong cho het request_timeout)
+                self._check_workers([worker_idx])
+                self._pending[req_id] = waiter
+                self._task_queues[worker_idx].put((req_id, model_name, shm.name, layout, infer_kwargs))
+
+            if not waiter["event"].wait(self.request_timeout):
+                with self._pending_lock:
+                    self._pending.pop(req_id, None)
+                self.total_errors += 1
+                raise TimeoutError(f"Inference '{model_name}' timed out after {self.request_timeout}s")
+        finally:
+            shm.close()
+            shm.unlink()
+
+        packed_list, kpt_shape, error = waiter["result"]
+        self.total_requests += 1
+        self.total_images += len(images)
+        if error:
+            self.total_errors += 1
+            raise RuntimeError(f"Worker error ({model_name}): {error}")
+
+        return [unpack_result(packed, kpt_shape) for packed in packed_list]
+
+    def get_stats(self) -> dict:
+        """Lay thong ke"""
+        return {
+            "workers": self.num_workers,
+            "alive": sum(1 for w in self._workers if w.is_alive()),
+            "threads_per_worker": self.threads_per_worker,
+            "model_assignment": dict(self.model_assignment),
+            "pending": len(self._pending),
+            "total_requests": self.total_requests,
+            "total_images": self.total_images,
+            "total_errors": self.total_errors,
+            "total_restarts": self.total_restarts,
+        }
+
+    # ==================================================================
+    # PRIVATE
+    # ==================================================================
+
+    def _start_worker(self, idx: int) -> None:
+        """Tao process worker idx (queue task moi: task cua worker cu da bao loi)"""
+        task_queue = self._ctx.Queue()
+        worker = self._ctx.Process(
+            target=_worker_main,
+            args=(idx, task_queue, self._result_queue, self.backend,
+                  self.engine_options, self.threads_per_worker),
+            name=f"infer-worker-{idx}",
+            daemon=True
+        )
+        worker.start()
+        self._task_queues[idx] = task_queue
+        self._workers[idx] = worker
+
+    def _check_workers(self, indexes: Optional[List[int]] = None) -> None:
+        """
+        Worker chet → request dang cho o worker do bao loi ngay, khoi dong lai worker.
+        Goi khi da giu _pending_lock.
+        """
+        for idx in range(self.num_workers) if indexes is None else indexes:
+            worker = self._workers[idx]
+            if not self.is_running or worker.is_alive():
+                continue
+            error = f"WorkerDied: worker {idx} exited (exitcode {worker.exitcode})"
+            lost = [req_id for req_id, waiter in self._pending.items() if waiter["worker"] == idx]
+            for req_id in lost:
+                waiter = self._pending.pop(req_id)
+                waiter["result"] = ([], None, error)
+                waiter["event"].set()
+            self.total_restarts += 1
+            print(f"[POOL] WARNING: {error}, {len(lost)} request(s) failed, restarting")
+            self._start_worker(idx)
+
+    def _dispatch_loop(self) -> None:
+        """Nhan ket qua tu worker, tra ve dung thread dang cho; kiem tra worker con song"""
+        while self.is_running:
+            with self._pending_lock:
+                self._check_workers()
+            try:
+                message = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if message is None:
+                break
+
+            req_id, packed_list, kpt_shape, error = message
+            with self._pending_lock:
+                waiter = self._pending.pop(req_id, None)
+            if waiter is not None:
+                waiter["result"] = (packed_list, kpt_shape, error)
+                waiter["event"].set()
+
+
+# ============================================================================
+# Dong goi ket qua (compact array)
+# ============================================================================
+
+def pack_result(raw: Dict[str, Any]) -> np.ndarray:
+    """Ket qua tho → 1 mang float32 (N, 6 + K*3): x1, y1, x2, y2, conf, cls, kpts..."""
+    parts = [raw["xyxy"].reshape(-1, 4),
+             raw["conf"].reshape(-1, 1),
+             raw["cls"].reshape(-1, 1)]
+    if raw["keypoints"] is not None:
+        parts.append(raw["keypoints"].reshape(len(raw["conf"]), -1))
+    return np.concatenate(parts, axis=1).astype(np.float32)
+
+
+def unpack_result(packed: np.ndarray, kpt_shape: Optional[tuple]) -> Dict[str, Any]:
+    """Nguoc lai cua pack_result()"""
+    keypoints = None
+    if kpt_shape is not None:
+        keypoints = packed[:, 6:].reshape(len(packed), kpt_shape[0], kpt_shape[1])
+    return {
+        "xyxy": packed[:, :4],
+        "cls": packed[:, 5].astype(int),
+        "conf": packed[:, 4],
+        "keypoints": keypoints,
+    }
+
+
+# ============================================================================
+# Worker process
+# ============================================================================
+
+def _worker_main(worker_idx: int, task_queue: Any, result_queue: Any, backend: str,
+                 engine_options: Dict[str, Any], num_threads: int) -> None:
+    """Vong lap worker: nhan crop (shared memory) → infer → tra ket qua gon"""
+    # Gioi han thread TRUOC khi import torch/onnxruntime
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+
+    from modules.model_manager import configure_backend, get_model
+
+    engine_options = dict(engine_options, onnx_threads=num_threads)
+    configure_backend(backend, engine_options)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    print(f"[POOL] Worker {worker_idx} ready (pid={os.getpid()})")
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        req_id, model_name, shm_name, layout, infer_kwargs = task
+        packed_list, kpt_shape, error = [], None, None
+        shm = None
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            images = [np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                      for offset, shape, dtype in layout]
+            raws = get_model(model_name).infer(images, **infer_kwargs)
+            del images   # Giai phong view truoc khi close shared memory
+
+            for raw in raws:
+                if raw["keypoints"] is not None:
+                    kpt_shape = raw["keypoints"].shape[1:]
+                packed_list.append(pack_result(raw))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            if shm is not None:
+                shm.close()
+
+        result_queue.put((req_id, packed_list, kpt_shape, error))
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test pool voi engine fake (khong can weight)"""
+    print("[TEST] InferencePool\n")
+
+    pool = InferencePool(num_workers=2, threads_per_worker=1, backend="fake",
+                         engine_options={"fake": {"latency_ms": 50}})
+    pool.start()
+
+    crops = [np.zeros((360, 400, 3), dtype=np.uint8) for _ in range(4)]
+
+    start = time.time()
+    threads = [threading.Thread(target=pool.infer, args=(f"Model{i}", crops)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"[OK] 4 models x 4 crops in {time.time() - start:.2f}s")
+
+    raws = pool.infer("Model0", crops[:1], conf=0.5)
+    print(f"[OK] Result: {raws[0]}")
+    print(f"[OK] Stats: {pool.get_stats()}")
+    pool.stop()
+
+    # Worker chet giua chung → request bao loi ngay, worker duoc khoi dong lai
+    pool = InferencePool(num_workers=2, threads_per_worker=1, backend="fake",
+                         engine_options={"fake": {"latency_ms": 1000}})
+    pool.start()
+    pool.infer("Model0", crops[:1])   # Load model
+    victim = pool._workers[pool.worker_for("Model0")]
+    threading.Timer(0.3, victim.kill).start()
+    start = time.time()
+    try:
+        pool.infer("Model0", crops[:1])
+        raise AssertionError("request on a killed worker must fail")
+    except RuntimeError as e:
+        elapsed = time.time() - start
+        assert elapsed < 5, elapsed
+        print(f"[OK] Killed worker reported after {elapsed:.2f}s: {e}")
+
+    pool._workers[pool.worker_for("Model0")].kill()
+    time.sleep(0.1)
+    raws = pool.infer("Model0", crops[:1])
+    stats = pool.get_stats()
+    assert len(raws) == 1 and stats["total_restarts"] == 2 and stats["alive"] == 2, stats
+    print(f"[OK] Restarted worker serves requests: {stats}")
+
+    pool.stop()
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
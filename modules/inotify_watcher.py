@@ -0,0 +1,227 @@
+"""
+Module: inotify_watcher
+Chuc nang: Nhan thong bao file moi tu kernel (Linux inotify, qua ctypes)
+    - Chi nghe IN_CLOSE_WRITE (ghi xong) + IN_MOVED_TO (doi ten vao folder)
+      → khong liet ke folder, khong ton CPU / I/O khi khong co anh
+    - 1 thread nen / folder: block tren fd (select), co su kien → luu ten file
+      + goi on_event() (VD: danh thuc stage ingest) → thay anh trong vai ms
+    - Queue kernel bi tran (IN_Q_OVERFLOW) → bao cho ben goi quet lai ca folder
+    - Khong co inotify (Windows, macOS) / folder mang (NFS, CIFS: kernel khong
+      thay file do may khac ghi) → inotify_supported() = False, dung polling
+
+Khong phu thuoc module khac (chi dung ctypes, select cua Python)
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")   # wd, mask, cookie, len
+NETWORK_FS_TYPES = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs", "ceph")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return _libc
+
+
+def inotify_supported(folder: str) -> bool:
+    """True neu dung duoc inotify cho folder (Linux + folder khong nam tren o mang)"""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        _get_libc().inotify_init1
+    except (OSError, AttributeError):
+        return False
+    return not is_network_fs(folder)
+
+
+def is_network_fs(folder: str) -> bool:
+    """Folder nam tren o mang (theo /proc/mounts, mount point dai nhat chua folder)"""
+    path = os.path.realpath(folder)
+    best, fs_type = "", ""
+    try:
+        with open("/proc/mounts", "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) \
+                        and len(mount_point) > len(best):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:
+        return False
+    return fs_type in NETWORK_FS_TYPES
+
+
+class InotifyWatcher:
+    """
+    Cach dung:
+        watcher = InotifyWatcher("images/CAM1", (".jpg", ".png"), on_event=event.set)
+        watcher.start()
+        names, overflow = watcher.drain()   # Ten file moi tu lan drain truoc
+        watcher.stop()
+    """
+
+    def __init__(self, folder: str, extensions: Tuple[str, ...],
+                 on_event: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            folder: Folder can theo doi
+            extensions: Duoi file quan tam (chu thuong, VD: (".jpg", ".png"))
+            on_event: Goi (tu thread nen) moi khi co file moi
+        """
+        self.folder = folder
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.on_event = on_event
+        self._fd = -1
+        self._names = deque()
+        self._overflow = False
+        self._running = False
+        self._thread = None
+
+        # Thong ke
+        self.total_events = 0
+        self.total_overflows = 0
+
+    def start(self) -> None:
+        """Dang ky inotify + khoi dong thread doc su kien"""
+        libc = _get_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        wd = libc.inotify_add_watch(fd, os.fsencode(self.folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch({self.folder}) failed: {os.strerror(err)}")
+
+        self._fd = fd
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name=f"inotify-{os.path.basename(self.folder)}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Dung thread, dong fd"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def drain(self) -> Tuple[List[str], bool]:
+        """
+        Lay ten file moi tu lan goi truoc.
+
+        Returns:
+            tuple: (names, overflow) - overflow True → co the da mat su kien, can quet lai folder
+        """
+        names = []
+        while self._names:
+            names.append(self._names.popleft())
+        overflow, self._overflow = self._overflow, False
+        return names, overflow
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _read_loop(self) -> None:
+        while self._running:
+            try:
+                readable, _, _ = select.select([self._fd], [], [], 1.0)
+            except (OSError, ValueError):
+                break
+            if not readable:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                print(f"[INOTIFY] ERROR: {self.folder}: {e}")
+                break
+
+            found = False
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip(b"\0").decode("utf-8", errors="replace")
+                offset += name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    self._overflow = True
+                    self.total_overflows += 1
+                    found = True
+                elif mask & IN_IGNORED:
+                    print(f"[INOTIFY] WARNING: Watch removed: {self.folder}")
+                    self._running = False
+                elif name and name.lower().endswith(self.extensions):
+                    self._names.append(name)
+                    self.total_events += 1
+                    found = True
+
+            if found and self.on_event is not None:
+                self.on_event()
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test: ghi file → nhan su kien ngay, file .txt bi bo qua"""
+    import time
+    import shutil
+    import tempfile
+
+    print("[TEST] Inotify Watcher\n")
+    folder = tempfile.mkdtemp()
+    print(f"[OK] Supported: {inotify_supported(folder)}")
+    if not inotify_supported(folder):
+        return
+
+    event = threading.Event()
+    watcher = InotifyWatcher(folder, (".jpg", ".png"), on_event=event.set)
+    watcher.start()
+
+    start = time.perf_counter()
+    with open(os.path.join(folder, "a.jpg"), "wb") as f:
+        f.write(b"data")
+    with open(os.path.join(folder, "note.txt"), "wb") as f:
+        f.write(b"ignored")
+    event.wait(1.0)
+    print(f"[OK] Event after {(time.perf_counter() - start) * 1000:.2f}ms: {watcher.drain()}")
+
+    watcher.stop()
+    shutil.rmtree(folder, ignore_errors=True)
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Module: inspection
+Chuc nang: Danh gia ket qua detect cua 1 batch (dung chung cho main.py va replay_benchmark.py)
+    - judge_item(): compare vi tri + goc cho 1 ROI (ket qua luu lai trong item)
+    - judge_camera(): tat ca ROI cua 1 camera → roi_results / du lieu GUI / du lieu ve anh
+    - judge_detections(): tat ca camera (song song neu co executor) + aggregate_results
+      (camera khong co anh - batch ghep thieu → ROI cua camera do NG "MISSING_IMAGE")
+    - detect_fail_fast(): inference fail-fast (thu tu theo ROIScheduler, bao NG dau tien
+      qua callback, ROI con lai bo qua / chay tiep)
+    - Khong gui COM, khong ghi log, khong ve anh → ben goi tu quyet dinh
+
+Phu thuoc: comparator, result_manager, batch_detector, perf_stats
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from modules.comparator import compare_detection, compare_angle
+from modules.result_manager import aggregate_results
+from modules.batch_detector import prepare_batch_calls, run_batch_call
+from modules import perf_stats
+
+
+def detect_fail_fast(images: Dict[str, Any], roi_rules: List[Dict], cameras: List[str],
+                     plan: Dict[str, List[Dict]], scheduler, product_code: str,
+                     remaining: str = "skip", stride_align: bool = False, auto_imgsz: bool = False,
+                     missing: bool = False,
+                     on_ng: Optional[Callable[[str], None]] = None) -> Dict[str, List[Dict]]:
+    """
+    Inference fail-fast: goi tung model theo thu tu cua scheduler
+    (ti le NG cao / chi phi thap truoc), compare ngay sau moi lan goi.
+    ROI dau tien NG → on_ng(ly do) ngay. Cac lan goi con lai:
+        - "skip": bo qua (item["skipped"] = True)
+        - "background": van chay (du log / anh ket qua)
+    
+    Args:
+        images, roi_rules, cameras, plan, stride_align, auto_imgsz: nhu run_batch_detection()
+        scheduler: ROIScheduler (thu tu goi + hoc ti le NG / thoi gian)
+        product_code: Key thong ke cua scheduler
+        remaining: "skip" / "background"
+        missing: Batch thieu anh camera → NG truoc khi infer
+        on_ng: Goi 1 lan khi biet batch NG (ly do: "missing image" / "ROI error" / roi_id)
+        
+    Returns:
+        Dict: {"CAM1": [item, ...], ...} (nhu run_batch_detection)
+    """
+    items_by_cam, calls = prepare_batch_calls(images, roi_rules, cameras=cameras, plan=plan,
+                                              stride_align=stride_align, auto_imgsz=auto_imgsz)
+    
+    # Thieu anh camera / loi load model / crop → NG truoc khi infer
+    failed = missing or any(item["error"] is not None for items in items_by_cam.values() for item in items)
+    if failed and on_ng is not None:
+        on_ng("missing image" if missing else "ROI error")
+    
+    for call in scheduler.order(product_code, calls):
+        if failed and remaining == "skip":
+            for job in call["jobs"]:
+                for item in job["items"]:
+                    item["skipped"] = True
+            continue
+        
+        start = time.time()
+        items = run_batch_call(call)
+        scheduler.record_call(product_code, call, (time.time() - start) * 1000)
+        
+        for item in items:
+            try:
+                passed = judge_item(item)[0]
+            except Exception:
+                passed = False
+            scheduler.record_roi(product_code, item["rule"]["roi_id"], passed)
+            if not passed and not failed:
+                failed = True
+                if on_ng is not None:
+                    on_ng(item["rule"]["roi_id"])
+    return items_by_cam
+
+
+def judge_detections(batch_num: int, images: Dict[str, Any], detections: Dict[str, List[Dict]],
+                     used_cameras: List[str], executor=None,
+                     missing_rules: Optional[List[Dict]] = None) -> dict:
+    """
+    Compare tat ca ROI cua 1 batch, ket qua theo thu tu used_cameras / CSV.
+    
+    Args:
+        batch_num: So thu tu batch (chi dung cho log)
+        images: {"CAM1": anh, ...}
+        detections: Ket qua run_batch_detection()
+        used_cameras: Thu tu camera (chi camera co anh)
+        executor: Xu ly cac camera song song (None → tuan tu)
+        missing_rules: Rule cua camera khong co anh (→ NG)
+        
+    Returns:
+        dict: {"final_status", "roi_results", "gui_roi_items", "visualizations", "log_lines"}
+    """
+    # Xu ly tung camera (song song neu co executor)
+    camera_results = map_cameras(
+        executor,
+        lambda cam: judge_camera(batch_num, cam, images[cam], detections[cam]),
+        used_cameras
+    )
+    
+    judged = {"roi_results": [], "gui_roi_items": [], "visualizations": [], "log_lines": []}
+    for result in camera_results:
+        for key in judged:
+            judged[key].extend(result[key])
+    
+    for rule in missing_rules or []:
+        judged["log_lines"].append(f"  {rule['roi_id']}: NG (MISSING_IMAGE {rule['camera']})")
+        judged["roi_results"].append({
+            "roi_id": rule["roi_id"],
+            "camera": rule["camera"],
+            "pass": False,
+            "reason": "MISSING_IMAGE"
+        })
+    
+    # Tinh ket qua batch
+    judged["final_status"] = aggregate_results(judged["roi_results"])
+    return judged
+
+
+def judge_camera(batch_num: int, cam: str, image, detections: list) -> dict:
+    """
+    Compare tat ca ROI cua 1 camera (khong dung chung du lieu voi camera khac).
+    Log duoc gom lai (log_lines) de in theo dung thu tu camera.
+    
+    Returns:
+        dict: {"roi_results", "gui_roi_items", "visualizations", "log_lines"}
+    """
+    roi_results = []
+    gui_roi_items = []
+    visualizations = []
+    log_lines = [f"[BATCH {batch_num}] Processing {cam} - {image.shape}"]
+    
+    for item in detections:
+        rule = item["rule"]
+        if item.get("skipped"):
+            log_lines.append(f"  {rule['roi_id']}: SKIPPED (fail-fast)")
+            roi_results.append({
+                "roi_id": rule["roi_id"],
+                "camera": cam,
+                "pass": False,
+                "skipped": True,
+                "reason": "SKIPPED_FAIL_FAST"
+            })
+            continue
+        
+        try:
+            roi_data = item["roi_data"]
+            detect_result = item["detect_result"]
+            passed, reason, angle_info = judge_item(item)
+            
+            # Ve hinh anh ket qua o stage persistence (VAN luu file nhu cu)
+            roi_data["rule"] = rule
+            visualizations.append({
+                "camera": cam,
+                "roi_data": roi_data,
+                "detect_result": detect_result,
+                "passed": passed,
+                "angle_info": angle_info,
+            })
+            
+            status_str = "OK" if passed else "NG"
+            log_lines.append(f"  {rule['roi_id']}: {status_str} ({reason})")
+            
+            roi_results.append({
+                "roi_id": rule["roi_id"],
+                "camera": cam,
+                "pass": passed,
+                "reason": reason
+            })
+            
+            # === THEM: Gom data cho GUI ===
+            gui_roi_items.append({
+                "roi_id": rule["roi_id"],
+                "camera": cam,
+                "crop_image": roi_data["detect_image"],
+                "passed": passed,
+                "reason": reason,
+                "detect_result": detect_result,
+                "detect_roi": rule["detect_roi"],
+                "compare_roi": rule["compare_roi"],
+                "angle_info": angle_info,
+            })
+            
+        except Exception as e:
+            log_lines.append(f"  [ERROR] {rule['roi_id']}: {str(e)}")
+            roi_results.append({
+                "roi_id": rule["roi_id"],
+                "camera": cam,
+                "pass": False,
+                "reason": f"ERROR: {str(e)}"
+            })
+    
+    return {
+        "roi_results": roi_results,
+        "gui_roi_items": gui_roi_items,
+        "visualizations": visualizations,
+        "log_lines": log_lines,
+    }
+
+
+def judge_item(item: dict) -> tuple:
+    """
+    Compare vi tri (+ goc neu co config) cho 1 ROI. Ket qua duoc luu lai trong item
+    (fail-fast da compare o stage inference → judgement khong tinh lai).
+    
+    Returns:
+        tuple: (passed, reason, angle_info)
+        
+    Raises:
+        Exception: Loi crop / inference cua ROI
+    """
+    if item["error"] is not None:
+        raise item["error"]
+    if "judgement" in item:
+        return item["judgement"]
+    
+    with perf_stats.timer("compare"):
+        item["judgement"] = _compare_item(item)
+    return item["judgement"]
+
+
+def _compare_item(item: dict) -> tuple:
+    """Compare vi tri + goc (xem judge_item())"""
+    rule = item["rule"]
+    detect_result = item["detect_result"]
+    
+    passed, reason = compare_detection(
+        detect_result,
+        rule["compare_roi"]
+    )
+    
+    # === Keypoint angle check (neu co config) ===
+    angle_info = {}
+    if rule.get("keypoint_idx_1") is not None:
+        if detect_result.get("found"):
+            # Tinh goc (luon tinh de hien thi debug)
+            angle_passed, angle_reason, angle_info = compare_angle(
+                detect_result,
+                rule["keypoint_idx_1"],
+                rule["keypoint_idx_2"],
+                rule["expected_angle"],
+                rule["angle_tolerance"]
+            )
+            # Goc sai → NG (chi khi vi tri da OK)
+            if passed and not angle_passed:
+                passed = False
+                reason = angle_reason
+    
+    return passed, reason, angle_info
+
+
+def map_cameras(executor, fn, cameras: list) -> list:
+    """
+    Goi fn(cam) cho tung camera, tra ve list ket qua theo dung thu tu cameras.
+    executor None → chay tuan tu.
+    """
+    if executor is None or len(cameras) < 2:
+        return [fn(cam) for cam in cameras]
+    return list(executor.map(fn, cameras))
@@ -0,0 +1,193 @@
+"""
+Module: metrics_server
+Chuc nang: HTTP endpoint (localhost) tra ve metrics dang Prometheus text
+    - Chay trong thread nen (daemon), moi request xu ly o thread rieng
+    - Collector: ham tra ve list metric, chi DOC counter san co
+      (ResultGUI, COMOutput.get_stats, COMProductReader.get_stats, perf_stats, ...)
+      → scrape khong bao gio block vong lap kiem tra
+    - GET /metrics → text/plain; version=0.0.4
+
+Khong phu thuoc module khac (chi dung http.server cua Python)
+"""
+
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Metric: (name, type, help, [(labels, value), ...])
+#   type: "counter" / "gauge" / "histogram"
+#   histogram: sample name co hau to (_bucket / _sum / _count) nam trong labels["__name__"]
+Sample = Tuple[Dict[str, str], float]
+Metric = Tuple[str, str, str, List[Sample]]
+
+
+class MetricsServer:
+    """
+    Cach dung:
+        server = MetricsServer(port=9108)
+        server.add_collector(lambda: [("visionai_batches_total", "counter", "Batches", [({}, 12)])])
+        server.start()
+        # curl http://127.0.0.1:9108/metrics
+        server.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108):
+        """
+        Args:
+            host: Dia chi bind (mac dinh chi localhost)
+            port: Cong HTTP
+        """
+        self.host = host
+        self.port = port
+        self._collectors: List[Callable[[], List[Metric]]] = []
+        self._server = None
+        self._thread = None
+
+        # Thong ke
+        self.total_scrapes = 0
+        self.total_errors = 0
+
+    def add_collector(self, collector: Callable[[], List[Metric]]) -> None:
+        """Them ham thu thap metric (goi moi lan scrape)"""
+        self._collectors.append(collector)
+
+    def start(self) -> None:
+        """Mo cong HTTP trong thread nen"""
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics_server.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Khong in log moi request
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics-server", daemon=True)
+        self._thread.start()
+        print(f"[METRICS] Serving http://{self.host}:{self.port}/metrics")
+
+    def stop(self) -> None:
+        """Dong cong HTTP"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            print(f"[METRICS] Stopped. Scrapes: {self.total_scrapes}, errors: {self.total_errors}")
+
+    def render(self) -> str:
+        """Goi tat ca collector → text Prometheus (collector loi bi bo qua)"""
+        self.total_scrapes += 1
+        lines = []
+        for collector in self._collectors:
+            try:
+                metrics = collector()
+            except Exception as e:
+                self.total_errors += 1
+                lines.append(f"# collector error: {type(e).__name__}: {e}")
+                continue
+            for metric in metrics:
+                lines.extend(format_metric(*metric))
+        lines.append(f"visionai_metrics_scrapes_total {self.total_scrapes}")
+        return "\n".join(lines) + "\n"
+
+
+class RateMeter:
+    """Toc do (/giay) cua 1 counter trong cua so thoi gian gan nhat"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._points = deque()   # (time, total)
+
+    def rate(self, total: float) -> float:
+        now = time.time()
+        self._points.append((now, total))
+        while len(self._points) > 2 and now - self._points[0][0] > self.window:
+            self._points.popleft()
+        t0, v0 = self._points[0]
+        return (total - v0) / (now - t0) if now > t0 else 0.0
+
+
+def format_metric(name: str, metric_type: str, help_text: str, samples: List[Sample]) -> List[str]:
+    """1 metric → cac dong text Prometheus"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        labels = dict(labels)
+        sample_name = name + labels.pop("__name__", "")
+        label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{sample_name}{{{label_str}}} {_format_value(value)}" if label_str
+                     else f"{sample_name} {_format_value(value)}")
+    return lines
+
+
+def histogram_samples(histograms: Dict[str, dict], label: str = "stage",
+                      scale: float = 0.001) -> List[Sample]:
+    """
+    Histogram tu perf_stats.get_histograms() → samples Prometheus
+    (scale 0.001: ms → giay theo quy uoc Prometheus)
+    """
+    samples = []
+    for key, hist in histograms.items():
+        for le, count in hist["buckets"]:
+            le_str = "+Inf" if le == float("inf") else _format_value(le * scale)
+            samples.append(({"__name__": "_bucket", label: key, "le": le_str}, count))
+        samples.append(({"__name__": "_sum", label: key}, hist["sum_ms"] * scale))
+        samples.append(({"__name__": "_count", label: key}, hist["count"]))
+    return samples
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test: mo endpoint, scrape 1 lan"""
+    import urllib.request
+
+    print("[TEST] Metrics Server\n")
+
+    counter = {"batches": 0}
+    server = MetricsServer(port=9108)
+    server.add_collector(lambda: [
+        ("visionai_batches_total", "counter", "Batches processed", [({}, counter["batches"])]),
+        ("visionai_queue_depth", "gauge", "Queue depth", [({"queue": "infer"}, 1)]),
+        ("visionai_stage_latency_seconds", "histogram", "Stage latency",
+         histogram_samples({"inference": {"buckets": [(10, 3), (float("inf"), 4)],
+                                          "count": 4, "sum_ms": 52.0}})),
+    ])
+    server.start()
+
+    counter["batches"] = 5
+    with urllib.request.urlopen("http://127.0.0.1:9108/metrics") as resp:
+        print(resp.read().decode())
+
+    server.stop()
+    print("[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
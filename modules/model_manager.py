@@ -1,16 +1,267 @@
 """
 Module: model_manager
-Chuc nang: Quan ly va cache model YOLO
-Khong phu thuoc: Khong import module khac tu project
+Chuc nang: Quan ly va cache model YOLO (LRU co gioi han, preload + warm-up)
+    - Model duoc tao qua inference_engine (ultralytics / onnx / fake)
+Phu thuoc: inference_engine
 """
 
-from ultralytics import YOLO
-from typing import Optional
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import hashlib
 import os
+import time
+import threading
 
-_model_cache = {}
+from modules.inference_engine import InferenceEngine, BACKENDS, create_engine
+from modules.roi_manager import pad_to_stride
+from modules.detector import get_model_stride
 
-def get_model(model_name: str) -> YOLO:
+
+class ModelCache:
+    """
+    Cache model co gioi han (LRU) theo so luong va/hoac dung luong RAM.
+    
+    - Vuot gioi han → xoa model dung lau nhat (tru model dang "pin")
+    - Model co file weight giong het nhau (cung hash) → dung chung 1 object
+    - Pin model cua product hien tai → doi product khong xoa model dung chung
+    - Thong ke: hit, miss, eviction, thoi gian load
+    
+    Cach dung:
+        cache = ModelCache(max_entries=4, max_memory_mb=2048)
+        model = cache.get("MarkF")
+        cache.pin(["MarkF", "MarkG"])
+        print(cache.get_stats())
+    """
+    
+    def __init__(self, max_entries: int = 0, max_memory_mb: float = 0,
+                 models_dir: str = "models", backend: str = "ultralytics",
+                 engine_options: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            max_entries: So model toi da trong cache (0 = khong gioi han)
+            max_memory_mb: Tong dung luong weight toi da (MB, 0 = khong gioi han)
+            models_dir: Thu muc chua file .pt
+            backend: "ultralytics" (PyTorch), "onnx" (ONNX Runtime CPU)
+                     hoac "fake" (gia lap, khong can file weight)
+            engine_options: Tham so backend (xem inference_engine.create_engine())
+        """
+        self.max_entries = max_entries
+        self.max_memory_mb = max_memory_mb
+        self.models_dir = models_dir
+        self.backend = backend
+        self.engine_options = engine_options or {}
+        
+        self._entries = OrderedDict()   # model_name -> {"hash", "size_mb"} (LRU: cu → moi)
+        self._by_hash = {}              # hash -> InferenceEngine (1 object / file weight)
+        self._name_hash = {}            # model_name -> hash (giu ca sau khi evict)
+        self._pinned = set()
+        self._loading = {}              # hash -> (model_name, Future) dang load (ngoai lock)
+        self._lock = threading.RLock()
+        
+        # Thong ke
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dedup_hits = 0
+        self.total_load_time = 0.0
+        self._last_stats = {}
+    
+    def get(self, model_name: str) -> InferenceEngine:
+        """
+        Lay model tu cache, load neu chua co (xem get_model()).
+        Hash + load weight chay ngoai lock cua cache: model khac van lay duoc
+        trong luc load; nhieu thread cung can 1 weight → chi 1 thread load,
+        cac thread con lai cho ket qua (Future).
+        """
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is not None:
+                self._entries.move_to_end(model_name)
+                self.hits += 1
+                return self._by_hash[entry["hash"]]
+            self.misses += 1
+        
+        model_path = os.path.join(self.models_dir, f"{model_name}.pt")
+        if self.backend == "fake":
+            file_hash = f"fake:{model_name}"  # Engine gia lap khong can file weight
+        elif not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        else:
+            file_hash = _file_hash(model_path)
+        
+        with self._lock:
+            self._name_hash[model_name] = file_hash
+            engine = self._by_hash.get(file_hash)
+            loader, loading = self._loading.get(file_hash, (model_name, None))
+            owner = engine is None and loading is None
+            if owner:
+                loading = Future()  # Placeholder: dang load
+                self._loading[file_hash] = (model_name, loading)
+        
+        if owner:
+            try:
+                start = time.time()
+                engine = create_engine(self.backend, model_name, model_path,
+                                       file_hash, self.engine_options)
+                load_time = time.time() - start
+            except Exception as e:
+                loading.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    self._loading.pop(file_hash, None)
+            with self._lock:
+                self._by_hash[file_hash] = engine
+                self.total_load_time += load_time
+            print(f"[LOAD] Model '{model_name}' loaded ({self.backend}, {load_time:.2f}s)")
+            loading.set_result(engine)
+        else:
+            if engine is None:
+                engine = loading.result()  # Thread khac dang load → cho (load loi → raise lai)
+            if loader != model_name:
+                # Weight giong model khac → dung chung
+                self.dedup_hits += 1
+                print(f"[LOAD] Model '{model_name}' shares weights with a cached model")
+        
+        # Publish: them vao LRU
+        with self._lock:
+            self._by_hash.setdefault(file_hash, engine)
+            self._entries[model_name] = {"hash": file_hash, "size_mb": engine.size_mb()}
+            self._entries.move_to_end(model_name)
+            self._evict()
+            return engine
+    
+    def pin(self, model_names: List[str]) -> None:
+        """
+        Danh dau model cua product hien tai (khong bi evict).
+        Goi lai khi doi product: model chi dung o product cu duoc bo pin,
+        model dung chung giu nguyen trong cache.
+        """
+        with self._lock:
+            self._pinned = set(model_names)
+            self._evict()
+    
+    def lock_key(self, model_name: str) -> str:
+        """Key de khoa model: model dung chung weight → dung chung lock"""
+        with self._lock:
+            return self._name_hash.get(model_name, model_name)
+    
+    def clear(self) -> None:
+        """Xoa tat ca model khoi cache"""
+        with self._lock:
+            self._entries.clear()
+            self._by_hash.clear()
+    
+    def names(self) -> List[str]:
+        """Danh sach model trong cache (cu → moi)"""
+        with self._lock:
+            return list(self._entries.keys())
+    
+    def memory_mb(self) -> float:
+        """Tong dung luong (MB) cac weight dang load (moi hash tinh 1 lan)"""
+        with self._lock:
+            sizes = {e["hash"]: e["size_mb"] for e in self._entries.values()}
+            return sum(sizes.values())
+    
+    def get_stats(self, blocking: bool = True) -> dict:
+        """
+        Lay thong ke.
+        blocking=False: lock dang ban → tra ve thong ke lan truoc
+        """
+        if not self._lock.acquire(blocking):
+            return dict(self._last_stats)
+        try:
+            self._last_stats = {
+                "backend": self.backend,
+                "entries": len(self._entries),
+                "unique_weights": len(self._by_hash),
+                "memory_mb": round(self.memory_mb(), 1),
+                "max_entries": self.max_entries,
+                "max_memory_mb": self.max_memory_mb,
+                "pinned": sorted(self._pinned),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "dedup_hits": self.dedup_hits,
+                "total_load_time": round(self.total_load_time, 3),
+            }
+            return dict(self._last_stats)
+        finally:
+            self._lock.release()
+    
+    def _over_budget(self) -> bool:
+        if self.max_entries and len(self._entries) > self.max_entries:
+            return True
+        if self.max_memory_mb and self.memory_mb() > self.max_memory_mb:
+            return True
+        return False
+    
+    def _evict(self) -> None:
+        """Xoa model LRU (khong pin) cho den khi nam trong gioi han"""
+        while self._over_budget():
+            victim = next((name for name in self._entries if name not in self._pinned), None)
+            if victim is None:
+                break  # Tat ca deu dang pin → chap nhan vuot gioi han
+            
+            file_hash = self._entries.pop(victim)["hash"]
+            if not any(e["hash"] == file_hash for e in self._entries.values()):
+                del self._by_hash[file_hash]
+            self.evictions += 1
+            print(f"[EVICT] Model '{victim}' removed from cache")
+
+
+def _file_hash(path: str) -> str:
+    """SHA1 cua file weight (de nhan ra 2 file .pt giong nhau)"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_cache = ModelCache()
+_model_locks = {}                 # lock key -> Lock (engine/predictor khong thread-safe)
+_locks_guard = threading.Lock()
+_pool = None                      # InferencePool (None = infer trong process chinh)
+
+
+def configure_cache(max_entries: int = 0, max_memory_mb: float = 0) -> None:
+    """
+    Dat gioi han cho cache model (0 = khong gioi han)
+    
+    Args:
+        max_entries: So model toi da
+        max_memory_mb: Tong dung luong weight toi da (MB)
+    """
+    _cache.max_entries = max_entries
+    _cache.max_memory_mb = max_memory_mb
+    print(f"[CACHE] Limits: max_entries={max_entries or '-'}, max_memory_mb={max_memory_mb or '-'}")
+
+
+def configure_backend(backend: str = "ultralytics",
+                      engine_options: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Chon backend inference cho cac model load sau nay.
+    
+    Args:
+        backend: "ultralytics" (PyTorch), "onnx" (ONNX Runtime CPU)
+                 hoac "fake" (gia lap - benchmark/load test khong can weight)
+        engine_options: Section "inference" trong config
+                        (onnx_cache_dir, onnx_threads, fake: {...})
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid inference backend: {backend}")
+    
+    if backend != _cache.backend:
+        _cache.clear()  # Model da load theo backend cu khong dung lai duoc
+    _cache.backend = backend
+    _cache.engine_options = engine_options or {}
+    print(f"[BACKEND] Inference backend: {backend}")
+
+
+def get_model(model_name: str) -> InferenceEngine:
     """
     Tải hay lấy model từ cache
     
@@ -18,32 +269,141 @@ def get_model(model_name: str) -> YOLO:
         model_name (str): Tên model (không .pt, VD: "MarkF")
         
     Returns:
-        YOLO: Model YOLO đã tải
+        InferenceEngine: Model đã tải (theo backend đang chọn)
         
     Raises:
         FileNotFoundError: File model không tồn tại
     """
-    if model_name not in _model_cache:
-        model_path = f"models/{model_name}.pt"
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model not found: {model_path}")
-        _model_cache[model_name] = YOLO(model_path)
-        print(f"[LOAD] Model '{model_name}' loaded")
-    else:
-        print(f"[CACHE] Model '{model_name}' from cache")
+    if _pool is not None:
+        return _pool.get_engine(model_name)
+    return _cache.get(model_name)
+
+
+def set_inference_pool(pool: Optional[Any]) -> None:
+    """
+    Chuyen inference sang InferencePool (modules/inference_pool.py):
+    get_model() tra ve engine dai dien, model duoc load 1 lan trong worker.
+    None → quay lai infer trong process chinh.
+    """
+    global _pool
+    _pool = pool
+    print(f"[BACKEND] Inference pool: {'on' if pool is not None else 'off'}")
+
+
+def set_active_models(model_names: List[str]) -> None:
+    """
+    Pin model cua product hien tai (goi luc start + doi product).
+    Model dung chung giua product cu va moi khong bi xoa/load lai.
+    """
+    _cache.pin(model_names)
+
+
+def model_lock(model_name: str) -> threading.Lock:
+    """
+    Lock rieng cho tung model - giu lock khi goi model(...) neu co
+    nhieu thread dung chung 1 model (VD: warm-up chay nen + batch chinh)
+    """
+    key = _cache.lock_key(model_name)
+    with _locks_guard:
+        if key not in _model_locks:
+            _model_locks[key] = threading.Lock()
+        return _model_locks[key]
+
+
+def preload_models(roi_rules: List[Dict], warmup: bool = True,
+                   background: bool = True, stride_align: bool = False,
+                   auto_imgsz: bool = False) -> Optional[threading.Thread]:
+    """
+    Load truoc tat ca model cua product + chay 1 lan inference gia
+    (dung kich thuoc crop cua tung rule) de warm-up kernel/allocator.
+    Batch dau tien se chay o toc do on dinh thay vi mat ~2s load model.
+    
+    Args:
+        roi_rules: Danh sach rule tu load_product_csv()
+        warmup: Chay inference gia sau khi load
+        background: Chay trong thread nen (khong block vong lap chinh)
+        stride_align, auto_imgsz: Nhu run_batch_detection() → warm-up dung
+            kich thuoc anh / imgsz ma batch that se chay
+        
+    Returns:
+        Thread dang chay (neu background) hoac None
+    """
+    # model_name -> [(h, w, imgsz), ...] (giu thu tu CSV, bo trung)
+    warmup_shapes = {}
+    for rule in roi_rules:
+        x1, y1, x2, y2 = rule["detect_roi"]
+        shape = (max(y2 - y1, 1), max(x2 - x1, 1), rule.get("imgsz"))
+        shapes = warmup_shapes.setdefault(rule["model_name"], [])
+        if shape not in shapes:
+            shapes.append(shape)
+    
+    if background:
+        thread = threading.Thread(
+            target=_preload_worker, args=(warmup_shapes, warmup, stride_align, auto_imgsz),
+            name="model-preload", daemon=True
+        )
+        thread.start()
+        return thread
+    
+    _preload_worker(warmup_shapes, warmup, stride_align, auto_imgsz)
+    return None
+
+
+def _preload_worker(warmup_shapes: Dict[str, list], warmup: bool,
+                    stride_align: bool = False, auto_imgsz: bool = False) -> None:
+    """Load + warm-up tung model (loi 1 model khong anh huong model khac)"""
+    start = time.time()
+    loaded = 0
+    for model_name, shapes in warmup_shapes.items():
+        try:
+            model = get_model(model_name)
+            loaded += 1
+        except Exception as e:
+            print(f"[PRELOAD] WARNING: Cannot load '{model_name}': {e}")
+            continue
+        
+        if not warmup:
+            continue
+        
+        # Warm-up dung nhu batch that (prepare_batch_calls): crop pad theo stride,
+        # auto_imgsz → imgsz = canh lon nhat cua crop; 1 lan goi / imgsz voi list crop
+        stride = get_model_stride(model) if stride_align else 0
+        by_imgsz = {}
+        for h, w, imgsz in shapes:
+            dummy = np.zeros((h, w, 3), dtype=np.uint8)
+            if stride:
+                dummy = pad_to_stride(dummy, stride)
+            if imgsz is None and auto_imgsz:
+                imgsz = max(dummy.shape[:2])
+            by_imgsz.setdefault(imgsz, []).append(dummy)
+        
+        for imgsz, dummies in by_imgsz.items():
+            try:
+                with model_lock(model_name):
+                    model.infer(dummies, imgsz=imgsz)
+            except Exception as e:
+                print(f"[PRELOAD] WARNING: Warm-up '{model_name}' failed: {e}")
     
-    return _model_cache[model_name]
+    print(f"[PRELOAD] {loaded}/{len(warmup_shapes)} model(s) ready in {time.time() - start:.2f}s")
 
 
 def clear_cache() -> None:
     """Xóa tất cả model khỏi cache"""
-    _model_cache.clear()
+    _cache.clear()
     print("[CLEAR] Cache cleared")
 
 
 def get_cached_models() -> list:
     """Lấy danh sách model đang trong cache"""
-    return list(_model_cache.keys())
+    return _cache.names()
+
+
+def get_cache_stats(blocking: bool = True) -> dict:
+    """
+    Thong ke cache: hit/miss/eviction/load time/memory
+    blocking=False: khong cho model dang load (dung cho metrics)
+    """
+    return _cache.get_stats(blocking)
 
 
 # ============================================================================
@@ -63,7 +423,8 @@ def main():
         print(f"[WARNING] {e}")
         print("[INFO] Tao file test...\n")
         os.makedirs("models", exist_ok=True)
-        print("[SKIP] Can't create dummy model, requires actual YOLO file\n")
+        print("[SKIP] Can't create dummy model, requires actual YOLO file")
+        print("[INFO] Dung configure_backend(\"fake\") de test khong can weight\n")
     
     # Test 2: Load same model again (from cache)
     print("[2] Test cache (load same model again):")
@@ -84,7 +445,10 @@ def main():
         print("[SKIP] Model file not found\n")
     
     # Test 4: Clear cache
-    print("[4] Test clear cache:")
+    print("[4] Test cache stats:")
+    print(f"[OK] Stats: {get_cache_stats()}\n")
+    
+    print("[5] Test clear cache:")
     clear_cache()
     cached = get_cached_models()
     print(f"[OK] Cached models after clear: {cached}\n")
@@ -0,0 +1,424 @@
+"""
+Module: onnx_backend
+Chuc nang: Chay inference YOLO bang ONNX Runtime (CPU) thay cho PyTorch
+    - Export models/<name>.pt → ONNX 1 lan, cache tren dia
+      (key = hash file weight + imgsz → doi weight tu dong export lai)
+    - Preprocess (letterbox), decode, NMS, keypoint bang numpy
+    - ONNXEngine (InferenceEngine) tra ve ket qua tho cung format voi
+      UltralyticsEngine → select_detection() / detect_object() dung duoc nhu cu
+    - check_parity(): so sanh ket qua ONNX voi PyTorch
+
+Phu thuoc: onnxruntime, numpy, cv2 (ultralytics chi can khi export)
+"""
+
+import os
+import ast
+import time
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from modules.inference_engine import InferenceEngine
+
+
+DEFAULT_IMGSZ = 640
+PAD_VALUE = 114
+MAX_WH = 7680        # Offset box theo class khi NMS (giong ultralytics)
+
+
+def get_onnx_path(model_name: str, file_hash: str, imgsz: int,
+                  cache_dir: str = "models/onnx_cache") -> str:
+    """Duong dan file ONNX da cache: <cache_dir>/<name>_<hash12>_<imgsz>.onnx"""
+    return os.path.join(cache_dir, f"{model_name}_{file_hash[:12]}_{imgsz}.onnx")
+
+
+def export_onnx(model_path: str, onnx_path: str, imgsz: int) -> str:
+    """
+    Export file .pt sang ONNX (chi chay neu chua co trong cache).
+
+    Args:
+        model_path: Duong dan file .pt
+        onnx_path: Duong dan file ONNX dich (trong cache)
+        imgsz: Kich thuoc anh inference (co dinh trong file ONNX, boi so stride)
+
+    Returns:
+        onnx_path
+    """
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    from ultralytics import YOLO
+
+    start = time.time()
+    print(f"[ONNX] Exporting {model_path} (imgsz={imgsz})...")
+    exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=False)
+
+    cache_dir = os.path.dirname(onnx_path) or "."
+    os.makedirs(cache_dir, exist_ok=True)
+    # File tam rieng (nhieu process export cung luc khong ghi de nhau) roi rename
+    # → khong de lai file ONNX do neu export bi ngat
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(onnx_path) + ".", suffix=".tmp",
+                                    dir=cache_dir)
+    os.close(fd)
+    try:
+        shutil.move(str(exported), tmp_path)
+        os.replace(tmp_path, onnx_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    print(f"[ONNX] Exported: {onnx_path} ({time.time() - start:.1f}s)")
+    return onnx_path
+
+
+class ONNXEngine(InferenceEngine):
+    """
+    Model YOLO chay bang ONNX Runtime.
+
+    Cach dung:
+        engine = ONNXEngine("MarkF", "models/MarkF.pt", file_hash)
+        raws = engine.infer([crop1, crop2], classes=[0], conf=0.3)
+        # raws[i]: {"xyxy", "cls", "conf", "keypoints"} (toa do tren anh crop)
+
+    Moi imgsz can 1 file ONNX rieng (export 1 lan, cache tren dia).
+    imgsz duoc lam tron len boi so stride (giong ultralytics) truoc khi export;
+    letterbox dung dung kich thuoc input cua file ONNX.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, model_path: str, file_hash: str,
+                 cache_dir: str = "models/onnx_cache", num_threads: int = 0):
+        """
+        Args:
+            model_name: Ten model (VD: "MarkF")
+            model_path: Duong dan file .pt goc
+            file_hash: Hash file .pt (key cache ONNX)
+            cache_dir: Thu muc cache file ONNX
+            num_threads: So thread ONNX Runtime (0 = mac dinh)
+        """
+        import onnxruntime as ort
+
+        self.ort = ort
+        self.model_name = model_name
+        self.model_path = model_path
+        self.file_hash = file_hash
+        self.cache_dir = cache_dir
+        self.num_threads = num_threads
+
+        self._sessions = {}   # imgsz -> (session, input_name, input_hw, metadata)
+        self.stride = 32
+
+        # Tao san session o imgsz mac dinh (export neu can)
+        self._get_session(DEFAULT_IMGSZ)
+
+    def align_imgsz(self, imgsz: Optional[int]) -> int:
+        """imgsz → boi so stride gan nhat (lam tron len), giong check_imgsz cua ultralytics"""
+        imgsz = imgsz or DEFAULT_IMGSZ
+        return -(-imgsz // self.stride) * self.stride
+
+    def _get_session(self, imgsz: int) -> tuple:
+        """Lay (hoac tao) session ONNX cho 1 imgsz (da lam tron theo stride)"""
+        if imgsz in self._sessions:
+            return self._sessions[imgsz]
+
+        onnx_path = export_onnx(
+            self.model_path,
+            get_onnx_path(self.model_name, self.file_hash, imgsz, self.cache_dir),
+            imgsz
+        )
+
+        options = self.ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        session = self.ort.InferenceSession(onnx_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+
+        metadata = _parse_metadata(session.get_modelmeta().custom_metadata_map)
+        self.stride = int(metadata.get("stride", self.stride))
+
+        # Input static (1, 3, H, W): letterbox theo dung H, W cua file ONNX
+        model_input = session.get_inputs()[0]
+        height, width = model_input.shape[2:4]
+        if not isinstance(height, int) or not isinstance(width, int):
+            height = width = imgsz   # Input dynamic → dung imgsz
+        entry = (session, model_input.name, (height, width), metadata)
+        self._sessions[imgsz] = entry
+        return entry
+
+    def size_mb(self) -> float:
+        """Dung luong cac file ONNX dang mo (MB)"""
+        paths = [get_onnx_path(self.model_name, self.file_hash, imgsz, self.cache_dir)
+                 for imgsz in self._sessions]
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p)) / (1024 * 1024)
+
+    def infer(self, images: List[Any],
+              classes: Optional[List[int]] = None,
+              conf: Optional[float] = None,
+              iou: Optional[float] = None,
+              max_det: Optional[int] = None,
+              imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Inference list anh, tra ve ket qua tho (format InferenceEngine).
+        Tham so mac dinh giong ultralytics: conf=0.25, iou=0.7, max_det=300.
+        """
+        session, input_name, input_hw, metadata = self._get_session(self.align_imgsz(imgsz))
+        num_classes = len(metadata.get("names", {})) or 1
+        kpt_shape = metadata.get("kpt_shape")
+        end2end = bool(metadata.get("end2end", False))
+
+        results = []
+        for image in images:
+            blob, scale, pad = letterbox(image, input_hw)
+            output = session.run(None, {input_name: blob})[0][0]
+
+            if end2end:
+                raw = _decode_end2end(output, kpt_shape)
+            else:
+                raw = _decode_raw(output, num_classes, kpt_shape)
+
+            raw = filter_and_nms(
+                raw,
+                classes=classes,
+                conf=0.25 if conf is None else conf,
+                iou=0.7 if iou is None else iou,
+                max_det=300 if max_det is None else max_det,
+                apply_nms=not end2end
+            )
+            results.append(_scale_back(raw, scale, pad, image.shape[:2]))
+
+        return results
+
+
+# ============================================================================
+# Preprocess / postprocess (numpy)
+# ============================================================================
+
+def letterbox(image: np.ndarray, imgsz: Union[int, Tuple[int, int]]
+              ) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """
+    Resize giu ti le + pad 114 ra giua (giong ultralytics LetterBox, auto=False).
+    imgsz: int (vuong) hoac (H, W) = input cua file ONNX
+
+    Returns:
+        (blob (1, 3, H, W) float32 RGB [0-1], scale, (pad_x, pad_y))
+    """
+    out_h, out_w = (imgsz, imgsz) if isinstance(imgsz, int) else imgsz
+    h, w = image.shape[:2]
+    scale = min(out_h / h, out_w / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (out_w - new_w) / 2, (out_h - new_h) / 2
+
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                               value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+
+    blob = image[:, :, ::-1].transpose(2, 0, 1)   # BGR → RGB, HWC → CHW
+    blob = np.ascontiguousarray(blob, dtype=np.float32)[None] / 255.0
+    return blob, scale, (left, top)
+
+
+def _decode_raw(output: np.ndarray, num_classes: int,
+                kpt_shape: Optional[list]) -> Dict[str, Any]:
+    """Output YOLOv8/11 (4 + nc + nk*kdim, N) → box xyxy, cls, conf, keypoints"""
+    preds = output.T
+    cx, cy, bw, bh = preds[:, 0], preds[:, 1], preds[:, 2], preds[:, 3]
+    xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+    scores = preds[:, 4:4 + num_classes]
+    cls = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), cls]
+
+    keypoints = None
+    if kpt_shape:
+        keypoints = preds[:, 4 + num_classes:].reshape(len(preds), kpt_shape[0], kpt_shape[1])
+
+    return {"xyxy": xyxy, "cls": cls, "conf": conf, "keypoints": keypoints}
+
+
+def _decode_end2end(output: np.ndarray, kpt_shape: Optional[list]) -> Dict[str, Any]:
+    """Output end2end (N, 6 + nk*kdim) = [x1, y1, x2, y2, conf, cls, kpts...] (da NMS)"""
+    keypoints = None
+    if kpt_shape:
+        keypoints = output[:, 6:].reshape(len(output), kpt_shape[0], kpt_shape[1])
+    return {
+        "xyxy": output[:, :4],
+        "cls": output[:, 5].astype(int),
+        "conf": output[:, 4],
+        "keypoints": keypoints,
+    }
+
+
+def filter_and_nms(raw: Dict[str, Any], classes: Optional[List[int]], conf: float,
+                   iou: float, max_det: int, apply_nms: bool = True) -> Dict[str, Any]:
+    """Loc conf/classes, NMS theo tung class (numpy), giu toi da max_det box"""
+    mask = raw["conf"] >= conf
+    if classes is not None:
+        mask &= np.isin(raw["cls"], classes)
+    idx = np.flatnonzero(mask)
+
+    if apply_nms and len(idx):
+        idx = idx[nms(raw["xyxy"][idx] + (raw["cls"][idx, None] * MAX_WH), raw["conf"][idx], iou)]
+    else:
+        idx = idx[np.argsort(-raw["conf"][idx], kind="stable")]
+    idx = idx[:max_det]
+
+    return {
+        "xyxy": raw["xyxy"][idx],
+        "cls": raw["cls"][idx],
+        "conf": raw["conf"][idx],
+        "keypoints": raw["keypoints"][idx] if raw["keypoints"] is not None else None,
+    }
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_thres: float) -> np.ndarray:
+    """Greedy NMS, tra ve index giu lai (conf giam dan)"""
+    order = np.argsort(-scores, kind="stable")
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        overlap = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[overlap <= iou_thres]
+
+    return np.array(keep, dtype=int)
+
+
+def _scale_back(raw: Dict[str, Any], scale: float, pad: Tuple[float, float],
+                shape: Tuple[int, int]) -> Dict[str, Any]:
+    """Chuyen toa do tu anh letterbox ve anh crop goc (clip trong anh)"""
+    h, w = shape
+    pad_x, pad_y = pad
+
+    xyxy = raw["xyxy"].astype(np.float32).copy()
+    xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / scale).clip(0, w)
+    xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / scale).clip(0, h)
+
+    keypoints = None
+    if raw["keypoints"] is not None:
+        kp = raw["keypoints"].astype(np.float32).copy()
+        kp[:, :, 0] = (kp[:, :, 0] - pad_x) / scale
+        kp[:, :, 1] = (kp[:, :, 1] - pad_y) / scale
+        if kp.shape[2] < 3:
+            kp = np.concatenate([kp, np.zeros(kp.shape[:2] + (1,), np.float32)], axis=2)
+        keypoints = kp[:, :, :3]
+
+    return {
+        "xyxy": xyxy,
+        "cls": raw["cls"].astype(int),
+        "conf": raw["conf"].astype(np.float32),
+        "keypoints": keypoints,
+    }
+
+
+def _parse_metadata(meta: Dict[str, str]) -> Dict[str, Any]:
+    """Metadata ultralytics ghi trong file ONNX (names, stride, kpt_shape, ...)"""
+    parsed = {}
+    for key, value in meta.items():
+        try:
+            parsed[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed[key] = value
+    return parsed
+
+
+# ============================================================================
+# Parity check
+# ============================================================================
+
+def check_parity(model_name: str, image: np.ndarray, imgsz: int = DEFAULT_IMGSZ,
+                 conf: float = 0.25, models_dir: str = "models",
+                 cache_dir: str = "models/onnx_cache",
+                 box_tol: float = 2.0, conf_tol: float = 0.02) -> Dict[str, Any]:
+    """
+    So sanh ket qua ONNX vs PyTorch (ultralytics) tren cung 1 anh.
+
+    Args:
+        model_name: Ten model (VD: "MarkF")
+        image: Anh test (numpy BGR)
+        imgsz, conf: Tham so inference
+        box_tol: Sai lech toi da toa do box (pixel)
+        conf_tol: Sai lech toi da confidence
+
+    Returns:
+        Dict: {"passed", "torch_boxes", "onnx_boxes", "max_box_diff", "max_conf_diff"}
+    """
+    from modules.inference_engine import UltralyticsEngine
+    from modules.model_manager import _file_hash
+
+    model_path = os.path.join(models_dir, f"{model_name}.pt")
+    torch_raw = UltralyticsEngine(model_path).infer([image], conf=conf, imgsz=imgsz)[0]
+    onnx_engine = ONNXEngine(model_name, model_path, _file_hash(model_path), cache_dir)
+    onnx_raw = onnx_engine.infer([image], conf=conf, imgsz=imgsz)[0]
+
+    report = {
+        "passed": True,
+        "torch_boxes": len(torch_raw["conf"]),
+        "onnx_boxes": len(onnx_raw["conf"]),
+        "max_box_diff": 0.0,
+        "max_conf_diff": 0.0,
+    }
+
+    if report["torch_boxes"] != report["onnx_boxes"]:
+        report["passed"] = False
+
+    # Ghep tung box PyTorch voi box ONNX cung class gan nhat
+    for i in range(report["torch_boxes"]):
+        same_cls = np.flatnonzero(onnx_raw["cls"] == torch_raw["cls"][i])
+        if not len(same_cls):
+            report["passed"] = False
+            continue
+        diffs = np.abs(onnx_raw["xyxy"][same_cls] - torch_raw["xyxy"][i]).max(axis=1)
+        j = same_cls[diffs.argmin()]
+        report["max_box_diff"] = max(report["max_box_diff"], float(diffs.min()))
+        report["max_conf_diff"] = max(report["max_conf_diff"],
+                                      float(abs(onnx_raw["conf"][j] - torch_raw["conf"][i])))
+
+    if report["max_box_diff"] > box_tol or report["max_conf_diff"] > conf_tol:
+        report["passed"] = False
+
+    status = "PASS" if report["passed"] else "FAIL"
+    print(f"[ONNX PARITY] {model_name}: {status} | boxes torch={report['torch_boxes']} "
+          f"onnx={report['onnx_boxes']} | max box diff={report['max_box_diff']:.2f}px "
+          f"| max conf diff={report['max_conf_diff']:.4f}")
+    return report
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """
+    Kiem tra parity ONNX vs PyTorch:
+        python -m modules.onnx_backend MarkF test.jpg [imgsz]
+    """
+    import sys
+
+    if len(sys.argv) < 3:
+        print(main.__doc__)
+        return
+
+    image = cv2.imread(sys.argv[2])
+    if image is None:
+        print(f"[ERROR] Cannot read image: {sys.argv[2]}")
+        return
+    imgsz = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_IMGSZ
+    check_parity(sys.argv[1], image, imgsz=imgsz)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Module: perf_stats
+Chuc nang: Do thoi gian tung stage (nhe, dung duoc tren line that)
+    - timer("stage") / @timed("stage"): bam gio 1 doan code / 1 ham
+    - Moi stage: histogram bucket co dinh (count/sum - dung cho metrics)
+      + cua so N mau gan nhat → p50 / p95 / p99 / max
+    - Ghi snapshot dinh ky ra file JSON-lines (1 dong / lan) de xem
+      cycle time bi ton o dau tren line dang chay
+    - disable() → record() khong lam gi (gan nhu khong ton chi phi)
+
+Khong phu thuoc module khac
+"""
+
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+# Bien tren cua bucket (ms) - bucket cuoi = +Inf
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class StageHistogram:
+    """Histogram thoi gian cua 1 stage"""
+
+    def __init__(self, window: int = 2000):
+        self.bucket_counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=window)   # Mau gan nhat (tinh percentile)
+
+    def record(self, ms: float) -> None:
+        self.bucket_counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.samples.append(ms)
+
+    def summary(self) -> dict:
+        """count / mean / p50 / p95 / p99 / max (percentile tren cua so mau gan nhat)"""
+        if not self.samples:
+            return {"count": self.count}
+        p50, p95, p99 = np.percentile(np.fromiter(self.samples, dtype=np.float64), [50, 95, 99])
+        return {
+            "count": self.count,
+            "mean": round(self.sum_ms / self.count, 2),
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "max": round(self.max_ms, 2),
+        }
+
+
+class PerfStats:
+    """
+    Tap hop histogram theo stage (thread-safe).
+
+    Cach dung (thuong dung qua ham module: timer(), timed(), record()):
+        with timer("inference"):
+            model.infer(...)
+    """
+
+    def __init__(self, window: int = 2000):
+        self.window = window
+        self.enabled = True
+        self.start_time = time.time()
+        self._stages: Dict[str, StageHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, ms: float) -> None:
+        """Ghi 1 mau thoi gian (ms) cho stage"""
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = StageHistogram(self.window)
+            hist.record(ms)
+
+    def summary(self) -> Dict[str, dict]:
+        """{stage: {"count", "mean", "p50", "p95", "p99", "max"}}"""
+        with self._lock:
+            return {stage: hist.summary() for stage, hist in sorted(self._stages.items())}
+
+    def histograms(self) -> Dict[str, dict]:
+        """{stage: {"buckets": [(le_ms, cumulative_count), ...], "count", "sum_ms"}}"""
+        with self._lock:
+            result = {}
+            for stage, hist in sorted(self._stages.items()):
+                cumulative, buckets = 0, []
+                for le, n in zip(list(BUCKETS_MS) + [float("inf")], hist.bucket_counts):
+                    cumulative += n
+                    buckets.append((le, cumulative))
+                result[stage] = {"buckets": buckets, "count": hist.count, "sum_ms": hist.sum_ms}
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages = {}
+            self.start_time = time.time()
+
+
+_stats = PerfStats()
+_writer_thread = None
+_writer_stop = threading.Event()
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def configure(enabled: bool = True, window: int = 2000) -> None:
+    """Bat/tat do thoi gian, so mau dung tinh percentile"""
+    _stats.enabled = enabled
+    _stats.window = window
+
+
+def record(stage: str, ms: float) -> None:
+    """Ghi 1 mau thoi gian (ms)"""
+    _stats.record(stage, ms)
+
+
+@contextmanager
+def timer(stage: str):
+    """Bam gio 1 doan code: with timer("crop"): ..."""
+    if not _stats.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stats.record(stage, (time.perf_counter() - start) * 1000)
+
+
+def timed(stage: str) -> Callable:
+    """Decorator bam gio ca ham: @timed("com_send")"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _stats.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _stats.record(stage, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+def reset() -> None:
+    """Xoa tat ca mau da ghi (VD: bo qua giai doan warm-up)"""
+    _stats.reset()
+
+
+def get_summary() -> Dict[str, dict]:
+    """Percentile theo stage"""
+    return _stats.summary()
+
+
+def get_histograms() -> Dict[str, dict]:
+    """Bucket tich luy theo stage (dung cho metrics endpoint)"""
+    return _stats.histograms()
+
+
+def format_summary(stages: Optional[List[str]] = None) -> str:
+    """Bang p50/p95/p99 (ms) de in ra console"""
+    summary = get_summary()
+    lines = [f"{'STAGE':<18} {'COUNT':>7} {'P50':>8} {'P95':>8} {'P99':>8} {'MAX':>8}"]
+    for stage, s in summary.items():
+        if (stages and stage not in stages) or "p50" not in s:
+            continue
+        lines.append(f"{stage:<18} {s['count']:>7} {s['p50']:>8.1f} {s['p95']:>8.1f} "
+                     f"{s['p99']:>8.1f} {s['max']:>8.1f}")
+    return "\n".join(lines)
+
+
+def write_snapshot(path: str) -> None:
+    """Ghi 1 dong JSON (thoi diem + percentile cac stage) vao cuoi file"""
+    snapshot = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "uptime_s": round(time.time() - _stats.start_time, 1),
+        "stages": get_summary(),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(snapshot) + "\n")
+
+
+def start_snapshot_writer(path: str, interval: float = 60.0) -> threading.Thread:
+    """Thread nen ghi snapshot moi interval giay"""
+    global _writer_thread
+    _writer_stop.clear()
+
+    def _loop():
+        while not _writer_stop.wait(interval):
+            try:
+                write_snapshot(path)
+            except Exception as e:
+                print(f"[PERF] WARNING: Cannot write snapshot: {e}")
+
+    _writer_thread = threading.Thread(target=_loop, name="perf-snapshot", daemon=True)
+    _writer_thread.start()
+    print(f"[PERF] Snapshots every {interval}s → {path}")
+    return _writer_thread
+
+
+def stop_snapshot_writer(path: Optional[str] = None) -> None:
+    """Dung thread ghi snapshot (co path → ghi them 1 snapshot cuoi)"""
+    _writer_stop.set()
+    if path:
+        write_snapshot(path)
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test timer + percentile"""
+    print("[TEST] Perf Stats\n")
+
+    @timed("sleep_fn")
+    def work(ms):
+        time.sleep(ms / 1000)
+
+    for i in range(50):
+        work(1 + i % 5)
+        with timer("block"):
+            time.sleep(0.002)
+    record("manual", 12.5)
+
+    print(format_summary())
+    print(f"\n[OK] Histogram 'manual': {get_histograms()['manual']['buckets'][:6]}")
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
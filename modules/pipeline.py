@@ -0,0 +1,317 @@
+"""
+Module: pipeline
+Chuc nang: Ha tang pipeline nhieu stage (moi stage 1 thread worker)
+    - PipelineQueue: queue gioi han (bounded) giua 2 stage + thong ke do sau
+    - Stage: thread lay item tu queue vao → xu ly → day sang queue ra
+      (stage nguon khong co queue vao: tu sinh item, VD poll camera)
+    - Pipeline: tao / start / stop cac stage, gom thong ke
+    - Queue day → stage truoc bi chan (backpressure), khong ton RAM vo han
+    - Event-driven: queue bao Event khi co item (notify), stage nguon cho Event
+      (wake_event) thay vi sleep co dinh → ranh thi ngu, co viec thi chay ngay
+
+Vi du (main.py):
+    ingest → [infer] → inference → [judge] → judgement → [persist] → persistence → [display] → GUI
+
+Khong phu thuoc module khac
+"""
+
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class PipelineQueue:
+    """Queue gioi han giua 2 stage, ghi lai do sau va thoi gian bi chan"""
+
+    def __init__(self, name: str, maxsize: int = 2,
+                 notify: Optional[threading.Event] = None):
+        """
+        Args:
+            name: Ten queue (hien thi trong thong ke)
+            maxsize: So item toi da dang cho (0 = khong gioi han)
+            notify: Event duoc set moi khi co item moi (ben lay item cho Event nay)
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.notify = notify
+        self._queue = queue.Queue(maxsize=maxsize)
+
+        # Thong ke
+        self.max_depth = 0
+        self.total_items = 0
+        self.blocked_time = 0.0   # Tong thoi gian stage truoc phai cho (queue day)
+
+    def put(self, item: Any, stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        Day item vao queue, cho neu queue day.
+
+        Returns:
+            bool: False neu pipeline dung truoc khi day duoc
+        """
+        start = time.time()
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+
+        self.blocked_time += time.time() - start
+        self.total_items += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        if self.notify is not None:
+            self.notify.set()
+        return True
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Lay item (raise queue.Empty neu het timeout)"""
+        return self._queue.get(timeout=timeout)
+
+    def get_nowait(self) -> Optional[Any]:
+        """Lay item neu co, khong co → None"""
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def depth(self) -> int:
+        """So item dang cho"""
+        return self._queue.qsize()
+
+    def get_stats(self) -> dict:
+        """Lay thong ke"""
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "total_items": self.total_items,
+            "blocked_time": round(self.blocked_time, 3),
+        }
+
+
+class Stage:
+    """
+    1 stage = 1 thread worker.
+
+    - Co input_queue: lay item → fn(item) → ket qua khac None day sang output_queue
+    - Khong co input_queue (stage nguon): goi fn() lien tuc,
+      fn() tra ve None (chua co gi) → nghi toi da idle_sleep giay
+      (co wake_event → duoc danh thuc ngay khi Event duoc set)
+    Loi trong fn() chi bo qua item do (in log), stage van chay tiep;
+    co on_error → on_error(item, loi) de ben goi giai phong tai nguyen cua item.
+    """
+
+    def __init__(self, name: str, fn: Callable,
+                 input_queue: Optional[PipelineQueue] = None,
+                 output_queue: Optional[PipelineQueue] = None,
+                 idle_sleep: float = 0.01,
+                 on_timing: Optional[Callable[[str, float], None]] = None,
+                 wake_event: Optional[threading.Event] = None,
+                 on_error: Optional[Callable[[Any, Exception], None]] = None):
+        self.name = name
+        self.fn = fn
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.idle_sleep = idle_sleep
+        self.wake_event = wake_event
+        self.on_timing = on_timing   # on_timing("stage_<name>", ms) sau moi item
+        self.on_error = on_error     # on_error(item, loi) khi fn(item) loi (item bi bo)
+        self._thread = None
+        self._stop_event = None
+
+        # Thong ke
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def start(self, stop_event: threading.Event) -> None:
+        """Khoi dong thread worker"""
+        self._stop_event = stop_event
+        self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_stats(self) -> dict:
+        """Lay thong ke"""
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "busy_time": round(self.busy_time, 3),
+            "avg_ms": round(self.busy_time / self.processed * 1000, 1) if self.processed else 0.0,
+        }
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            if self.input_queue is not None:
+                try:
+                    item = self.input_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                args = (item,)
+            else:
+                args = ()
+
+            start = time.time()
+            try:
+                result = self.fn(*args)
+            except Exception as e:
+                self.errors += 1
+                print(f"[PIPELINE] ERROR in stage '{self.name}': {e}")
+                result = None
+                if self.on_error is not None and args:
+                    try:
+                        self.on_error(args[0], e)
+                    except Exception as cleanup_error:
+                        print(f"[PIPELINE] ERROR in stage '{self.name}' on_error: {cleanup_error}")
+
+            if result is None and self.input_queue is None:
+                self._idle()   # Stage nguon chua co item
+                continue
+
+            elapsed = time.time() - start
+            self.busy_time += elapsed
+            self.processed += 1
+            if self.on_timing is not None:
+                self.on_timing(f"stage_{self.name}", elapsed * 1000)
+            if result is not None and self.output_queue is not None:
+                self.output_queue.put(result, self._stop_event)
+
+    def _idle(self) -> None:
+        """Cho idle_sleep giay (hoac den khi wake_event / stop_event duoc set)"""
+        if self.wake_event is not None:
+            self.wake_event.wait(self.idle_sleep)
+            self.wake_event.clear()
+        else:
+            self._stop_event.wait(self.idle_sleep)
+
+
+class Pipeline:
+    """
+    Tap hop stage + queue.
+
+    Cach dung:
+        pipeline = Pipeline(queue_size=2)
+        q_in = pipeline.add_queue("infer")
+        pipeline.add_stage("ingest", poll_fn, output_queue=q_in)
+        pipeline.add_stage("inference", infer_fn, input_queue=q_in, output_queue=q_out)
+        pipeline.start()
+        ...
+        pipeline.stop()
+    """
+
+    def __init__(self, queue_size: int = 2,
+                 on_timing: Optional[Callable[[str, float], None]] = None):
+        """
+        Args:
+            queue_size: Kich thuoc mac dinh cua moi queue
+            on_timing: Callback (ten, ms) sau moi item cua moi stage (VD: perf_stats.record)
+        """
+        self.queue_size = queue_size
+        self.on_timing = on_timing
+        self.queues: Dict[str, PipelineQueue] = {}
+        self.stages: List[Stage] = []
+        self._stop_event = threading.Event()
+
+    def add_queue(self, name: str, maxsize: Optional[int] = None,
+                  notify: Optional[threading.Event] = None) -> PipelineQueue:
+        """Tao queue moi giua 2 stage (notify: xem PipelineQueue)"""
+        q = PipelineQueue(name, self.queue_size if maxsize is None else maxsize, notify)
+        self.queues[name] = q
+        return q
+
+    def add_stage(self, name: str, fn: Callable,
+                  input_queue: Optional[PipelineQueue] = None,
+                  output_queue: Optional[PipelineQueue] = None,
+                  idle_sleep: float = 0.01,
+                  wake_event: Optional[threading.Event] = None,
+                  on_error: Optional[Callable[[Any, Exception], None]] = None) -> Stage:
+        """Them stage (xem Stage)"""
+        stage = Stage(name, fn, input_queue, output_queue, idle_sleep=idle_sleep,
+                      on_timing=self.on_timing, wake_event=wake_event, on_error=on_error)
+        self.stages.append(stage)
+        return stage
+
+    def start(self) -> None:
+        """Khoi dong tat ca stage"""
+        self._stop_event.clear()
+        for stage in self.stages:
+            stage.start(self._stop_event)
+        print(f"[PIPELINE] Started: {' → '.join(stage.name for stage in self.stages)}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Dung tat ca stage (item dang cho trong queue bi bo)"""
+        self._stop_event.set()
+        for stage in self.stages:
+            if stage.wake_event is not None:
+                stage.wake_event.set()   # Stage nguon dang cho → thoat ngay
+        for stage in self.stages:
+            stage.join(timeout)
+        print("[PIPELINE] Stopped")
+
+    def is_alive(self) -> bool:
+        """True neu tat ca stage con chay"""
+        return all(stage.is_alive() for stage in self.stages)
+
+    def get_stats(self) -> dict:
+        """Thong ke: {"queues": {name: ...}, "stages": {name: ...}}"""
+        return {
+            "queues": {name: q.get_stats() for name, q in self.queues.items()},
+            "stages": {stage.name: stage.get_stats() for stage in self.stages},
+        }
+
+    def format_stats(self) -> str:
+        """1 dong tom tat do sau queue + thoi gian trung binh moi stage"""
+        queues = " ".join(f"{name}={q.depth()}/{q.max_depth}" for name, q in self.queues.items())
+        stages = " ".join(f"{stage.name}={stage.get_stats()['avg_ms']}ms" for stage in self.stages)
+        return f"queues(depth/max): {queues} | stages(avg): {stages}"
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test pipeline 3 stage: stage cham nhat quyet dinh throughput"""
+    print("[TEST] Pipeline\n")
+
+    counter = iter(range(10))
+
+    def source():
+        try:
+            return next(counter)
+        except StopIteration:
+            return None
+
+    def slow(x):
+        time.sleep(0.05)
+        return x * 2
+
+    results = []
+    pipeline = Pipeline(queue_size=2)
+    q1 = pipeline.add_queue("work")
+    q2 = pipeline.add_queue("done")
+    pipeline.add_stage("source", source, output_queue=q1)
+    pipeline.add_stage("slow", slow, input_queue=q1, output_queue=q2)
+    pipeline.add_stage("sink", results.append, input_queue=q2)
+
+    start = time.time()
+    pipeline.start()
+    while len(results) < 10:
+        time.sleep(0.01)
+    print(f"[OK] Results: {results} ({time.time() - start:.2f}s)")
+    print(f"[OK] {pipeline.format_stats()}")
+    pipeline.stop()
+
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,18 @@ Chuc nang: Hien thi ket qua detect len cua so GUI (OpenCV)
     - Header: batch info, product code, final result
     - Footer: thong ke OK/NG qua cac batch
     - Non-blocking: gui.show() goi cv2.waitKey() de GUI khong bi do
+    - headless=True: khong mo cua so, khong ve anh, chi dem thong ke (may chu khong man hinh)
 
 Khong phu thuoc module khac trong project.
-Chi import: cv2, numpy
+Chi import: cv2, numpy, perf_stats
 """
 
 import cv2
 import numpy as np
 from typing import Any, Dict, List, Tuple, Optional
 
+from modules.perf_stats import timed
+
 
 class ResultGUI:
     """
@@ -37,14 +40,16 @@ class ResultGUI:
     """
 
     def __init__(self, window_name: str = "VisionAI - ROI Result", 
-                 max_history: int = 10):
+                 max_history: int = 10, headless: bool = False):
         """
         Args:
             window_name: Ten cua so hien thi
             max_history: So batch luu lich su (hien thi o footer)
+            headless: Khong hien thi (chi giu thong ke OK/NG)
         """
         self.window_name = window_name
         self.max_history = max_history
+        self.headless = headless
         
         # Trang thai
         self.is_running = False
@@ -78,11 +83,15 @@ class ResultGUI:
     def start(self) -> None:
         """Tao cua so OpenCV"""
         self.is_running = True
+        if self.headless:
+            print("[GUI] Headless mode (no window)")
+            return
         cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
         cv2.resizeWindow(self.window_name, 1280, 720)
         print(f"[GUI] Window started: {self.window_name}")
         print(f"[GUI] Controls: Q = Quit | SPACE = Pause/Resume")
     
+    @timed("gui_update")
     def update(self, roi_items: List[Dict], final_status: str, 
                batch_info: Dict) -> None:
         """
@@ -101,7 +110,8 @@ class ResultGUI:
                     "compare_roi": (x1, y1, x2, y2),
                 }
             final_status: "OK" hoac "NG"
-            batch_info: {"batch_num": int, "product_code": str, "batch_time": float}
+            batch_info: {"batch_num": int, "product_code": str, "batch_time": float,
+                         "verdict_time": float (tuy chon)}
         """
         self._roi_items = roi_items
         self._final_status = final_status
@@ -115,7 +125,8 @@ class ResultGUI:
             self.total_ng += 1
         
         # Tao anh hien thi
-        self._display_image = self._create_display()
+        if not self.headless:
+            self._display_image = self._create_display()
     
     def show(self, wait_time: int = 30) -> Optional[str]:
         """
@@ -131,7 +142,7 @@ class ResultGUI:
             'resume' - Nhan SPACE (dang pause → chay lai)
             None     - Khong co gi
         """
-        if not self.is_running:
+        if not self.is_running or self.headless:
             return None
         
         # Tao anh hien thi
@@ -159,6 +170,8 @@ class ResultGUI:
     def close(self) -> None:
         """Dong cua so"""
         self.is_running = False
+        if self.headless:
+            return
         cv2.destroyAllWindows()
         print(f"[GUI] Window closed")
     
@@ -244,6 +257,9 @@ class ResultGUI:
         batch_time = self._batch_info.get("batch_time", 0)
         
         info_text = f"Batch #{batch_num} | Product: {product} | Time: {batch_time:.2f}s"
+        verdict_time = self._batch_info.get("verdict_time")
+        if verdict_time is not None:
+            info_text += f" | Verdict: {verdict_time * 1000:.0f}ms"
         cv2.putText(canvas, info_text, 
                     (160, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, self.COLOR_WHITE, 1)
     
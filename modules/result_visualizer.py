@@ -1,13 +1,15 @@
 """
 Module: result_visualizer
 Chuc nang: Ve bbox + ROI len anh de hien thi ket qua
-Khong phu thuoc: Chi import cv2 (opencv-python)
+Khong phu thuoc: Chi import cv2 (opencv-python), perf_stats
 """
 
 import cv2
 import os
 from typing import Dict, Tuple, Any, Optional
 
+from modules.perf_stats import timed
+
 
 def draw_roi(image: Any, roi: Tuple[int, int, int, int], 
              color: Tuple[int, int, int], thickness: int = 2, 
@@ -153,6 +155,7 @@ def draw_keypoints_and_angle(image: Any, detect_result: Dict[str, Any],
     cv2.putText(image, angle_text, (mid_x - 50, mid_y - 15), font, 0.5, color_line, 2)
 
 
+@timed("visualize")
 def visualize_detection_result(
     image: Any,
     roi_data: Dict[str, Any],
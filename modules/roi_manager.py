@@ -1,14 +1,37 @@
+import numpy as np
+
+from modules.perf_stats import timed
+
+
 def crop_roi(image, roi):
     x1, y1, x2, y2 = roi
     return image[y1:y2, x1:x2]
 
-def prepare_roi_data(image, rule):
+def pad_to_stride(image, stride, pad_value=114):
+    """
+    Pad phai/duoi de kich thuoc anh la boi so cua stride.
+    Goc (0, 0) khong doi → offset cua ROI giu nguyen.
+    """
+    h, w = image.shape[:2]
+    new_h = -(-h // stride) * stride
+    new_w = -(-w // stride) * stride
+    if new_h == h and new_w == w:
+        return image
+    padded = np.full((new_h, new_w) + image.shape[2:], pad_value, dtype=image.dtype)
+    padded[:h, :w] = image
+    return padded
+
+
+@timed("crop")
+def prepare_roi_data(image, rule, stride=0):
     detect_img = crop_roi(image, rule["detect_roi"])
+    infer_img = pad_to_stride(detect_img, stride) if stride and detect_img.size else detect_img
 
     return {
         "roi_id": rule["roi_id"],
         "camera": rule["camera"],
         "detect_image": detect_img,
+        "infer_image": infer_img,
         "compare_roi": rule["compare_roi"],
         "rule": rule
     }
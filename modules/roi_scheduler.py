@@ -0,0 +1,184 @@
+"""
+Module: roi_scheduler
+Chuc nang: Sap xep thu tu inference cho che do fail-fast
+    - Hoc tu cac batch truoc (EMA): ti le NG cua tung ROI + thoi gian cua tung lan goi model
+    - Lan goi model co xac suat NG / chi phi cao nhat chay truoc
+      → san pham loi bi loai voi it inference nhat
+    - Luu / doc thong ke ra file JSON (giu duoc sau khi khoi dong lai)
+
+Khong phu thuoc module khac
+"""
+
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class ROIScheduler:
+    """
+    Cach dung:
+        scheduler = ROIScheduler()
+        calls = scheduler.order("ABC123x", calls)     # calls tu prepare_batch_calls()
+        ...
+        scheduler.record_call("ABC123x", call, elapsed_ms)
+        scheduler.record_roi("ABC123x", "roi_001", passed)
+
+    Key thong ke gan voi product_code (roi_id co the trung giua cac product).
+    """
+
+    def __init__(self, alpha: float = 0.1, prior_ng_rate: float = 0.05,
+                 prior_cost_ms: float = 50.0):
+        """
+        Args:
+            alpha: He so EMA (lon → thich nghi nhanh, nho → on dinh)
+            prior_ng_rate: Ti le NG gia dinh cho ROI chua co du lieu
+            prior_cost_ms: Thoi gian gia dinh / crop cho lan goi chua co du lieu
+        """
+        self.alpha = alpha
+        self.prior_ng_rate = prior_ng_rate
+        self.prior_cost_ms = prior_cost_ms
+        self._ng_rate = {}     # "product|roi_id" -> {"rate": float, "samples": int}
+        self._cost_ms = {}     # "product|call_key" -> {"ms": float, "samples": int}
+        self._lock = threading.Lock()
+
+    # ==================================================================
+    # PUBLIC METHODS
+    # ==================================================================
+
+    def order(self, product_code: str, calls: List[Dict]) -> List[Dict]:
+        """
+        Sap xep lan goi model theo P(co it nhat 1 ROI NG) / chi phi, giam dan.
+        Cung diem → giu thu tu ban dau.
+        """
+        return sorted(calls, key=lambda call: -self.score(product_code, call))
+
+    def score(self, product_code: str, call: Dict) -> float:
+        """Xac suat NG tren 1 ms inference cua lan goi"""
+        p_ok = 1.0
+        with self._lock:
+            for roi_id in call_roi_ids(call):
+                stat = self._ng_rate.get(f"{product_code}|{roi_id}")
+                p_ok *= 1.0 - (stat["rate"] if stat else self.prior_ng_rate)
+            cost = self._cost_ms.get(f"{product_code}|{call_key(call)}")
+        cost_ms = cost["ms"] if cost else self.prior_cost_ms * len(call["jobs"])
+        return (1.0 - p_ok) / max(cost_ms, 0.1)
+
+    def record_call(self, product_code: str, call: Dict, elapsed_ms: float) -> None:
+        """Cap nhat thoi gian cua 1 lan goi model"""
+        self._update(self._cost_ms, f"{product_code}|{call_key(call)}", "ms", elapsed_ms)
+
+    def record_roi(self, product_code: str, roi_id: str, passed: bool) -> None:
+        """Cap nhat ti le NG cua 1 ROI"""
+        self._update(self._ng_rate, f"{product_code}|{roi_id}", "rate", 0.0 if passed else 1.0)
+
+    def get_stats(self) -> dict:
+        """Thong ke hien tai"""
+        with self._lock:
+            return {
+                "ng_rate": {k: dict(v) for k, v in self._ng_rate.items()},
+                "cost_ms": {k: dict(v) for k, v in self._cost_ms.items()},
+            }
+
+    def save(self, path: str) -> None:
+        """Luu thong ke ra file JSON (ghi file tam roi doi ten → khong hong file)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.get_stats(), f, indent=1)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Doc thong ke tu file JSON (khong co / loi file → bat dau tu dau)
+
+        Returns:
+            bool: True neu doc duoc
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with self._lock:
+                self._ng_rate = data.get("ng_rate", {})
+                self._cost_ms = data.get("cost_ms", {})
+            print(f"[SCHEDULER] Loaded stats: {len(self._ng_rate)} ROIs, {len(self._cost_ms)} calls")
+            return True
+        except Exception as e:
+            print(f"[SCHEDULER] WARNING: Cannot load {path}: {e}")
+            return False
+
+    # ==================================================================
+    # PRIVATE
+    # ==================================================================
+
+    def _update(self, table: Dict, key: str, field: str, value: float) -> None:
+        with self._lock:
+            stat = table.get(key)
+            if stat is None:
+                table[key] = {field: value, "samples": 1}
+            else:
+                stat[field] += self.alpha * (value - stat[field])
+                stat["samples"] += 1
+
+
+def call_key(call: Dict) -> str:
+    """Key on dinh giua cac batch cho 1 lan goi model"""
+    return f"{call['model_name']}|{call['iou']}|{call['max_det']}|{call['imgsz']}"
+
+
+def call_roi_ids(call: Dict) -> List[str]:
+    """roi_id cua tat ca rule trong 1 lan goi model"""
+    return [item["rule"]["roi_id"] for job in call["jobs"] for item in job["items"]]
+
+
+# ============================================================================
+# TEST
+# ============================================================================
+
+def main():
+    """Test: ROI hay NG + model nhanh duoc xep len dau (assert → loi neu sai)"""
+    import tempfile
+
+    print("[TEST] ROI Scheduler\n")
+
+    def make_call(model_name, roi_ids):
+        return {"model_name": model_name, "iou": None, "max_det": None, "imgsz": None,
+                "jobs": [{"items": [{"rule": {"roi_id": r}} for r in roi_ids]}]}
+
+    calls = [make_call("MarkF", ["roi_001", "roi_002"]), make_call("MarkG", ["roi_003"])]
+    scheduler = ROIScheduler(alpha=0.5)
+    initial = [c["model_name"] for c in scheduler.order("P", calls)]
+    assert initial == ["MarkF", "MarkG"], initial   # Chua co du lieu: nhieu ROI → P(NG) cao hon
+    print(f"[OK] Initial order: {initial}")
+
+    for _ in range(5):
+        scheduler.record_call("P", calls[0], 80.0)
+        scheduler.record_call("P", calls[1], 20.0)
+        scheduler.record_roi("P", "roi_001", True)
+        scheduler.record_roi("P", "roi_002", True)
+        scheduler.record_roi("P", "roi_003", False)
+
+    learned = [c["model_name"] for c in scheduler.order("P", calls)]
+    assert learned == ["MarkG", "MarkF"], learned   # roi_003 luon NG + MarkG nhanh hon
+    assert [c["model_name"] for c in scheduler.order("Q", calls)] == initial   # Product khac: chua hoc
+    stats = scheduler.get_stats()
+    assert stats["ng_rate"]["P|roi_003"] == {"rate": 1.0, "samples": 5}, stats
+    assert stats["cost_ms"]["P|MarkG|None|None|None"]["ms"] == 20.0, stats
+    print(f"[OK] Learned order: {learned}")
+
+    path = os.path.join(tempfile.mkdtemp(), "scheduler.json")
+    scheduler.save(path)
+    restored = ROIScheduler(alpha=0.5)
+    assert restored.load(path)
+    assert [c["model_name"] for c in restored.order("P", calls)] == learned
+    assert not ROIScheduler().load(path + ".missing")
+    os.remove(path)
+    print("[OK] Save / load keeps learned order")
+
+    print("\n[DONE] Tests completed!")
+
+
+if __name__ == "__main__":
+    main()
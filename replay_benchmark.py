@@ -0,0 +1,312 @@
+"""
+Replay benchmark: chay lai bo anh da ghi (offline) qua dung duong xu ly cua main.py
+    - Load rule product → crop → detect → compare → aggregate (khong ImageWatcher,
+      khong GUI / cv2.waitKey, khong COM) → do throughput toi da
+    - Cung cau hinh inference voi main.py: stride_align / auto_imgsz, inference_pool
+      (process pool), fail_fast (thu tu ROIScheduler, ROI con lai skip / background)
+    - Bao cao: parts/sec, p50/p95/p99 tung stage (perf_stats)
+    - So sanh ket qua tung part / tung ROI voi baseline da luu (truoc khi rollout
+      model moi / doi config)
+
+Cau truc thu muc anh:
+    recorded/
+        CAM1/  part_0001.jpg  part_0002.jpg ...
+        CAM2/  part_0001.jpg  part_0002.jpg ...
+    → Part thu i = anh thu i (theo ten file) cua moi camera
+
+Cach dung:
+    python replay_benchmark.py --product ABC123x --images recorded/ --save-baseline baseline.json
+    python replay_benchmark.py --product ABC123x --images recorded/ --baseline baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.config_loader import load_config
+from modules.csv_loader import load_product_csv
+from modules.camera_selector import get_used_cameras
+from modules.model_manager import preload_models, configure_cache, configure_backend, set_active_models
+from modules.model_manager import set_inference_pool
+from modules.inference_pool import InferencePool
+from modules.batch_detector import run_batch_detection, build_inference_plan, print_inference_plan
+from modules.roi_scheduler import ROIScheduler
+from modules.inspection import judge_detections, detect_fail_fast
+from modules.image_watcher import decode_image
+from modules import perf_stats
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def collect_parts(images_dir: str, used_cameras: list) -> list:
+    """
+    Ghep anh cac camera thanh tung part (theo thu tu ten file).
+
+    Args:
+        images_dir: Thu muc chua 1 thu muc con / camera
+        used_cameras: Camera can cho product
+
+    Returns:
+        list: [{"name": ten file cua camera dau, "paths": {"CAM1": path, ...}}, ...]
+
+    Raises:
+        FileNotFoundError: Thieu thu muc cua 1 camera
+    """
+    files = {}
+    for cam in used_cameras:
+        cam_dir = os.path.join(images_dir, cam)
+        if not os.path.isdir(cam_dir):
+            raise FileNotFoundError(f"Missing recorded images for {cam}: {cam_dir}")
+        files[cam] = sorted(
+            name for name in os.listdir(cam_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+    num_parts = min(len(names) for names in files.values())
+    if any(len(names) != num_parts for names in files.values()):
+        counts = {cam: len(names) for cam, names in files.items()}
+        print(f"[REPLAY] WARNING: Camera image counts differ {counts} → using {num_parts} parts")
+
+    return [
+        {
+            "name": files[used_cameras[0]][i],
+            "paths": {cam: os.path.join(images_dir, cam, files[cam][i]) for cam in used_cameras},
+        }
+        for i in range(num_parts)
+    ]
+
+
+def replay_part(part_num: int, part: dict, roi_rules: list, used_cameras: list,
+                inference_plan: dict, infer_executor=None, judge_executor=None,
+                infer_options: dict = None, fail_fast: dict = None) -> dict:
+    """
+    Xu ly 1 part giong 1 batch cua main.py (doc byte + imdecode → detect → compare → aggregate).
+
+    Args:
+        infer_options: {"stride_align", "auto_imgsz"} (inference.* trong config)
+        fail_fast: None (tat) hoac {"scheduler", "product_code", "remaining"}
+
+    Returns:
+        dict: {"part", "final_status", "rois": {roi_id: {"pass", "reason"}}, "time_ms"}
+    """
+    start = time.perf_counter()
+    images = {}
+    for cam, path in part["paths"].items():
+        with perf_stats.timer("imread"):
+            with open(path, "rb") as f:
+                image = decode_image(f.read())
+        if image is None:
+            raise ValueError(f"Cannot read image: {path}")
+        images[cam] = image
+
+    infer_options = infer_options or {}
+    with perf_stats.timer("stage_inference"):
+        if fail_fast is not None:
+            def on_ng(reason):
+                perf_stats.record("batch_verdict", (time.perf_counter() - start) * 1000)
+            detections = detect_fail_fast(images, roi_rules, used_cameras, inference_plan,
+                                          scheduler=fail_fast["scheduler"],
+                                          product_code=fail_fast["product_code"],
+                                          remaining=fail_fast["remaining"],
+                                          on_ng=on_ng, **infer_options)
+        else:
+            detections = run_batch_detection(images, roi_rules, used_cameras,
+                                             plan=inference_plan, executor=infer_executor,
+                                             **infer_options)
+    with perf_stats.timer("stage_judgement"):
+        judged = judge_detections(part_num, images, detections, used_cameras, judge_executor)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    perf_stats.record("batch_total", elapsed_ms)
+    return {
+        "part": part["name"],
+        "final_status": judged["final_status"],
+        "rois": {r["roi_id"]: {"pass": r["pass"], "reason": r["reason"]} for r in judged["roi_results"]},
+        "time_ms": round(elapsed_ms, 2),
+    }
+
+
+def diff_results(results: list, baseline: dict) -> list:
+    """
+    So sanh ket qua voi baseline (theo ten part).
+
+    Returns:
+        list: Cac dong mo ta khac biet (rong = giong het)
+    """
+    base_parts = {p["part"]: p for p in baseline.get("parts", [])}
+    diffs = []
+    for result in results:
+        base = base_parts.pop(result["part"], None)
+        if base is None:
+            diffs.append(f"{result['part']}: not in baseline")
+            continue
+        if result["final_status"] != base["final_status"]:
+            diffs.append(f"{result['part']}: {base['final_status']} → {result['final_status']}")
+        for roi_id in sorted(set(result["rois"]) | set(base["rois"])):
+            new, old = result["rois"].get(roi_id), base["rois"].get(roi_id)
+            if new != old:
+                old_str = f"{'OK' if old['pass'] else 'NG'} ({old['reason']})" if old else "-"
+                new_str = f"{'OK' if new['pass'] else 'NG'} ({new['reason']})" if new else "-"
+                diffs.append(f"{result['part']} {roi_id}: {old_str} → {new_str}")
+    for name in base_parts:
+        diffs.append(f"{name}: missing in replay")
+    return diffs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline replay benchmark over recorded images")
+    parser.add_argument("--product", required=True, help="Product code (VD: ABC123x)")
+    parser.add_argument("--images", required=True, help="Thu muc anh da ghi (1 thu muc con / camera)")
+    parser.add_argument("--config", default="config/config.yaml", help="File config")
+    parser.add_argument("--backend", default=None, help="Ghi de inference.backend (ultralytics/onnx/fake)")
+    parser.add_argument("--camera-workers", type=int, default=None,
+                        help="Ghi de parallel.camera_workers")
+    parser.add_argument("--repeat", type=int, default=1, help="Chay lai bo anh N lan")
+    parser.add_argument("--limit", type=int, default=0, help="Chi chay N part dau (0 = tat ca)")
+    parser.add_argument("--baseline", default=None, help="So sanh ket qua voi file baseline JSON")
+    parser.add_argument("--save-baseline", default=None, help="Luu ket qua lam baseline JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """
+    Returns:
+        int: 0 = OK, 1 = ket qua khac baseline
+    """
+    args = parse_args(argv)
+    cfg = load_config(args.config)
+    inference_cfg = dict(cfg.get('inference', {}))
+    if args.backend:
+        inference_cfg['backend'] = args.backend
+    camera_workers = args.camera_workers or cfg.get('parallel', {}).get('camera_workers', 3)
+    model_cache_cfg = cfg.get('model_cache', {})
+    pool_cfg = cfg.get('inference_pool', {})
+    fail_fast_cfg = cfg.get('fail_fast', {})
+    infer_options = {
+        "stride_align": inference_cfg.get('stride_align', True),
+        "auto_imgsz": inference_cfg.get('auto_imgsz', False),
+    }
+
+    # Rule product (giong main.py)
+    csv_path = cfg['product']['csv_path'].format(code=args.product)
+    roi_rules = load_product_csv(csv_path)
+    used_cameras = get_used_cameras(roi_rules)
+    inference_plan = build_inference_plan(roi_rules)
+    print_inference_plan(inference_plan)
+
+    parts = collect_parts(args.images, used_cameras)
+    if args.limit:
+        parts = parts[:args.limit]
+    if not parts:
+        print(f"[REPLAY] ERROR: No recorded images in {args.images}")
+        return 1
+
+    configure_backend(backend=inference_cfg.get('backend', 'ultralytics'), engine_options=inference_cfg)
+    configure_cache(
+        max_entries=model_cache_cfg.get('max_entries', 0),
+        max_memory_mb=model_cache_cfg.get('max_memory_mb', 0)
+    )
+    set_active_models([r["model_name"] for r in roi_rules])
+
+    # Process pool (giong main.py): model load trong worker, crop gui qua shared memory
+    infer_executor = judge_executor = inference_pool = None
+    if pool_cfg.get('enabled', False):
+        inference_pool = InferencePool(
+            num_workers=pool_cfg.get('workers', 2),
+            threads_per_worker=pool_cfg.get('threads_per_worker', 2),
+            model_assignment=pool_cfg.get('model_assignment') or {},
+            backend=inference_cfg.get('backend', 'ultralytics'),
+            engine_options=inference_cfg,
+            request_timeout=pool_cfg.get('request_timeout', 30)
+        )
+        inference_pool.start()
+        set_inference_pool(inference_pool)
+        infer_executor = ThreadPoolExecutor(max_workers=inference_pool.num_workers, thread_name_prefix="infer-call")
+    elif camera_workers > 1:
+        infer_executor = ThreadPoolExecutor(max_workers=camera_workers, thread_name_prefix="infer-call")
+    if camera_workers > 1:
+        judge_executor = ThreadPoolExecutor(max_workers=camera_workers, thread_name_prefix="judge-cam")
+
+    # Fail-fast (giong main.py): doc thong ke ROI da hoc, khong ghi lai (khong lam sai thong ke cua line)
+    fail_fast = None
+    if fail_fast_cfg.get('enabled', False):
+        scheduler = ROIScheduler(alpha=fail_fast_cfg.get('ema_alpha', 0.1))
+        if fail_fast_cfg.get('state_file'):
+            scheduler.load(fail_fast_cfg['state_file'])
+        fail_fast = {"scheduler": scheduler, "product_code": args.product,
+                     "remaining": fail_fast_cfg.get('remaining', 'skip')}
+
+    # Load + warm-up truoc khi bam gio (khong tinh thoi gian load model)
+    preload_models(roi_rules, warmup=inference_cfg.get('warmup', True), background=False, **infer_options)
+
+    perf_stats.configure(enabled=True, window=cfg.get('perf_stats', {}).get('window', 2000))
+    perf_stats.reset()
+    print(f"[REPLAY] {len(parts)} parts x {args.repeat} from {args.images} "
+          f"(cameras: {used_cameras}, camera_workers: {camera_workers}, "
+          f"pool: {inference_pool is not None}, fail_fast: {fail_fast is not None}, {infer_options})")
+
+    results = []
+    start = time.perf_counter()
+    try:
+        for _ in range(args.repeat):
+            results = []
+            for part_num, part in enumerate(parts, 1):
+                results.append(replay_part(part_num, part, roi_rules, used_cameras, inference_plan,
+                                           infer_executor, judge_executor, infer_options, fail_fast))
+    finally:
+        for executor in (infer_executor, judge_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        if inference_pool is not None:
+            set_inference_pool(None)
+            inference_pool.stop()
+    elapsed = time.perf_counter() - start
+
+    # Bao cao throughput + latency
+    total_parts = len(parts) * args.repeat
+    num_ng = sum(1 for r in results if r["final_status"] != "OK")
+    print("\n" + "="*70)
+    print(f"[REPLAY] Parts: {total_parts} in {elapsed:.2f}s → {total_parts / elapsed:.2f} parts/sec")
+    print(f"[REPLAY] Last pass: OK={len(results) - num_ng} NG={num_ng}")
+    print("="*70)
+    print(perf_stats.format_summary())
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        diffs = diff_results(results, baseline)
+        if diffs:
+            print(f"\n[REPLAY] {len(diffs)} differences vs baseline {args.baseline}:")
+            for line in diffs:
+                print(f"  {line}")
+            exit_code = 1
+        else:
+            print(f"\n[REPLAY] Results identical to baseline {args.baseline}")
+        base_rate = baseline.get("parts_per_sec")
+        if base_rate:
+            print(f"[REPLAY] Throughput: {total_parts / elapsed:.2f} vs baseline {base_rate:.2f} parts/sec "
+                  f"({(total_parts / elapsed / base_rate - 1) * 100:+.1f}%)")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "product": args.product,
+                "backend": inference_cfg.get('backend', 'ultralytics'),
+                "inference": dict(infer_options, pool=inference_pool is not None,
+                                  fail_fast=fail_fast["remaining"] if fail_fast else None),
+                "parts_per_sec": round(total_parts / elapsed, 3),
+                "stages": perf_stats.get_summary(),
+                "parts": results,
+            }, f, indent=1)
+        print(f"[REPLAY] Baseline saved: {args.save_baseline}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())